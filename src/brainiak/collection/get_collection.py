@@ -4,9 +4,11 @@ from urllib import unquote
 from tornado.web import HTTPError
 
 from brainiak import settings, triplestore
+from brainiak.greenlet_tornado import greenlet_run_many
 from brainiak.prefixes import shorten_uri, expand_uri
 from brainiak.schema import get_class
 from brainiak.type_mapper import MAP_RDF_EXPANDED_TYPE_TO_PYTHON as rdf_to_type
+from brainiak.utils.cache import build_key_for_class_existence, memoize_existence
 from brainiak.utils.links import build_schema_url_for_instance, remove_last_slash, build_class_url
 from brainiak.utils.resources import decorate_with_resource_id, decorate_dict_with_pagination, calculate_offset
 from brainiak.utils.sparql import compress_keys_and_values, is_literal, is_url, normalize_term, get_one_value, \
@@ -220,13 +222,17 @@ class Query(object):
 
 def query_filter_instances(query_params):
     query = Query(query_params).to_string()
-    query_response = triplestore.query_sparql(query, query_params.triplestore_config)
+    query_response = triplestore.query_sparql(query, query_params.triplestore_config, stream=True,
+                                              result_format=triplestore.TSV_RESPONSE_FORMAT,
+                                              family="collection.page")
     return query_response
 
 
 def query_count_filter_instances(query_params):
     query = Query(query_params).to_string(count=True)
-    query_response = triplestore.query_sparql(query, query_params.triplestore_config)
+    query_response = triplestore.query_sparql(query, query_params.triplestore_config,
+                                              result_format=triplestore.TSV_RESPONSE_FORMAT,
+                                              family="collection.count")
     return query_response
 
 
@@ -260,7 +266,16 @@ def merge_by_id(items_list):
 
 
 def filter_instances(query_params):
-    if not class_exists(query_params):
+    class_existence_key = build_key_for_class_existence(query_params["graph_uri"], query_params["class_uri"])
+    queries = [lambda: memoize_existence(class_existence_key, class_exists, query_params),
+               lambda: query_filter_instances(query_params)]
+    if query_params.get("do_item_count", None) == "1":
+        queries.append(lambda: query_count_filter_instances(query_params))
+    results = greenlet_run_many(queries)
+    found_class, result_dict = results[:2]
+    count_result_dict = results[2] if len(results) > 2 else None
+
+    if not found_class:
         error_message = u"Class {0} in graph {1} does not exist".format(
             query_params["class_uri"], query_params["graph_uri"])
         raise HTTPError(404, log_message=error_message)
@@ -273,14 +288,15 @@ def filter_instances(query_params):
     for p, o, index in extract_po_tuples(query_params):
         keymap[o[1:]] = shorten_uri(p)
 
-    result_dict = query_filter_instances(query_params)
-    if not result_dict or not result_dict['results']['bindings']:
+    if not result_dict:
         return None
 
     items_list = compress_keys_and_values(result_dict,
                                           keymap=keymap,
                                           ignore_keys=["total"],
                                           do_expand_uri=query_params['expand_uri'] == u"1")
+    if not items_list:
+        return None
 
     items_list = merge_by_id(items_list)
     for item in items_list:
@@ -289,7 +305,7 @@ def filter_instances(query_params):
         item["class_prefix"] = expand_uri(query_params['class_prefix'])
 
     decorate_with_resource_id(items_list)
-    return build_json(items_list, query_params)
+    return build_json(items_list, query_params, count_result_dict)
 
 
 def cast_item(item, property_to_type):
@@ -360,7 +376,7 @@ def cast_items_values(items_list, class_properties):
     return new_list
 
 
-def build_json(items_list, query_params):
+def build_json(items_list, query_params, count_result_dict=None):
     class_url = build_class_url(query_params)
     schema_url = unquote(build_schema_url_for_instance(query_params, class_url))
 
@@ -378,7 +394,7 @@ def build_json(items_list, query_params):
     }
 
     def calculate_total_items():
-        result_dict = query_count_filter_instances(query_params)
+        result_dict = count_result_dict or query_count_filter_instances(query_params)
         total_items = int(get_one_value(result_dict, 'total'))
         return total_items
 
@@ -396,5 +412,5 @@ ASK {
 
 def class_exists(query_params):
     query = QUERY_CLASS_EXISTS % query_params
-    query_result = triplestore.query_sparql(query, query_params.triplestore_config)
+    query_result = triplestore.query_sparql(query, query_params.triplestore_config, family="collection.class_exists")
     return is_result_true(query_result)
@@ -2,6 +2,8 @@ from tornado.web import HTTPError
 
 from brainiak import settings
 from brainiak import triplestore
+from brainiak.greenlet_tornado import greenlet_run_many
+from brainiak.utils.cache import build_key_for_graph_existence, memoize_existence
 from brainiak.utils.links import remove_last_slash
 from brainiak.utils.resources import decorate_with_class_prefix, decorate_with_resource_id, decorate_dict_with_pagination
 from brainiak.utils.sparql import add_language_support, compress_keys_and_values, get_one_value, is_result_true
@@ -12,10 +14,19 @@ from brainiak.prefixes import MemorizeContext
 def list_classes(query_params):
     params = dict(**query_params)
     (params, language_tag) = add_language_support(query_params, "label")
-    if not graph_exists(params):
+
+    graph_existence_key = build_key_for_graph_existence(params["graph_uri"])
+    queries = [lambda: memoize_existence(graph_existence_key, graph_exists, params),
+               lambda: query_classes_list(params)]
+    if params.get("do_item_count", None) == "1":
+        queries.append(lambda: query_count_classes(params))
+    results = greenlet_run_many(queries)
+    graph_found, query_result_dict = results[:2]
+    count_query_result_dict = results[2] if len(results) > 2 else None
+
+    if not graph_found:
         raise HTTPError(404, log_message=u"Graph {0} does not exist".format(query_params["graph_uri"]))
 
-    query_result_dict = query_classes_list(params)
     if not query_result_dict or not query_result_dict['results']['bindings']:
         json = {
             "items": [],
@@ -23,10 +34,10 @@ def list_classes(query_params):
                 params["graph_uri"], int(params["page"]) + 1)
         }
         return json
-    return assemble_list_json(params, query_result_dict)
+    return assemble_list_json(params, query_result_dict, count_query_result_dict)
 
 
-def assemble_list_json(query_params, query_result_dict):
+def assemble_list_json(query_params, query_result_dict, count_query_result_dict=None):
     context = MemorizeContext()
     should_expand_uri = bool(int(query_params.get('expand_uri', settings.DEFAULT_URI_EXPANSION)))
     items_list = compress_keys_and_values(
@@ -49,8 +60,8 @@ def assemble_list_json(query_params, query_result_dict):
     }
 
     def calculate_total_items():
-        count_query_result_dict = query_count_classes(query_params)
-        total_items = int(get_one_value(count_query_result_dict, "total_items"))
+        count_result_dict = count_query_result_dict or query_count_classes(query_params)
+        total_items = int(get_one_value(count_result_dict, "total_items"))
         return total_items
     decorate_dict_with_pagination(json_dict, query_params, calculate_total_items)
 
@@ -69,7 +80,7 @@ FROM <%(graph_uri)s>
 
 def query_count_classes(query_params):
     query = QUERY_COUNT_ALL_CLASSES_OF_A_GRAPH % query_params
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="context.count_classes")
 
 
 QUERY_ALL_CLASSES_OF_A_GRAPH = u"""
@@ -90,7 +101,9 @@ def query_classes_list(query_params):
     query_params['offset'] = offset
     query = QUERY_ALL_CLASSES_OF_A_GRAPH % query_params
     del query_params['offset']
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config,
+                                    result_format=triplestore.TSV_RESPONSE_FORMAT,
+                                    family="context.classes")
 
 
 QUERY_GRAPH_EXISTS = u"""
@@ -102,5 +115,5 @@ ASK {
 
 def graph_exists(query_params):
     query = QUERY_GRAPH_EXISTS % query_params
-    query_result = triplestore.query_sparql(query, query_params.triplestore_config)
+    query_result = triplestore.query_sparql(query, query_params.triplestore_config, family="context.graph_exists")
     return is_result_true(query_result)
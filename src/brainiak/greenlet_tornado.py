@@ -33,6 +33,9 @@ This allows you to write code as if it were synchronous, and not worry about cal
 You also don't have to use any special patterns, such as writing everything as a generator.
 """
 
+import sys
+import time
+
 import greenlet
 import tornado.httpclient
 from tornado.ioloop import IOLoop
@@ -56,7 +59,26 @@ def greenlet_set_ioloop(io_loop=None):
         _io_loop = io_loop
 
 
-def greenlet_fetch(request, **kwargs):
+def greenlet_get_ioloop():
+    """
+    Return the IOLoop used by the greenlet helpers: the one defined by
+    greenlet_set_ioloop() or, if none was set, the current IOLoop.
+    """
+    if _io_loop is None:
+        return IOLoop.current()
+    return _io_loop
+
+
+def greenlet_available():
+    """
+    Return True if the caller is running (possibly indirectly) inside a method wrapped
+    by the greenlet_asynchronous decorator, where greenlet_fetch() can be used.
+    Outside it (e.g. while the server is starting up) blocking calls must be used instead.
+    """
+    return greenlet.getcurrent().parent is not None
+
+
+def greenlet_fetch(request, http_client=None, **kwargs):
     """
     Uses the tornado AsyncHTTPClient to execute a request, but blocks until the request
     is complete, yet still allows the tornado IOLoop to do other things in the meantime.
@@ -66,6 +88,7 @@ def greenlet_fetch(request, **kwargs):
 
     The request arg may be either a string URL or an HTTPRequest object.
     If it is a string, any additional kwargs will be passed directly to AsyncHTTPClient.fetch().
+    If http_client is given, it is used instead of the AsyncHTTPClient shared by the IOLoop.
 
     Returns an HTTPResponse object, or raises a tornado.httpclient.HTTPError exception
     on error (such as a timeout).
@@ -75,7 +98,8 @@ def greenlet_fetch(request, **kwargs):
 
     def callback(response):
         gr.switch(response)
-    http_client = tornado.httpclient.AsyncHTTPClient(io_loop=_io_loop)
+    if http_client is None:
+        http_client = tornado.httpclient.AsyncHTTPClient(io_loop=_io_loop)
     http_client.fetch(request, callback, **kwargs)
 
     # Now, yield control back to the master greenlet, and wait for data to be sent to us.
@@ -86,6 +110,162 @@ def greenlet_fetch(request, **kwargs):
     return response
 
 
+def greenlet_run_many(functions):
+    """
+    Call all functions at the same time, each one in its own greenlet, so that the
+    requests they make (e.g. using greenlet_fetch) are executed concurrently.
+
+    Blocks until all functions have returned, yet still allows the tornado IOLoop to
+    do other things in the meantime, or until the first of them raises an exception,
+    which is then raised to the caller. Results of the remaining functions are discarded.
+
+    Returns a list with the values returned by each function, in the same order.
+
+    When called outside a method wrapped by the greenlet_asynchronous decorator,
+    the functions are called one after the other.
+    """
+    if not greenlet_available():
+        return [function() for function in functions]
+    if not functions:
+        return []
+
+    gr = greenlet.getcurrent()
+    io_loop = greenlet_get_ioloop()
+    results = [None] * len(functions)
+    state = {"pending": len(functions), "finished": False}
+
+    def finish(outcome):
+        if not state["finished"]:
+            state["finished"] = True
+            io_loop.add_callback(gr.switch, outcome)
+
+    def run(index, function):
+        try:
+            results[index] = function()
+        except:
+            finish((True, sys.exc_info()))
+        else:
+            state["pending"] -= 1
+            if not state["pending"]:
+                finish((False, results))
+
+    for index, function in enumerate(functions):
+        child = greenlet.greenlet(run, parent=gr.parent)
+        io_loop.add_callback(child.switch, index, function)
+
+    # Yield control back to the master greenlet, and wait for all the functions to return.
+    failed, outcome = gr.parent.switch()
+    if failed:
+        exception_type, exception, traceback = outcome
+        raise exception_type, exception, traceback
+    return outcome
+
+
+def greenlet_fetch_many(requests, http_client=None, **kwargs):
+    """
+    Execute all requests concurrently with greenlet_fetch(), blocking until all of them are
+    complete (or the first has failed), and return the list of their HTTPResponse objects.
+    """
+    functions = [lambda request=request: greenlet_fetch(request, http_client, **kwargs)
+                 for request in requests]
+    return greenlet_run_many(functions)
+
+
+def greenlet_hedge(function, hedge_function, delay, should_hedge=None):
+    """
+    Call function in its own greenlet and, if it has not returned after delay seconds
+    (or if it has failed before that), call hedge_function concurrently, in another greenlet.
+
+    If given, should_hedge receives the exception raised by function, and tells whether
+    hedge_function could succeed where it failed (e.g. it could not for an invalid request):
+    if it returns False, the exception is raised to the caller right away, without hedging.
+
+    Both functions receive as argument a function that returns True once the other
+    one has won, so they can abandon what they are doing (e.g. abort their requests).
+
+    Blocks until the first of them returns, yet still allows the tornado IOLoop to do
+    other things in the meantime. Returns a tuple with the index of the function that
+    returned first (0 for function, 1 for hedge_function) and its result.
+    If both fail, the exception raised by function is raised to the caller.
+
+    When called outside a method wrapped by the greenlet_asynchronous decorator,
+    only function is called.
+    """
+    if not greenlet_available():
+        return 0, function(lambda: False)
+
+    gr = greenlet.getcurrent()
+    io_loop = greenlet_get_ioloop()
+    state = {"winner": None, "running": 0, "hedged": False, "timeout": None, "errors": {}}
+
+    def run(index, function):
+        is_cancelled = lambda: state["winner"] not in (None, index)
+        try:
+            result = function(is_cancelled)
+        except:
+            error = sys.exc_info()
+            state["errors"][index] = error
+            state["running"] -= 1
+            if state["winner"] is not None:
+                return
+            if index == 0 and should_hedge is not None and not should_hedge(error[1]):
+                # hedge_function would fail as well: it is not started (or cancelled, if running)
+                state["winner"] = index
+                if state["timeout"] is not None:
+                    io_loop.remove_timeout(state["timeout"])
+                    state["timeout"] = None
+                io_loop.add_callback(gr.switch, (True, error))
+            elif not state["hedged"]:
+                start_hedge()
+            elif not state["running"]:
+                error = state["errors"].get(0) or state["errors"][1]
+                io_loop.add_callback(gr.switch, (True, error))
+        else:
+            state["running"] -= 1
+            if state["winner"] is None:
+                state["winner"] = index
+                if state["timeout"] is not None:
+                    io_loop.remove_timeout(state["timeout"])
+                io_loop.add_callback(gr.switch, (False, (index, result)))
+
+    def start(index, function):
+        state["running"] += 1
+        child = greenlet.greenlet(run, parent=gr.parent)
+        io_loop.add_callback(child.switch, index, function)
+
+    def start_hedge():
+        if state["timeout"] is not None:
+            io_loop.remove_timeout(state["timeout"])
+            state["timeout"] = None
+        if not state["hedged"] and state["winner"] is None:
+            state["hedged"] = True
+            start(1, hedge_function)
+
+    start(0, function)
+    state["timeout"] = io_loop.add_timeout(time.time() + delay, start_hedge)
+
+    # Yield control back to the master greenlet, and wait for the first function to return.
+    failed, outcome = gr.parent.switch()
+    if failed:
+        exception_type, exception, traceback = outcome
+        raise exception_type, exception, traceback
+    return outcome
+
+
+def greenlet_sleep(seconds):
+    """
+    Pause the current greenlet for the given number of seconds, while the tornado IOLoop
+    keeps doing other things. Outside a method wrapped by the greenlet_asynchronous decorator,
+    the whole thread sleeps.
+    """
+    if not greenlet_available():
+        time.sleep(seconds)
+        return
+    gr = greenlet.getcurrent()
+    greenlet_get_ioloop().add_timeout(time.time() + seconds, gr.switch)
+    gr.parent.switch()
+
+
 def greenlet_asynchronous(wrapped_method):
     """
     Decorator that allows you to make async calls as if they were synchronous, by pausing the callstack and resuming it later.
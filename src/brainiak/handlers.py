@@ -4,6 +4,7 @@
 import sys
 import traceback
 from contextlib import contextmanager
+from email.utils import mktime_tz, parsedate_tz
 
 import ujson as json
 from urllib import unquote
@@ -41,7 +42,7 @@ from brainiak.stored_query.json_schema import query_crud_schema
 from brainiak.suggest.json_schema import SUGGEST_PARAM_SCHEMA
 from brainiak.suggest.suggest import do_suggest
 from brainiak.utils import cache
-from brainiak.utils.cache import memoize, build_instance_key
+from brainiak.utils.cache import memoize, build_instance_key, build_key_for_collection
 from brainiak.utils.i18n import _
 from brainiak.utils.json import validate_json_schema, get_json_request_as_dict
 from brainiak.utils.links import build_schema_url_for_instance, content_type_profile, build_schema_url, build_class_url
@@ -84,6 +85,21 @@ def safe_params(valid_params=None, body_params=None):
         raise HTTPError(400, log_message=unicode(msg))
 
 
+def purge_written_instance(query_params):
+    """
+    Purge the cache of an instance which was written, including the collections of the superclasses
+    of its class, which list it too (see cache.purge_written_instance)
+    """
+    superclasses = []
+    if settings.ENABLE_CACHE:
+        try:
+            superclasses = schema_resource.query_superclasses(query_params)
+        except Exception:
+            logger.error(_(u"Failed to query the superclasses of {0}: {1}").format(
+                query_params["class_uri"], traceback.format_exc()))
+    cache.purge_written_instance(query_params, superclasses)
+
+
 class BrainiakRequestHandler(CorsMixin, RequestHandler):
 
     CORS_ORIGIN = '*'
@@ -164,11 +180,34 @@ class BrainiakRequestHandler(CorsMixin, RequestHandler):
             logger.error(_(u"Uncaught exception: {0}\n").format(error_message), exc_info=True)
             self.send_error(status_code, exc_info=sys.exc_info())
 
-    def add_cache_headers(self, meta):
+    def add_cache_headers(self, meta, shortened=False):
+        """
+        Set the headers describing a memoized response. If its URIs are shortened before being written,
+        its ETag is told apart from the one of the response as it was cached.
+        """
         cache_verb = meta['cache']
         cache_msg = u"{0} from {1}".format(cache_verb, self.request.host)
+        if meta.get('cache_tier'):
+            cache_msg += u" ({0})".format(meta['cache_tier'])
         self.set_header("X-Cache", cache_msg)
         self.set_header("Last-Modified", meta['last_modified'])
+        if meta.get('etag'):
+            self.set_header("Etag", meta['etag'][:-1] + '-shortened"' if shortened else meta['etag'])
+
+    def not_modified(self, meta):
+        """
+        Return True, setting the status to 304, if the client already has the response described by meta,
+        according to If-None-Match or (if it wasn't given) If-Modified-Since. Must be called after add_cache_headers.
+        """
+        if self.request.headers.get("If-None-Match"):
+            not_modified = self.check_etag_header()
+        else:
+            modified_since = parsedate_tz(self.request.headers.get("If-Modified-Since", ""))
+            last_modified = parsedate_tz(meta['last_modified'])
+            not_modified = bool(modified_since and last_modified) and mktime_tz(last_modified) <= mktime_tz(modified_since)
+        if not_modified:
+            self.set_status(304)
+        return not_modified
 
     def _notify_bus(self, **kwargs):
         if kwargs.get("instance_data"):
@@ -210,6 +249,9 @@ class BrainiakRequestHandler(CorsMixin, RequestHandler):
             self.request.query)
 
     def finalize(self, response):
+        if isinstance(response, basestring):
+            # JSON already serialized (e.g. a cached body), which write() doesn't recognize as such
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
         self.write(response)
         # self.finish() -- this is automagically called by greenlet_asynchronous
 
@@ -237,6 +279,8 @@ class RootJsonSchemaHandler(BrainiakRequestHandler):
         # FIXME: handle cache policy uniformly
         self.set_header("Cache-control", "private")
         self.set_header("max-age", "0")
+        if self.not_modified(response['meta']):
+            return
 
         self.finalize(response['body'])
 
@@ -269,6 +313,8 @@ class RootHandler(BrainiakRequestHandler):
             raise HTTPError(404, log_message=_("Failed to retrieve list of graphs"))
 
         self.add_cache_headers(response['meta'])
+        if self.not_modified(response['meta']):
+            return
         self.finalize(response['body'])
 
     def finalize(self, response):
@@ -330,6 +376,9 @@ class ClassHandler(BrainiakRequestHandler):
                                               class_name=class_name)
             path = cache.build_key_for_class(self.query_params)
             cache.purge_by_path(path, False)
+            cache.delete(cache.build_key_for_class_existence(self.query_params["graph_uri"], self.query_params["class_uri"]))
+            # collections are built according to the schema of their class
+            cache.bump_collection_generation(self.query_params["graph_uri"], self.query_params["class_uri"])
         else:
             raise HTTPError(405, log_message=_("Cache is disabled (Brainaik's settings.ENABLE_CACHE is set to False)"))
 
@@ -344,15 +393,21 @@ class ClassHandler(BrainiakRequestHandler):
         del context_name
         del class_name
 
+        # Unless URIs must be shortened, the cached body is written as it is
+        serialized = self.query_params['expand_uri'] != "0"
         try:
-            response = schema_resource.get_cached_schema(self.query_params, include_meta=True)
+            response = schema_resource.get_cached_schema(self.query_params, include_meta=True, serialized=serialized)
         except schema_resource.SchemaNotFound as e:
             raise HTTPError(404, log_message=e.message)
 
-        if self.query_params['expand_uri'] == "0":
-            response = normalize_all_uris_recursively(response, mode=SHORTEN)
-        self.add_cache_headers(response['meta'])
-        self.finalize(response['body'])
+        self.add_cache_headers(response['meta'], shortened=not serialized)
+        if self.not_modified(response['meta']):
+            return
+        if serialized:
+            self.finalize(response['serialized_body'])
+        else:
+            response = normalize_all_uris_recursively(response['body'], mode=SHORTEN)
+            self.finalize(response)
 
 
 class CollectionJsonSchemaHandler(BrainiakRequestHandler):
@@ -382,10 +437,22 @@ class CollectionHandler(BrainiakRequestHandler):
         del context_name
         del class_name
 
-        response = filter_instances(self.query_params)
-
-        if self.query_params['expand_uri'] == "0":
-            response = normalize_all_uris_recursively(response, mode=SHORTEN)
+        # Unless URIs must be shortened, the cached body is written as it is
+        serialized = self.query_params['expand_uri'] != "0"
+        response = memoize(self.query_params,
+                           filter_instances,
+                           key=build_key_for_collection(self.query_params),
+                           function_arguments=self.query_params,
+                           serialized=serialized)
+
+        if response is not None:
+            self.add_cache_headers(response['meta'], shortened=not serialized)
+            if self.not_modified(response['meta']):
+                return
+            if serialized:
+                response = response['serialized_body']
+            else:
+                response = normalize_all_uris_recursively(response['body'], mode=SHORTEN)
 
         self.finalize(response)
 
@@ -426,6 +493,7 @@ class CollectionHandler(BrainiakRequestHandler):
         self.query_params["instance_id"] = instance_id
         self.query_params["expand_object_properties"] = "1"
 
+        purge_written_instance(self.query_params)
         instance_data = get_instance(self.query_params)
 
         if settings.NOTIFY_BUS:
@@ -501,10 +569,13 @@ class InstanceHandler(BrainiakRequestHandler):
                                           instance_id=instance_id,
                                           **optional_params)
 
+        # Unless URIs must be shortened, the cached body is written as it is
+        serialized = self.query_params["expand_uri"] != "0"
         response = memoize(self.query_params,
                            get_instance,
                            key=build_instance_key(self.query_params),
-                           function_arguments=self.query_params)
+                           function_arguments=self.query_params,
+                           serialized=serialized)
 
         if response is None:
             error_message = u"Instance ({0}) of class ({1}) in graph ({2}) was not found.".format(
@@ -513,13 +584,14 @@ class InstanceHandler(BrainiakRequestHandler):
                 self.query_params['graph_uri'])
             raise HTTPError(404, log_message=error_message)
 
-        response_meta = response['meta']
-        response = response['body']
-
-        if self.query_params["expand_uri"] == "0":
-            response = normalize_all_uris_recursively(response, mode=SHORTEN)
+        self.add_cache_headers(response['meta'], shortened=not serialized)
+        if self.not_modified(response['meta']):
+            return
+        if serialized:
+            response = response['serialized_body']
+        else:
+            response = normalize_all_uris_recursively(response['body'], mode=SHORTEN)
 
-        self.add_cache_headers(response_meta)
         self.finalize(response)
 
     @greenlet_asynchronous
@@ -556,7 +628,7 @@ class InstanceHandler(BrainiakRequestHandler):
             status = 200
 
             # Clear cache
-            cache.purge_an_instance(self.query_params['instance_uri'])
+            purge_written_instance(self.query_params)
 
             self.finalize(status)
         else:
@@ -575,6 +647,7 @@ class InstanceHandler(BrainiakRequestHandler):
             status = 201
             self.set_header("location", resource_url)
             self.set_header("X-Brainiak-Resource-URI", instance_uri)
+            purge_written_instance(self.query_params)
 
             self.finalize(status)
 
@@ -621,7 +694,7 @@ class InstanceHandler(BrainiakRequestHandler):
         except SchemaNotFound as ex:
             raise HTTPError(404, log_message=unicode(ex))
 
-        cache.purge_an_instance(self.query_params['instance_uri'])
+        purge_written_instance(self.query_params)
 
         self.query_params["expand_object_properties"] = "1"
         instance_data = get_instance(self.query_params)
@@ -650,7 +723,7 @@ class InstanceHandler(BrainiakRequestHandler):
             response = 204
             if settings.NOTIFY_BUS:
                 self._notify_bus(action="DELETE")
-            cache.purge_an_instance(self.query_params['instance_uri'])
+            purge_written_instance(self.query_params)
         else:
             msg = _(u"Instance ({0}) of class ({1}) in graph ({2}) was not found.")
             error_message = msg.format(self.query_params["instance_uri"],
@@ -666,7 +739,7 @@ class InstanceHandler(BrainiakRequestHandler):
         self.set_header("Cache-control", "private")
         self.set_header("max-age", "0")
 
-        if isinstance(response, dict):
+        if isinstance(response, (dict, basestring)):
             self.write(response)
             class_url = build_class_url(self.query_params)
             schema_url = build_schema_url_for_instance(self.query_params, class_url)
@@ -779,13 +852,30 @@ class VersionHandler(BrainiakRequestHandler):
 class VirtuosoStatusHandler(BrainiakRequestHandler):
 
     def get(self):
-        self.write(triplestore.status())
+        response = triplestore.status()
+        response += u"<br><br>" + triplestore.pool_status()
+        response += u"<br><br>" + triplestore.endpoints_status()
+        self.write(response)
+
+
+class QueryMetricsStatusHandler(BrainiakRequestHandler):
+
+    def get(self):
+        self.write(triplestore.queries_status())
 
 
 class CacheStatusHandler(BrainiakRequestHandler):
 
     def get(self):
+        # the statistics of each key family and the hot keys are also given as JSON (see cache.stats_status)
+        if "application/json" in self.request.headers.get("Accept", ""):
+            self.write(cache.stats_status())
+            return
+
         response = cache.status_message()
+        response += "<br>" + cache.tiers_status_message() + "<br>"
+        response += cache.keys_status_message() + "<br>"
+        response += cache.stats_status_message() + "<br>"
         cache_keys = cache.keys("")
         if cache_keys:
             response += "<br>Cached keys:<br>"
@@ -52,4 +52,4 @@ INSERT DATA INTO <%(graph_uri)s>
 
 def query_create_instances(query_params):
     query = QUERY_INSERT_TRIPLES % query_params
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="instance.create")
@@ -28,7 +28,7 @@ SELECT ?dependant {
 
 def query_dependants(query_params):
     query = QUERY_DEPENDANTS_TEMPLATE % query_params
-    result_dict = triplestore.query_sparql(query, query_params.triplestore_config)
+    result_dict = triplestore.query_sparql(query, query_params.triplestore_config, family="instance.dependants")
     return result_dict
 
 
@@ -42,5 +42,5 @@ WHERE
 
 def query_delete(query_params):
     query = QUERY_DELETE_INSTANCE % query_params
-    result_dict = triplestore.query_sparql(query, query_params.triplestore_config)
+    result_dict = triplestore.query_sparql(query, query_params.triplestore_config, family="instance.delete")
     return result_dict
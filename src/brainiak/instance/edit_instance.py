@@ -55,7 +55,7 @@ WHERE
 def modify_instance(query_params, **kw):
     kw.update(query_params)
     query = MODIFY_QUERY % kw
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="instance.modify")
 
 
 QUERY_INSTANCE_EXISTS_TEMPLATE = u"""
@@ -68,5 +68,5 @@ WHERE {
 
 def instance_exists(query_params):
     query = QUERY_INSTANCE_EXISTS_TEMPLATE % query_params
-    result_dict = triplestore.query_sparql(query, query_params.triplestore_config)
+    result_dict = triplestore.query_sparql(query, query_params.triplestore_config, family="instance.exists")
     return is_result_true(result_dict)
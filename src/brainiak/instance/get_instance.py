@@ -171,7 +171,7 @@ def query_all_properties_and_objects(query_params):
         template_vars["object_label_variable"] = ""
         template_vars["object_label_optional_clause"] = ""
     query = QUERY_ALL_PROPERTIES_AND_OBJECTS_TEMPLATE % template_vars
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="instance.all_properties")
 
 
 QUERY_ALL_PROPERTIES_AND_OBJECTS_TEMPLATE_BY_URI = u"""
@@ -196,7 +196,7 @@ def query_all_properties_and_objects_by_instance_uri(query_params):
         template_vars["object_label_variable"] = ""
         template_vars["object_label_optional_clause"] = ""
     query = QUERY_ALL_PROPERTIES_AND_OBJECTS_TEMPLATE_BY_URI % template_vars
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="instance.all_properties_by_uri")
 
 
 def _convert_to_python(object_value, class_schema, predicate_uri):
@@ -15,7 +15,9 @@ WHERE {GRAPH ?graph { ?s a ?o }}
 
 
 def list_all_contexts(query_params):
-    sparql_response = triplestore.query_sparql(QUERY_LIST_CONTEXT, query_params.triplestore_config)
+    sparql_response = triplestore.query_sparql(QUERY_LIST_CONTEXT, query_params.triplestore_config,
+                                               result_format=triplestore.TSV_RESPONSE_FORMAT,
+                                               family="root.contexts")
     all_contexts_uris = sparql.filter_values(sparql_response, "graph")
 
     filtered_contexts = filter_and_build_contexts(all_contexts_uris)
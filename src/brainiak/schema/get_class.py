@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from brainiak import triplestore, settings
+from brainiak.greenlet_tornado import greenlet_run_many
 from brainiak.log import get_logger
 from brainiak.prefixes import MemorizeContext
 from brainiak.suggest.json_schema import SUGGEST_PARAM_SCHEMA
@@ -18,10 +19,11 @@ class SchemaNotFound(Exception):
     pass
 
 
-def get_cached_schema(query_params, include_meta=False):
+def get_cached_schema(query_params, include_meta=False, serialized=False):
     schema_key = build_key_for_class(query_params)
-    class_object = memoize(query_params, get_schema, query_params, key=schema_key)
-    if class_object is None or not class_object["body"]:
+    class_object = memoize(query_params, get_schema, query_params, key=schema_key, serialized=serialized)
+    # the body of a class that doesn't exist is empty (serialized or not)
+    if class_object is None or class_object.get("body", class_object.get("serialized_body")) in (None, {}, "{}"):
         msg = _(u"The class definition for {0} was not found in graph {1}")
         raise SchemaNotFound(msg.format(query_params['class_uri'], query_params['graph_uri']))
     if include_meta:
@@ -32,11 +34,15 @@ def get_cached_schema(query_params, include_meta=False):
 
 def get_schema(query_params):
     context = MemorizeContext(normalize_uri=query_params['expand_uri'])
-    class_schema = query_class_schema(query_params)
+    # Only the predicates query depends on another one (superclasses), so the others run concurrently
+    class_schema, superclasses, cardinalities = greenlet_run_many([
+        lambda: query_class_schema(query_params),
+        lambda: query_superclasses(query_params),
+        lambda: query_cardinalities(query_params)
+    ])
     if not class_schema["results"]["bindings"]:
         return
-    superclasses = query_superclasses(query_params)
-    predicates_and_cardinalities = get_predicates_and_cardinalities(context, query_params, superclasses)
+    predicates_and_cardinalities = get_predicates_and_cardinalities(context, query_params, superclasses, cardinalities)
     response_dict = assemble_schema_dict(query_params,
                                          get_one_value(class_schema, "title"),
                                          predicates_and_cardinalities,
@@ -142,11 +148,12 @@ def build_class_schema_query(params):
 
 def query_class_schema(query_params):
     query = build_class_schema_query(query_params)
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="schema.class")
 
 
-def get_predicates_and_cardinalities(context, query_params, superclasses):
-    query_result = query_cardinalities(query_params)
+def get_predicates_and_cardinalities(context, query_params, superclasses, query_result=None):
+    if query_result is None:
+        query_result = query_cardinalities(query_params)
     bindings = query_predicates(query_params, superclasses)
     predicate_dict = bindings_to_dict('predicate', bindings)
 
@@ -231,7 +238,7 @@ WHERE {
 
 def query_cardinalities(query_params):
     query = QUERY_CARDINALITIES % query_params
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="schema.cardinalities")
 
 
 def query_predicates(query_params, superclasses):
@@ -291,7 +298,7 @@ def _query_predicate_with_lang(query_params, superclasses):
                          uniqueness_property=query_params.get_aux_param('uniqueness_property'),
                          **query_params)
     query = QUERY_PREDICATE_WITH_LANG % template_vars
-    response = triplestore.query_sparql(query, query_params.triplestore_config)
+    response = triplestore.query_sparql(query, query_params.triplestore_config, family="schema.predicates")
     return response
 
 
@@ -334,7 +341,7 @@ def _query_predicate_without_lang(query_params, superclasses):
                          uniqueness_property=settings.ANNOTATION_PROPERTY_HAS_UNIQUE_VALUE,
                          **query_params)
     query = QUERY_PREDICATE_WITHOUT_LANG % template_vars
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="schema.predicates_without_lang")
 
 
 def query_superclasses(query_params):
@@ -356,7 +363,7 @@ WHERE {
 
 def _query_superclasses(query_params):
     query = QUERY_SUPERCLASS % query_params
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="schema.superclasses")
 
 
 def items_from_range(range_uri, min_items=1, max_items=1):
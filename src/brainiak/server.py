@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
+import signal
 import sys
 import traceback
 
+import greenlet
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
 from tornado.options import define, options, parse_command_line
@@ -11,8 +13,10 @@ from brainiak import log, settings
 from brainiak.greenlet_tornado import greenlet_set_ioloop
 from brainiak.routes import ROUTES
 from brainiak import event_bus
-from brainiak.utils.cache import flushall
+from brainiak.utils import config_parser
+from brainiak.utils.cache import delete_old_namespaces, keep_namespace_alive, listen_invalidations
 from brainiak.utils.sparql import load_label_properties
+from brainiak.warmup import warm_up_once
 
 
 server = None
@@ -27,9 +31,6 @@ class Application(TornadoApplication):
             log.initialize()
             event_bus.initialize()
             load_label_properties()
-            # Wipeout all entries to avoid inconsistencies due to algorithmic changes between releases
-
-            flushall()
             super(Application, self).__init__(ROUTES, debug=debug)
         except Exception as e:
             sys.stdout.write(u"Failed to initialize application. {0}".format(unicode(e)))
@@ -47,6 +48,19 @@ def main():  # pragma: no cover
     server.listen(options.port)
     io_loop = IOLoop.instance()
     greenlet_set_ioloop(io_loop)
+    # kill -HUP reloads triplestore.ini without restarting the server
+    signal.signal(signal.SIGHUP, lambda signum, frame: io_loop.add_callback_from_signal(config_parser.reload))
+    # Responses cached by other releases are never read (see cache.NAMESPACE), so they can be deleted in background
+    # once no process of those releases is running
+    io_loop.add_callback(greenlet.greenlet(delete_old_namespaces).switch)
+    if settings.ENABLE_CACHE:
+        # ... which processes of this release tell by the heartbeat of its namespace
+        io_loop.add_callback(greenlet.greenlet(keep_namespace_alive).switch)
+        # In-process caches are invalidated by the other processes through Redis
+        io_loop.add_callback(greenlet.greenlet(listen_invalidations).switch)
+    if settings.ENABLE_CACHE and settings.WARMUP_ON_STARTUP:
+        base_url = "http://localhost:{0}".format(options.port)
+        io_loop.add_callback(greenlet.greenlet(lambda: warm_up_once(base_url)).switch)
     io_loop.start()
 
 
@@ -5,6 +5,12 @@ DEBUG = False
 
 REDIS_ENDPOINT = 'localhost'
 REDIS_PORT = 6379
+# Redis nodes ("host:port") the cache is sharded over, by consistent hashing of the keys.
+# When empty, the single node at REDIS_ENDPOINT and REDIS_PORT is used
+REDIS_NODES = []
+# Connections of the non-blocking Redis client (per process), and how long each cache call may take
+REDIS_MAX_CONNECTIONS = 10
+REDIS_TIMEOUT_IN_SECS = 0.5
 
 TRIPLESTORE_CONFIG_FILEPATH = 'src/brainiak/triplestore.ini'
 
@@ -40,3 +46,40 @@ LOG_LEVEL = logging.WARN
 ES_ANALYZER = "default"
 
 ANNOTATION_PROPERTY_HAS_UNIQUE_VALUE = "base:tem_valor_unico"
+
+# Triplestore connection pool defaults, which can be overriden per section at triplestore.ini
+TRIPLESTORE_POOL_SIZE = 10
+TRIPLESTORE_POOL_IDLE_TIMEOUT_IN_SECS = 60
+TRIPLESTORE_POOL_MAX_QUEUED = 100
+TRIPLESTORE_CONNECT_TIMEOUT_IN_SECS = 20
+
+# Triplestore endpoints failing this many times in a row are not used by read queries for a while
+TRIPLESTORE_EJECTION_FAILURES = 3
+TRIPLESTORE_EJECTION_TIME_IN_SECS = 30
+
+# Percentile of the recent latencies of a replica after which read queries are also sent to another one.
+# Hedging is disabled if None, unless a section defines hedge_percentile at triplestore.ini
+TRIPLESTORE_HEDGE_PERCENTILE = None
+TRIPLESTORE_HEDGE_MIN_DELAY_IN_SECS = 0.05
+
+# In-process cache of the graph and class of classes and instances, used by URLs with "_" placeholders
+LOOKUP_CACHE_MAX_ITEMS = 1000
+LOOKUP_CACHE_TTL_IN_SECS = 5 * 60
+
+# In-process cache of memoized responses, checked before Redis. Entries deleted by another
+# process are dropped by this one when the invalidation published by it arrives (see cache.listen_invalidations)
+LOCAL_CACHE_MAX_ITEMS = 500
+LOCAL_CACHE_TTL_IN_SECS = 60
+
+# Missing instances, classes and graphs are remembered for this long, so that requests for them
+# don't reach the triplestore. They are forgotten as soon as they are created through Brainiak
+CACHE_NEGATIVE_TTL_IN_SECS = 30
+
+# Class schemas are cached after the server starts (see brainiak.warmup), requesting
+# at most WARMUP_CONCURRENCY of them at a time
+WARMUP_ON_STARTUP = False
+WARMUP_CONCURRENCY = 4
+WARMUP_REQUEST_TIMEOUT_IN_SECS = 60
+
+# Only queries to the triplestore slower than this are logged (with their full text)
+SLOW_QUERY_THRESHOLD_IN_SECS = 1
@@ -23,7 +23,9 @@ def execute_query(query_id, stored_query, querystring_params):
     log.logger.info(QUERY_EXECUTION_LOG_FORMAT.format(**request_dict))
 
     result_dict = query_sparql(query,
-                               querystring_params.triplestore_config)
+                               querystring_params.triplestore_config,
+                               stream=True,
+                               family="stored_query.execution")
     items = compress_keys_and_values(result_dict)
     if not items:
         message = NO_RESULTS_MESSAGE_FORMAT.format(querystring_params.triplestore_config["url"], query)
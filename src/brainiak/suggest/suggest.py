@@ -130,7 +130,7 @@ def _build_predicate_ranges_query(query_params, search_params):
 
 def _get_predicate_ranges(query_params, search_params):
     query = _build_predicate_ranges_query(query_params, search_params)
-    return triplestore.query_sparql(query, query_params.triplestore_config)
+    return triplestore.query_sparql(query, query_params.triplestore_config, family="suggest.ranges")
 
 
 QUERY_SUBPROPERTIES = u"""
@@ -204,7 +204,7 @@ def _build_class_fields_query(classes, field):
 
 def _get_class_fields_value(query_params, classes, meta_field):
     query = _build_class_fields_query(classes, meta_field)
-    class_field_query_response = triplestore.query_sparql(query, query_params.triplestore_config)
+    class_field_query_response = triplestore.query_sparql(query, query_params.triplestore_config, family="suggest.class_fields")
     class_field_values = filter_values(class_field_query_response, "field_value")
     return class_field_values
 
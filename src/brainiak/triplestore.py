@@ -1,20 +1,24 @@
 # -*- coding: utf-8 -*-
 import copy
+import hashlib
+import re
 import time
 import urllib
 
 import requests
 from requests.auth import HTTPDigestAuth
 import ujson as json
-from simplejson import JSONDecodeError
+from simplejson import JSONDecodeError, JSONDecoder
 
 from tornado.httpclient import HTTPRequest
 from tornado.httpclient import HTTPError as ClientHTTPError
 from tornado.web import HTTPError
 
-from brainiak import log
-from brainiak.greenlet_tornado import greenlet_fetch
+from brainiak import log, settings
+from brainiak.greenlet_tornado import greenlet_fetch, greenlet_hedge
+from brainiak.utils import connection_pool, metrics, replicas
 from brainiak.utils.config_parser import parse_section
+from brainiak.utils.single_flight import SingleFlight
 
 
 JSON_DECODE_ERROR_MESSAGE = "Could not decode JSON:\n  {0}"
@@ -24,25 +28,39 @@ DEFAULT_VIRTUOSO_REQUEST_HEADERS = {
     "Content-Type": "application/x-www-form-urlencoded"
 }
 DEFAULT_RESPONSE_FORMAT = "application/sparql-results+json"
+# Compact format for queries whose results are flat rows (see iter_tsv_bindings)
+TSV_RESPONSE_FORMAT = "text/tab-separated-values"
 DEFAULT_HTTP_METHOD = "POST"
+UNKNOWN_QUERY_FAMILY = "unknown"
 
+# Queries that only read data, so that identical concurrent ones can share the same response
+READ_QUERY_PATTERN = re.compile(r"^\s*((PREFIX|BASE|DEFINE)\s[^\n]*\n\s*)*(SELECT|ASK|CONSTRUCT|DESCRIBE)\b",
+                                re.IGNORECASE)
 
-def do_run_query(request_params, async):
+_in_flight_queries = SingleFlight(u"SPARQL queries")
+
+
+def do_run_query(request_params, async, is_cancelled=None):
     # app_name (from triplestore.ini) can't be passed forward to tornado.httpclient.HTTPRequest .
     # It raises an exception
     # Similarly, there are parameters that make requests.request fail
+    pool = connection_pool.get_pool(request_params) if async else None
     request_params.pop("app_name", None)
+    connection_pool.remove_pool_params(request_params)
 
     time_i = time.time()
     if async:
-        request = HTTPRequest(**request_params)
+        request = pool.prepare_request(HTTPRequest(**request_params), is_cancelled)
+        http_client = pool.acquire()
         try:
-            response = greenlet_fetch(request)
+            response = greenlet_fetch(request, http_client=http_client)
         except ClientHTTPError as e:
             if e.code == 401:
                 raise HTTPError(e.code, message=UNAUTHORIZED_MESSAGE)
             else:
                 raise e
+        finally:
+            pool.release()
     else:
         request_params.pop("auth_mode", None)
         request_params.pop("auth_username", None)
@@ -60,7 +78,7 @@ def do_run_query(request_params, async):
 
 def log_request(log_params):
     """
-        Just logs the request
+        Just logs the request (only slow ones are logged, see _run_and_log_query)
     """
     log_params["user_ip"] = unicode(None)
     log_params["auth_username"] = log_params.get("auth_username", None)
@@ -68,12 +86,225 @@ def log_request(log_params):
     log.logger.info(log_msg)
 
 
-def _process_json_triplestore_response(response, async=True):
+class _BindingsReader(object):
+    """
+    Reads the rows of the 'bindings' list of a SPARQL JSON results body one at a time,
+    decoding each of them only when it is requested. Other members of the response are skipped.
+    """
+
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    decoder = JSONDecoder()
+
+    def __init__(self, body):
+        self.body = body
+        self.index = 0
+
+    def _peek(self):
+        self.index = self.WHITESPACE.match(self.body, self.index).end()
+        return self.body[self.index:self.index + 1]
+
+    def _consume(self, expected):
+        if self._peek() != expected:
+            raise JSONDecodeError("Expecting '{0}'".format(expected), self.body, self.index)
+        self.index += 1
+
+    def _decode(self):
+        self._peek()
+        value, self.index = self.decoder.raw_decode(self.body, self.index)
+        return value
+
+    def _keys(self):
+        "Yield the keys of the object at the current position. Each value must be read before the next key."
+        self._consume("{")
+        if self._peek() == "}":
+            self.index += 1
+            return
+        while True:
+            key = self._decode()
+            self._consume(":")
+            yield key
+            if self._peek() == ",":
+                self.index += 1
+            else:
+                self._consume("}")
+                return
+
+    def _items(self):
+        "Yield the decoded items of the list at the current position."
+        self._consume("[")
+        if self._peek() == "]":
+            self.index += 1
+            return
+        while True:
+            yield self._decode()
+            if self._peek() == ",":
+                self.index += 1
+            else:
+                self._consume("]")
+                return
+
+    def bindings(self):
+        for key in self._keys():
+            if key == "results":
+                for results_key in self._keys():
+                    if results_key == "bindings":
+                        for row in self._items():
+                            yield row
+                    else:
+                        self._decode()
+            else:
+                self._decode()
+
+
+def iter_bindings(body):
+    """
+    Return an iterator over the rows of the 'bindings' list of a SPARQL JSON results body (a string),
+    which are decoded incrementally, as they are consumed. Raises JSONDecodeError if body is invalid.
+
+    Usage:
+
+    >>> rows = iter_bindings('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://a"}}]}}')
+    >>> list(rows)
+    [{u's': {u'type': u'uri', u'value': u'http://a'}}]
+    """
+    return _BindingsReader(body).bindings()
+
+
+XSD_BOOLEAN = u"http://www.w3.org/2001/XMLSchema#boolean"
+XSD_INTEGER = u"http://www.w3.org/2001/XMLSchema#integer"
+XSD_DECIMAL = u"http://www.w3.org/2001/XMLSchema#decimal"
+XSD_DOUBLE = u"http://www.w3.org/2001/XMLSchema#double"
+
+TSV_INTEGER_PATTERN = re.compile(r"^[+-]?\d+$")
+TSV_DECIMAL_PATTERN = re.compile(r"^[+-]?\d*\.\d+$")
+TSV_DOUBLE_PATTERN = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)[eE][+-]?\d+$")
+
+TSV_LITERAL_PATTERN = re.compile(r'^"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<([^>]*)>)?$')
+
+TSV_ESCAPES = {"t": u"\t", "n": u"\n", "r": u"\r", "b": u"\b", "f": u"\f", '"': u'"', "'": u"'", "\\": u"\\"}
+
+TSV_ESCAPE_PATTERN = re.compile(r"\\(.)")
+
+# A cell is either a quoted literal, which may contain tabs and line breaks (escaped or not),
+# or anything up to the next tab or line break. It is followed by a tab, a line break or the end of the body
+TSV_CELL_PATTERN = re.compile(r'("(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?(?=\t|\r|\n|$)|[^\t\r\n]*)(\t|\r?\n|\r|$)',
+                              re.DOTALL)
+
+
+class TSVDecodeError(ValueError):
+    pass
+
+
+def _unescape_tsv_literal(value):
+    return TSV_ESCAPE_PATTERN.sub(lambda match: TSV_ESCAPES.get(match.group(1), match.group(0)), value)
+
+
+def _decode_tsv_term(cell):
+    """
+    Convert a cell of a TSV result, written in Turtle syntax, into the dict used by SPARQL JSON results.
+    Cells quoted but without any type information (e.g. Virtuoso output) are returned as plain literals.
+    """
+    if cell.startswith(u"<") and cell.endswith(u">"):
+        return {"type": "uri", "value": cell[1:-1]}
+    if cell.startswith(u"_:"):
+        return {"type": "bnode", "value": cell[2:]}
+
+    match = TSV_LITERAL_PATTERN.match(cell)
+    if match is not None:
+        value, language, datatype = match.groups()
+        term = {"type": "literal", "value": _unescape_tsv_literal(value)}
+        if language:
+            term["xml:lang"] = language
+        elif datatype:
+            term["type"] = "typed-literal"
+            term["datatype"] = datatype
+        return term
+
+    # unquoted numbers and booleans
+    if cell in (u"true", u"false"):
+        datatype = XSD_BOOLEAN
+    elif TSV_INTEGER_PATTERN.match(cell):
+        datatype = XSD_INTEGER
+    elif TSV_DECIMAL_PATTERN.match(cell):
+        datatype = XSD_DECIMAL
+    elif TSV_DOUBLE_PATTERN.match(cell):
+        datatype = XSD_DOUBLE
+    else:
+        return {"type": "literal", "value": cell}
+    return {"type": "typed-literal", "datatype": datatype, "value": cell}
+
+
+def iter_tsv_bindings(body):
+    """
+    Return an iterator over the rows of a SPARQL TSV results body (a string), in the same
+    format of the 'bindings' list of SPARQL JSON results. Unbound variables are omitted.
+
+    Usage:
+
+    >>> rows = iter_tsv_bindings('?s\\t?label\\n<http://a>\\t"A"@en\\n')
+    >>> list(rows)
+    [{u's': {'type': 'uri', 'value': u'http://a'}, u'label': {'xml:lang': u'en', 'type': 'literal', 'value': u'A'}}]
+    """
+    rows = _iter_tsv_rows(body.decode("utf-8"))
+    try:
+        header = next(rows)
+    except StopIteration:
+        return
+    variables = [name.strip().strip(u'"').lstrip(u"?$") for name in header]
+    for number, cells in enumerate(rows, 1):
+        if cells == [u""]:
+            continue
+        if len(cells) != len(variables):
+            raise TSVDecodeError(u"Row {0} of the TSV results has {1} columns, but the header has {2}: {3!r}".format(
+                number, len(cells), len(variables), u"\t".join(cells)))
+        row = {}
+        for variable, cell in zip(variables, cells):
+            if cell:
+                row[variable] = _decode_tsv_term(cell)
+        yield row
+
+
+def _iter_tsv_rows(body):
+    "Split a TSV body into rows (lists of cells), at the line breaks which are not inside quoted literals"
+    position, cells = 0, []
+    while position < len(body):
+        match = TSV_CELL_PATTERN.match(body, position)
+        cell, separator = match.groups()
+        cells.append(cell)
+        position = match.end()
+        if separator != u"\t":
+            yield cells
+            cells = []
+    if cells:
+        # the body ends with a tab
+        cells.append(u"")
+        yield cells
+
+
+def _process_tsv_triplestore_response(response, async=True, stream=False):
+    """
+        Returns a python dict in the same format of SPARQL JSON results, given a TSV triplestore response.
+        If stream is False, the bindings are decoded at once, in a list.
+    """
+    body = response.body if async else response.content
+    bindings = iter_tsv_bindings(body)
+    if not stream:
+        bindings = list(bindings)
+    return {"results": {"bindings": bindings}}
+
+
+def _process_json_triplestore_response(response, async=True, stream=False):
     """
         Returns a python dict with triplestore response.
         Unifying tornado and requests response.
+        If stream is True, result_dict['results']['bindings'] is an iterator that
+        decodes the response rows as they are consumed.
     """
-    if async:
+    if stream:
+        body = response.body if async else response.content
+        result_dict = {"results": {"bindings": iter_bindings(body)}}
+    elif async:
         result_dict = json.loads(unicode(response.body))
     else:
         try:
@@ -83,29 +314,116 @@ def _process_json_triplestore_response(response, async=True):
     return result_dict
 
 
-def query_sparql(query, triplestore_config, async=True):
+def query_sparql(query, triplestore_config, async=True, stream=False, result_format=DEFAULT_RESPONSE_FORMAT,
+                 family=UNKNOWN_QUERY_FAMILY):
     """
     Simple interface that given a SPARQL query string returns a string representing a SPARQL results bindings
     in JSON format. For now it only works with Virtuoso, but in futurw we intend to support other databases
     that are SPARQL 1.1 complaint (including SPARQL result bindings format).
-    """
-    request_params = _build_request_params(query, triplestore_config, async)
-    log_params = copy.copy(request_params)
 
-    response, time_diff = do_run_query(request_params, async)
+    If stream is True, the bindings are returned as an iterator, so that large results don't have to be
+    decoded at once. It can be consumed only once, by functions such as compress_keys_and_values.
 
-    log_params["query"] = unicode(query)
-    log_params["time_diff"] = time_diff
-    log_request(log_params)
+    If result_format is TSV_RESPONSE_FORMAT, the triplestore answers in the more compact TSV format,
+    which is converted to the same structure. Virtuoso doesn't tell URIs from literals in TSV,
+    so it should only be used by queries whose callers don't depend on the type of the values.
 
-    result_dict = _process_json_triplestore_response(response, async)
+    family names the kind of query (e.g. "schema.cardinalities"), so that the latencies and response
+    sizes of similar queries are aggregated (see brainiak.utils.metrics and /_status/virtuoso/queries).
+    """
+    request_params = _build_request_params(query, triplestore_config, async, result_format)
+
+    read_only = READ_QUERY_PATTERN.match(query) is not None
+    if async and read_only:
+        # Identical read queries sent to the same section while this one is running wait for its response
+        key = (request_params["url"],
+               request_params.get("auth_username"),
+               result_format,
+               hashlib.md5(unicode(query).encode("utf-8")).hexdigest())
+        response = _in_flight_queries.run(key, lambda: _run_and_log_query(query, request_params, async, read_only, family))
+    else:
+        response = _run_and_log_query(query, request_params, async, read_only, family)
+
+    # Each caller gets its own copy of the result, as callers modify it
+    if result_format == TSV_RESPONSE_FORMAT:
+        result_dict = _process_tsv_triplestore_response(response, async, stream)
+    else:
+        result_dict = _process_json_triplestore_response(response, async, stream)
     return result_dict
 
+
+def _is_endpoint_failure(exception):
+    "Tell errors of the endpoint itself (unreachable, timeout, internal error) from errors of the query"
+    if isinstance(exception, ClientHTTPError):
+        return exception.code >= 500
+    return isinstance(exception, requests.RequestException)
+
+
+def _run_on_endpoint(endpoint, request_params, async, is_cancelled=None):
+    request_params = dict(request_params, url=endpoint.url)
+    endpoint.start()
+    try:
+        response, time_diff = do_run_query(request_params, async, is_cancelled)
+    except Exception as e:
+        if _is_endpoint_failure(e) and not (is_cancelled and is_cancelled()):
+            endpoint.fail()
+        else:
+            endpoint.finish()
+        raise
+    if not async and response.status_code >= 500:
+        endpoint.fail()
+    else:
+        endpoint.finish(time_diff)
+    return response, time_diff
+
+
+def _run_and_log_query(query, request_params, async, read_only, family=UNKNOWN_QUERY_FAMILY):
+    family_metrics = metrics.get_family(family)
+    endpoint = replicas.choose_endpoint(request_params, read_only)
+    hedge_endpoint, hedge_delay = None, None
+    if async and read_only:
+        hedge_endpoint, hedge_delay = replicas.choose_hedge(request_params, endpoint)
+    replicas.remove_replicas_params(request_params)
+    log_params = copy.copy(request_params)
+
+    try:
+        if hedge_endpoint is None:
+            response, time_diff = _run_on_endpoint(endpoint, request_params, async)
+        else:
+            hedge = {"started": False}
+
+            def run_hedge(is_cancelled):
+                hedge["started"] = True
+                return _run_on_endpoint(hedge_endpoint, request_params, async, is_cancelled)
+
+            winner, (response, time_diff) = greenlet_hedge(
+                lambda is_cancelled: _run_on_endpoint(endpoint, request_params, async, is_cancelled),
+                run_hedge,
+                hedge_delay,
+                # invalid queries would fail at any replica
+                should_hedge=_is_endpoint_failure)
+            if hedge["started"]:
+                replicas.count_hedge(won=winner == 1)
+            if winner == 1:
+                endpoint = hedge_endpoint
+    except:
+        family_metrics.record_error()
+        raise
+
+    slow = time_diff >= settings.SLOW_QUERY_THRESHOLD_IN_SECS
+    family_metrics.record(time_diff, len(response.body if async else response.content), slow)
+    if slow:
+        log_params["url"] = endpoint.url
+        log_params["query"] = unicode(query)
+        log_params["time_diff"] = time_diff
+        log_request(log_params)
+    return response
+
 # This is based on virtuoso_connector app, used by App Semantica, so QA2 Virtuoso Analyser works
 format_post = u"POST - %(url)s - %(user_ip)s - %(auth_username)s [tempo: %(time_diff)s] - QUERY - %(query)s"
 
 
-def _build_request_params(query, triplestore_config, async):
+def _build_request_params(query, triplestore_config, async, result_format=DEFAULT_RESPONSE_FORMAT):
     """
         This function creates a dict according to the param async.
         If True, a dict with args for tornado.httpclient.HTTPRequest is created.
@@ -113,7 +431,7 @@ def _build_request_params(query, triplestore_config, async):
     """
     body_params = {
         "query": unicode(query).encode("utf-8"),
-        "format": DEFAULT_RESPONSE_FORMAT
+        "format": result_format
     }
 
     body_string = urllib.urlencode(body_params)
@@ -182,9 +500,38 @@ def status():
     return msg
 
 
+def pool_status():
+    """
+    Describe the usage of the connection pools to the triplestore.
+    """
+    lines = connection_pool.status()
+    if not lines:
+        return u"No connection pools to the triplestore were created yet"
+    lines.append(_in_flight_queries.status())
+    return u"<br>".join(lines)
+
+
+def endpoints_status():
+    """
+    Describe the health and load of the triplestore endpoints used so far.
+    """
+    lines = replicas.status()
+    if not lines:
+        return u"No queries were sent to the triplestore yet"
+    lines.append(replicas.hedging_status())
+    return u"<br>".join(lines)
+
+
+def queries_status():
+    """
+    Return a dict with the number, errors and latency percentiles of the queries of each family.
+    """
+    return metrics.report()
+
+
 def _run_status_request(query, endpoint_dict, info):
     try:
-        query_sparql(query, endpoint_dict, async=False)
+        query_sparql(query, endpoint_dict, async=False, family="status")
     except (ClientHTTPError, HTTPError) as e:
         # Reason for this: ClientHTTPError has one pattern and HTTPError for status code attribute
         code = hasattr(e, "status_code") and e.status_code
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+import socket
+import time
+from collections import deque
+
+import greenlet
+import redis
+from redis.exceptions import ConnectionError, ResponseError
+from tornado.iostream import IOStream
+
+from brainiak.greenlet_tornado import greenlet_get_ioloop
+
+
+__doc__ = """
+Non-blocking Redis client for code running inside greenlet request handlers.
+
+AsyncRedis supports the commands of redis.StrictRedis used by the cache (see SUPPORTED_COMMANDS),
+with the same interface, but commands are sent through Tornado IOStreams: the current greenlet is
+suspended while Redis answers (like greenlet_fetch does), so the IOLoop keeps serving other requests.
+Other commands may be sent with execute_command.
+
+Connections are kept in a pool of at most max_connections. Each call (including the wait for a
+free connection) must finish in timeout seconds, otherwise ConnectionError is raised,
+as redis.StrictRedis does when Redis can't be reached.
+
+Channels are subscribed through dedicated connections, see AsyncRedis.subscribe.
+"""
+
+CRLF = "\r\n"
+
+# Commands of redis.StrictRedis supported by AsyncRedis and AsyncPipeline. They just build the arguments
+# of the command and call execute_command, so they are borrowed from redis.StrictRedis as they are
+SUPPORTED_COMMANDS = ("delete", "eval", "expire", "flushall", "get", "incr", "info", "keys", "ping", "publish",
+                      "sadd", "set", "setex", "smembers")
+
+
+def _encode(argument):
+    if isinstance(argument, unicode):
+        return argument.encode("utf-8")
+    if isinstance(argument, float):
+        return repr(argument)
+    return str(argument)
+
+
+def encode_command(arguments):
+    "Serialize a command using the Redis protocol (RESP)"
+    pieces = ["*{0}{1}".format(len(arguments), CRLF)]
+    for argument in arguments:
+        argument = _encode(argument)
+        pieces.append("${0}{1}{2}{1}".format(len(argument), CRLF, argument))
+    return "".join(pieces)
+
+
+class Connection(object):
+    """
+    A connection to Redis, used by a single greenlet at a time.
+    """
+
+    def __init__(self, host, port, password, db, io_loop):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.io_loop = io_loop
+        self.stream = None
+        self._waiter = None
+
+    @property
+    def connected(self):
+        return self.stream is not None and not self.stream.closed()
+
+    def _resume(self, failed, result):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            waiter.switch((failed, result))
+
+    def _wait(self, start):
+        """
+        Call start(callback), which begins an IOStream operation, and suspend the current greenlet
+        until the operation calls back, the connection is closed or the call times out.
+        """
+        gr = greenlet.getcurrent()
+        self._waiter = gr
+        start(lambda result=None: self._resume(False, result))
+        failed, result = gr.parent.switch()
+        if failed:
+            raise result
+        return result
+
+    def _on_close(self):
+        self._resume(True, ConnectionError(u"Connection to Redis {0}:{1} was closed".format(self.host, self.port)))
+
+    def _on_timeout(self):
+        self._resume(True, ConnectionError(u"Timeout while waiting for Redis {0}:{1}".format(self.host, self.port)))
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = IOStream(sock, io_loop=self.io_loop)
+        self.stream.set_close_callback(self._on_close)
+        self._wait(lambda callback: self.stream.connect((self.host, self.port), callback))
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        for reply in self._send(setup):
+            if isinstance(reply, ResponseError):
+                raise reply
+
+    def _read_reply(self):
+        line = self._wait(lambda callback: self.stream.read_until(CRLF, callback))[:-2]
+        kind, content = line[:1], line[1:]
+        if kind == "+":
+            return content
+        if kind == "-":
+            return ResponseError(content)
+        if kind == ":":
+            return int(content)
+        if kind == "$":
+            length = int(content)
+            if length < 0:
+                return None
+            return self._wait(lambda callback: self.stream.read_bytes(length + 2, callback))[:-2]
+        if kind == "*":
+            length = int(content)
+            if length < 0:
+                return None
+            return [self._read_reply() for i in range(length)]
+        raise ConnectionError(u"Invalid reply from Redis: {0!r}".format(line))
+
+    def _send(self, commands):
+        if not commands:
+            return []
+        payload = "".join(encode_command(arguments) for arguments in commands)
+        self._wait(lambda callback: self.stream.write(payload, callback))
+        return [self._read_reply() for arguments in commands]
+
+    def execute(self, commands, deadline):
+        """
+        Send all commands (lists of arguments) at once, and return their replies.
+        Error replies are returned as ResponseError instances.
+        """
+        timeout = self.io_loop.add_timeout(deadline, self._on_timeout)
+        try:
+            if not self.connected:
+                self._connect()
+            return self._send(commands)
+        except:
+            # the state of the connection is unknown (e.g. a reply may be half read)
+            self.disconnect()
+            raise
+        finally:
+            self.io_loop.remove_timeout(timeout)
+
+    def listen(self, callback):
+        """
+        Call callback with each reply pushed by Redis (e.g. the messages of subscribed channels),
+        until the connection is lost.
+        """
+        try:
+            while True:
+                callback(self._read_reply())
+        finally:
+            self.disconnect()
+
+    def disconnect(self):
+        self._waiter = None
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class Commands(object):
+    """
+    Mixin of the commands of SUPPORTED_COMMANDS, as implemented by redis.StrictRedis.
+    They are sent through self.execute_command(*args, **options), which the classes mixing it in must define.
+    """
+
+    RESPONSE_CALLBACKS = redis.StrictRedis.RESPONSE_CALLBACKS
+
+
+for _command in SUPPORTED_COMMANDS:
+    setattr(Commands, _command, getattr(redis.StrictRedis, _command).im_func)
+
+
+class AsyncRedis(Commands):
+
+    def __init__(self, host="localhost", port=6379, password=None, db=0, max_connections=10, timeout=1):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.response_callbacks = self.RESPONSE_CALLBACKS.copy()
+
+        self.in_use = 0
+        self._idle = []
+        # functions resuming the greenlets waiting for a free connection
+        self._waiting = deque()
+
+    def __repr__(self):
+        return "AsyncRedis<host={0},port={1},db={2}>".format(self.host, self.port, self.db)
+
+    def _wait_for_connection(self, io_loop, deadline):
+        gr = greenlet.getcurrent()
+        state = {"resumed": False}
+
+        def resume(connection):
+            "Resume the waiting greenlet, unless it was already resumed. Return True if it was resumed"
+            if state["resumed"]:
+                return False
+            state["resumed"] = True
+            gr.switch(connection)
+            return True
+
+        self._waiting.append(resume)
+        timeout = io_loop.add_timeout(deadline, lambda: resume(None))
+        connection = gr.parent.switch()
+        io_loop.remove_timeout(timeout)
+        if connection is None:
+            if resume in self._waiting:
+                self._waiting.remove(resume)
+            raise ConnectionError(u"Timeout while waiting for a connection to Redis {0}:{1}".format(self.host, self.port))
+        return connection
+
+    def _hand_over(self, resume, connection):
+        if not resume(connection):
+            # the greenlet gave up waiting
+            self._release(connection)
+
+    def _acquire(self, deadline):
+        io_loop = greenlet_get_ioloop()
+        if self.in_use >= self.max_connections:
+            return self._wait_for_connection(io_loop, deadline)
+
+        self.in_use += 1
+        while self._idle:
+            connection = self._idle.pop()
+            if connection.io_loop is io_loop and connection.connected:
+                return connection
+            connection.disconnect()
+        return Connection(self.host, self.port, self.password, self.db, io_loop)
+
+    def _release(self, connection):
+        if not connection.connected:
+            connection = Connection(self.host, self.port, self.password, self.db, connection.io_loop)
+        if self._waiting:
+            # hand the connection over to the next greenlet waiting for one
+            connection.io_loop.add_callback(self._hand_over, self._waiting.popleft(), connection)
+        else:
+            self.in_use -= 1
+            self._idle.append(connection)
+
+    def execute_many(self, commands):
+        "Send commands (lists of arguments) in a single round trip, returning their raw replies"
+        deadline = time.time() + self.timeout
+        connection = self._acquire(deadline)
+        try:
+            return connection.execute(commands, deadline)
+        finally:
+            self._release(connection)
+
+    def parse_reply(self, command_name, reply, **options):
+        if isinstance(reply, ResponseError):
+            raise reply
+        if command_name in self.response_callbacks:
+            return self.response_callbacks[command_name](reply, **options)
+        return reply
+
+    def execute_command(self, *args, **options):
+        reply = self.execute_many([args])[0]
+        return self.parse_reply(args[0], reply, **options)
+
+    def pipeline(self, transaction=False, shard_hint=None):
+        "Return an AsyncPipeline. MULTI/EXEC transactions are not supported"
+        return AsyncPipeline(self)
+
+    def subscribe(self, channel, callback, on_subscribed=None):
+        """
+        Subscribe to channel through a dedicated connection, and call callback with each message published to it.
+        The current greenlet is suspended while waiting for messages, until the connection is lost
+        (ConnectionError is raised). on_subscribed is called once the subscription is confirmed.
+        The connection is closed whatever is raised (e.g. by on_subscribed).
+        """
+        def on_reply(reply):
+            # messages are pushed as ["message", channel, data]
+            if isinstance(reply, list) and reply[0] == "message":
+                callback(reply[2])
+
+        connection = Connection(self.host, self.port, self.password, self.db, greenlet_get_ioloop())
+        try:
+            reply = connection.execute([("SUBSCRIBE", channel)], time.time() + self.timeout)[0]
+            if isinstance(reply, ResponseError):
+                raise reply
+            if on_subscribed is not None:
+                on_subscribed()
+            connection.listen(on_reply)
+        finally:
+            connection.disconnect()
+
+    def disconnect(self):
+        "Close the idle connections"
+        for connection in self._idle:
+            connection.disconnect()
+        self._idle = []
+
+
+class AsyncPipeline(Commands):
+    """
+    Buffer commands, which are sent to Redis in a single round trip by execute().
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.response_callbacks = client.response_callbacks
+        self.command_stack = []
+
+    def __repr__(self):
+        return "AsyncPipeline<{0!r}>".format(self.client)
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def execute(self):
+        stack, self.command_stack = self.command_stack, []
+        replies = self.client.execute_many([args for args, options in stack])
+        return [self.client.parse_reply(args[0], reply, **options)
+                for (args, options), reply in zip(stack, replies)]
@@ -1,29 +1,191 @@
+import fnmatch
+import hashlib
 import md5
+import time
 import traceback
+import uuid
+import zlib
 from email.utils import formatdate
 
+import greenlet
 import redis
 import ujson
+from tornado.escape import json_encode
 
 from brainiak import log
-from brainiak import settings
+from brainiak import settings, version
+from brainiak.greenlet_tornado import greenlet_available, greenlet_get_ioloop, greenlet_run_many, greenlet_sleep
+from brainiak.utils import cache_stats, sparql
+from brainiak.utils.sparql import PATTERN_O, PATTERN_P
+from brainiak.utils.async_redis import AsyncRedis
 from brainiak.utils.i18n import _
+from brainiak.utils.lru import LRUCache
+from brainiak.utils.sharding import ShardedRedis
 
 
 TIME_TO_LIVE_IN_SECS = 24 * 60 * 60
 
+# Must be increased whenever the format of cached responses (or their tags) changes without a new release
+CACHE_FORMAT_VERSION = 4
+
+# Keys are cached in a namespace per release, so that processes of different releases (e.g. during
+# a rolling restart) don't read each other's responses. Keys of other namespaces are deleted by
+# delete_old_namespaces(), once no process has used them for NAMESPACE_IDLE_GRACE_IN_SECS, or expire
+NAMESPACES_PREFIX = u"brainiak:"
+NAMESPACE = u"{0}{1}:{2}:".format(NAMESPACES_PREFIX, version.RELEASE, CACHE_FORMAT_VERSION)
+NAMESPACES_GC_LEASE = u"##namespaces_gc"
+
+# Processes using a namespace refresh its heartbeat key (see keep_namespace_alive), which expires
+# when they are all gone
+NAMESPACE_HEARTBEAT = u"##heartbeat"
+NAMESPACE_HEARTBEAT_INTERVAL_IN_SECS = 60
+NAMESPACE_IDLE_GRACE_IN_SECS = 10 * 60
+
+# Cached responses older than this are still served (as STALE), while they are rebuilt in background.
+# They are only discarded after TIME_TO_LIVE_IN_SECS
+SOFT_TIME_TO_LIVE_IN_SECS = 60 * 60
+
+# Responses requested at least HOT_KEY_MIN_HITS times (by this process) are rebuilt in background
+# when they are about to become stale, so that they are never served as STALE
+REFRESH_AHEAD_IN_SECS = 5 * 60
+HOT_KEY_MIN_HITS = 10
+
+# Tiers where memoized responses are looked for, in this order
+LOCAL_TIER = "local"
+REDIS_TIER = "redis"
+
+TIERS_STATUS_MESSAGE = u"In-process cache | items: %(items)d/%(max_items)d | hits (local): %(local)d | " + \
+    u"hits (redis): %(redis)d | misses: %(misses)d"
+
+# Serialized responses memoized recently by this process, so that the most requested ones don't go to Redis
+local_cache = LRUCache(settings.LOCAL_CACHE_MAX_ITEMS, settings.LOCAL_CACHE_TTL_IN_SECS)
+
+_tier_hits = {LOCAL_TIER: 0, REDIS_TIER: 0, "misses": 0}
+
+# Cached values are a header byte followed by the meta of the response (as JSON), a new line and its body,
+# already serialized as it is written to clients (see serialize_body), so that hits don't re-encode it.
+# Values of at least COMPRESSION_MIN_BYTES are compressed with zlib
+UNCOMPRESSED_HEADER = "j"
+COMPRESSED_HEADER = "z"
+COMPRESSION_MIN_BYTES = 1024
+# Favours speed: on JSON, level 1 already achieves most of the gain of higher levels
+COMPRESSION_LEVEL = 1
+
+# Value cached (for settings.CACHE_NEGATIVE_TTL_IN_SECS) when a resource doesn't exist. It is kept
+# only at Redis, so that it is forgotten by every process as soon as the resource is created
+MISSING_VALUE = "n"
+
+# Only the process holding the build lease of a key builds it, while the others poll Redis until
+# it is cached (for BUILD_WAIT_IN_SECS at most), or the lease is released without caching it
+# (when the build fails). Leases expire, in case their holder crashes
+BUILD_LEASE_TIME_IN_SECS = 30
+BUILD_WAIT_IN_SECS = 3
+BUILD_POLL_INTERVAL_IN_SECS = 0.1
+
+# Deletes the lease only if it is still held by the caller (it may have expired and been taken by another process)
+RELEASE_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Extends the lease only if it is still held by the caller
+RENEW_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Number of hits of each key since it was last built
+_key_hits = LRUCache(settings.LOCAL_CACHE_MAX_ITEMS, SOFT_TIME_TO_LIVE_IN_SECS)
+
+# Keys being rebuilt in background by this process
+_refreshing = set()
+
+# Every cached key is added to the Redis sets of its tags (see _tags_of), so that purges
+# don't need to search the keyspace. Tag sets are split in buckets of the time their keys were
+# stored at: keys live up to TIME_TO_LIVE_IN_SECS, so only the current and the previous bucket
+# may have keys which didn't expire, and older buckets expire instead of growing forever.
+TAG_BUCKET_IN_SECS = TIME_TO_LIVE_IN_SECS
+
+# Maximum number of keys per DEL command, and keys inspected per SCAN command
+DELETE_BATCH_SIZE = 1000
+SCAN_BATCH_SIZE = 1000
+
+namespaced = lambda key: NAMESPACE + key
+
+# Entries of the in-process tier and lookup caches dropped by a process are also dropped by the others,
+# which receive the invalidation through this Redis channel (see listen_invalidations)
+INVALIDATIONS_CHANNEL = u"{0}invalidations".format(NAMESPACES_PREFIX)
+INVALIDATIONS_RECONNECT_INTERVAL_IN_SECS = 5
+
+# Identifies the invalidations published by this process, which were already applied by it
+PROCESS_ID = uuid.uuid4().hex
+
+# Parameters which may change each kind of response. Keys are built from a digest of their
+# (expanded and defaulted) values, so that requests differing only by the order of their arguments,
+# by arguments equal to the defaults or by arguments that don't change the response share the same key
+ROOT_KEY_PARAMS = ("page", "per_page", "do_item_count", "lang", "expand_uri")
+INSTANCE_KEY_PARAMS = ("graph_uri", "class_uri", "lang", "expand_uri", "expand_object_properties", "meta_properties")
+# besides p, o, p1, o1...
+COLLECTION_KEY_PARAMS = ("page", "per_page", "sort_by", "sort_order", "sort_include_empty", "do_item_count",
+                         "direct_instances_only", "lang", "expand_uri", "class_prefix")
+# Collections also link to their pages and items, which are built from the URL of the request
+# (protocol, host, path and query string, see utils.links)
+COLLECTION_LINK_PARAMS = ("_base_url", "_query_string")
+
+KEYS_STATUS_MESSAGE = u"Cache keys | keys: %(keys)d | request variants: %(variants)d | duplicates: %(duplicates)d%%"
+
+FAMILY_STATUS_MESSAGE = u"Cache family %(family)s | hits: %(hits)d | misses: %(misses)d | hit ratio: %(hit_ratio)d%% | " + \
+    u"stores: %(stores)d | purges: %(purges)d | stored bytes: %(stored_bytes)d | builds: %(builds)d | " + \
+    u"build time (p50/p90/p99): %(p50).3fs/%(p90).3fs/%(p99).3fs"
+
+HOT_KEY_STATUS_MESSAGE = u"Hot key %(key)s | lookups: %(lookups)d | error: %(error)d"
+
+# Distinct request URIs which were mapped to each (recently built) key, and their totals
+_key_variants = LRUCache(settings.LOCAL_CACHE_MAX_ITEMS, SOFT_TIME_TO_LIVE_IN_SECS)
+_key_variants_count = {"keys": 0, "variants": 0}
+
+
+def _record_variant(key, query_params):
+    "Count the distinct request URIs mapped to key, which would be duplicated entries if keys were built from them"
+    variants = _key_variants.get(key)
+    if variants is None:
+        variants = set()
+        _key_variants.set(key, variants)
+        _key_variants_count["keys"] += 1
+    uri = query_params.request.uri
+    if uri not in variants:
+        variants.add(uri)
+        _key_variants_count["variants"] += 1
+
+
+def params_digest(query_params, key_params, patterns=()):
+    "Return a digest of the values of key_params (and of the parameters matching patterns) in query_params"
+    items = sorted((name, value) for name, value in query_params.items()
+                   if value is not None and (name in key_params or any(pattern.match(name) for pattern in patterns)))
+    canonical = u"&".join(u"{0}={1}".format(name, value) for name, value in items)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
 # # Root-related
 build_key_for_root_schema = lambda: u"_##json_schema"
 
 
-# @@params##root
+# @@digest##root
 def build_key_for_root(query_params):
-    return u"@@{0}##root".format(query_params.to_string())
+    key = u"@@{0}##root".format(params_digest(query_params, ROOT_KEY_PARAMS))
+    _record_variant(key, query_params)
+    return key
 
 
-# _@@_/_@@instance_uri@@params##instance
+# _@@_/_@@instance_uri@@digest##instance
 def build_instance_key(query_params):
-    return u"_@@_@@{0}@@{1}##instance".format(query_params["instance_uri"], query_params.to_string())
+    key = u"_@@_@@{0}@@{1}##instance".format(query_params["instance_uri"], params_digest(query_params, INSTANCE_KEY_PARAMS))
+    _record_variant(key, query_params)
+    return key
 
 
 # graph_uri@@class_uri@@instance_uri##instance
@@ -33,6 +195,40 @@ def build_instance_key(query_params):
 
 # # Class/collection-related
 build_key_for_class = lambda query_params: u"{0}@@{1}##class".format(query_params["graph_uri"], query_params["class_uri"])
+
+# Collections of a class are cached under its current generation, which is increased whenever
+# one of its instances is written: this invalidates every cached page (and filter) of the class at once
+# graph_uri@@class_uri##generation
+build_key_for_generation = lambda graph_uri, class_uri: u"{0}@@{1}##generation".format(graph_uri, class_uri)
+
+
+# graph_uri@@class_uri@@generation@@digest##collection
+def build_key_for_collection(query_params):
+    if settings.ENABLE_CACHE:
+        generation = get_collection_generation(query_params["graph_uri"], query_params["class_uri"])
+    else:
+        generation = 0
+    link_params = dict(query_params, _base_url=query_params.base_url, _query_string=query_params.request.query)
+    digest = params_digest(link_params, COLLECTION_KEY_PARAMS + COLLECTION_LINK_PARAMS, (PATTERN_P, PATTERN_O))
+    key = u"{0}@@{1}@@{2}@@{3}##collection".format(query_params["graph_uri"],
+                                                    query_params["class_uri"],
+                                                    generation,
+                                                    digest)
+    _record_variant(key, query_params)
+    return key
+
+# # Existence of graphs and classes, cached only when they don't exist
+# graph_uri##graph
+build_key_for_graph_existence = lambda graph_uri: u"{0}##graph".format(graph_uri)
+# graph_uri@@class_uri##class_existence
+build_key_for_class_existence = lambda graph_uri, class_uri: u"{0}@@{1}##class_existence".format(graph_uri, class_uri)
+
+# # Build leases
+build_key_for_lease = lambda key: u"##lease##{0}".format(key)
+
+# # Tags
+# ##tag##type:instance, ##tag##instance:instance_uri, ##tag##graph:graph_uri, ##tag##class:graph_uri@@class_uri
+build_key_for_tag = lambda tag, bucket: u"##tag##{0}##{1}".format(tag, bucket)
 # # graph_uri@@class_uri##collection
 # # graph_uri@@class_uri##json_schema
 
@@ -51,8 +247,60 @@ class CacheError(redis.exceptions.RedisError):
 exceptions = (CacheError, redis.connection.ConnectionError)
 
 
+def redis_nodes():
+    "Return the list of (host, port) of the Redis nodes: settings.REDIS_NODES, or else REDIS_ENDPOINT and REDIS_PORT"
+    if not settings.REDIS_NODES:
+        return [(settings.REDIS_ENDPOINT, settings.REDIS_PORT)]
+    nodes = []
+    for node in settings.REDIS_NODES:
+        host, _sep, port = node.rpartition(":")
+        nodes.append((host, int(port)))
+    return nodes
+
+
+def _connect_nodes(connect_node):
+    "Return the client of the single Redis node, or a ShardedRedis spreading keys over every node"
+    nodes = redis_nodes()
+    if len(nodes) == 1:
+        return connect_node(*nodes[0])
+    return ShardedRedis([(u"{0}:{1}".format(host, port), connect_node(host, port)) for host, port in nodes])
+
+
 def connect():
-    return redis.StrictRedis(host=settings.REDIS_ENDPOINT, port=settings.REDIS_PORT, password=settings.REDIS_PASSWORD, db=0)
+    return _connect_nodes(lambda host, port: redis.StrictRedis(host=host, port=port, password=settings.REDIS_PASSWORD, db=0))
+
+
+def connect_async():
+    return _connect_nodes(lambda host, port: AsyncRedis(
+        host=host, port=port, password=settings.REDIS_PASSWORD, db=0,
+        max_connections=settings.REDIS_MAX_CONNECTIONS, timeout=settings.REDIS_TIMEOUT_IN_SECS))
+
+
+def client():
+    """
+    Return the Redis client to be used by the caller: while handling requests, the non-blocking one,
+    so that the IOLoop isn't stalled by Redis round trips.
+    """
+    if greenlet_available():
+        return async_redis_client
+    return redis_client
+
+
+def shards():
+    "Return the clients of every Redis node (see client()), to which commands on the whole keyspace must be sent"
+    current = client()
+    if isinstance(current, ShardedRedis):
+        return current.shards
+    return [current]
+
+
+def _on_every_shard(function, *params):
+    """
+    Return the list of what function(shard, *params) returns for every Redis node, calling them at once
+    (while handling requests). function should be wrapped by safe_redis, so that a node which fails
+    returns None instead of failing the others.
+    """
+    return greenlet_run_many([lambda shard=shard: function(shard, *params) for shard in shards()])
 
 
 def current_time():
@@ -63,11 +311,15 @@ def current_time():
     return formatdate(timeval=None, localtime=True)
 
 
-def _fresh_retrieve(function, params):
+def _fresh_retrieve(function, params, key=None):
+    "Build the response of function. If the key it will be cached under is given, the time taken is recorded"
+    start = time.time()
     if params is not None:
         body = function(params)
     else:
         body = function()
+    if key is not None:
+        cache_stats.record_build(key, time.time() - start)
 
     if body is None:
         return None
@@ -81,26 +333,217 @@ def _fresh_retrieve(function, params):
     return fresh_json
 
 
-def memoize(params, function, function_arguments=None, key=False):
+def serialize_body(body):
+    "Serialize a response body exactly as RequestHandler.write does"
+    return json_encode(body)
+
+
+def compute_etag(serialized_body):
+    "Return the strong ETag of a response, given its serialized body"
+    return '"{0}"'.format(hashlib.sha1(serialized_body).hexdigest())
+
+
+def encode_response(response):
+    """
+    Return the value to be cached for a response ({'meta': ..., 'body': ...}), see UNCOMPRESSED_HEADER.
+    The ETag of the response is computed along, and added to its meta.
+    """
+    serialized_body = serialize_body(response['body'])
+    response['meta']['etag'] = compute_etag(serialized_body)
+    data = ujson.dumps(response['meta']) + "\n" + serialized_body
+    if len(data) >= COMPRESSION_MIN_BYTES:
+        return COMPRESSED_HEADER + zlib.compress(data, COMPRESSION_LEVEL)
+    return UNCOMPRESSED_HEADER + data
+
+
+def decode_response(value, serialized=False):
+    """
+    Return the response cached as value (None if it is MISSING_VALUE). If serialized is True, its body
+    isn't parsed: the response has the key serialized_body instead of body.
+    Values without a known header (e.g. given to create) are parsed as plain JSON.
+    """
+    if value == MISSING_VALUE:
+        return None
+    header, data = value[:1], value[1:]
+    if header == COMPRESSED_HEADER:
+        data = zlib.decompress(data)
+    elif header != UNCOMPRESSED_HEADER:
+        return ujson.loads(value)
+    meta, _sep, serialized_body = data.partition("\n")
+    response = {"meta": ujson.loads(meta)}
+    if serialized:
+        response["serialized_body"] = serialized_body
+    else:
+        response["body"] = ujson.loads(serialized_body)
+    return response
+
+
+def _serialize(response):
+    "Replace the body of response by its serialization, as memoize(serialized=True) returns it"
+    response["serialized_body"] = serialize_body(response.pop("body"))
+    return response
+
+
+def _retrieve_from_tiers(key, serialized):
+    """
+    Return a tuple with the cached json of key and the tier it was found at, or (None, None) if it isn't cached.
+    The json is None if the response is known to be missing.
+    Values found at Redis are also kept at the local tier, except MISSING_VALUE.
+    """
+    value = local_cache.get(key)
+    tier = LOCAL_TIER
+    if value is None:
+        value = retrieve_value(key)
+        if not value:
+            return None, None
+        if value != MISSING_VALUE:
+            local_cache.set(key, value)
+        tier = REDIS_TIER
+    return decode_response(value, serialized), tier
+
+
+def _store_fresh(key, fresh_json):
+    "Cache fresh_json at both tiers, recording until when it is considered fresh"
+    fresh_json['meta']['fresh_until'] = time.time() + SOFT_TIME_TO_LIVE_IN_SECS
+    value = encode_response(fresh_json)
+    create(key, value)
+    local_cache.set(key, value)
+    _key_hits.delete(key)
+    cache_stats.record_store(key, len(value))
+
+
+def _wait_for_build(key):
+    """
+    Poll Redis until key is cached by the process building it, returning its value
+    (or None, if it takes too long or the lease is released without caching it, because the build failed)
+    """
+    deadline = time.time() + BUILD_WAIT_IN_SECS
+    while time.time() < deadline:
+        greenlet_sleep(BUILD_POLL_INTERVAL_IN_SECS)
+        value = retrieve_value(key)
+        if value:
+            return value
+        if is_lease_held(key) is False:
+            # the value is cached before the lease is released, so it may have been cached meanwhile
+            return retrieve_value(key) or None
+    return None
+
+
+def _build(key, function, function_arguments, serialized):
+    """
+    Build and cache the json of key, if this process gets its build lease. Otherwise, wait for the
+    process holding the lease to cache it, and only build it if that doesn't happen in time.
+    Return a tuple with the json (or None) and its cache status: MISS if it was built, HIT otherwise.
+    """
+    token = acquire_lease(key)
+    if token is False:
+        value = _wait_for_build(key)
+        if value is not None:
+            return decode_response(value, serialized), 'HIT'
+    try:
+        fresh_json = _fresh_retrieve(function, function_arguments, key)
+        if fresh_json is not None:
+            _store_fresh(key, fresh_json)
+            if serialized:
+                _serialize(fresh_json)
+        else:
+            create_missing(key)
+        return fresh_json, 'MISS'
+    finally:
+        if token:
+            release_lease(key, token)
+
+
+def _rebuild(key, function, function_arguments):
+    token = acquire_lease(key)
+    try:
+        # otherwise, another process is already rebuilding it
+        if token is not False:
+            fresh_json = _fresh_retrieve(function, function_arguments, key)
+            if fresh_json is not None:
+                _store_fresh(key, fresh_json)
+            else:
+                create_missing(key)
+    except Exception:
+        log.logger.error(_(u"Cache: failed to rebuild {0} in background: {1}").format(key, traceback.format_exc()))
+    finally:
+        _refreshing.discard(key)
+        if token:
+            release_lease(key, token)
+
+
+def _schedule_rebuild(key, function, function_arguments):
+    """
+    Rebuild the cached response of key in a new greenlet, started by the IOLoop,
+    unless it is already being rebuilt by this process.
+    """
+    if key in _refreshing:
+        return
+    _refreshing.add(key)
+    if greenlet_available():
+        rebuilder = greenlet.greenlet(lambda: _rebuild(key, function, function_arguments),
+                                      parent=greenlet.getcurrent().parent)
+        greenlet_get_ioloop().add_callback(rebuilder.switch)
+    else:
+        _rebuild(key, function, function_arguments)
+
+
+def _needs_rebuild(key, cached_json):
+    """
+    Return a tuple (stale, rebuild): if the cached response is stale, and if it should be rebuilt.
+    Stale responses are always rebuilt, hot ones are rebuilt shortly before they become stale.
+    Responses cached by previous releases have no soft expiry.
+    """
+    fresh_until = cached_json['meta'].get('fresh_until')
+    if fresh_until is None:
+        return False, False
+    remaining = fresh_until - time.time()
+    if remaining <= 0:
+        return True, True
+    hits = _key_hits.get(key, 0) + 1
+    _key_hits.set(key, hits)
+    return False, remaining < REFRESH_AHEAD_IN_SECS and hits >= HOT_KEY_MIN_HITS
+
+
+def memoize(params, function, function_arguments=None, key=False, serialized=False):
+    """
+    Return the response ({"meta": ..., "body": ...}) of function, cached under key.
+    Callers that write the body as it is (see serialize_body) should pass serialized=True:
+    the response then has its body already serialized, under serialized_body, and cache hits don't parse it.
+    If function returns None, None is also cached, for settings.CACHE_NEGATIVE_TTL_IN_SECS.
+    """
     if settings.ENABLE_CACHE:
         key = key or params.request.uri
-        cached_json = retrieve(key)
-        if (cached_json is None):
-            fresh_json = _fresh_retrieve(function, function_arguments)
+        cached_json, tier = _retrieve_from_tiers(key, serialized)
+        if tier is None:
+            _tier_hits["misses"] += 1
+            cache_stats.record_miss(key)
+            fresh_json, status = _build(key, function, function_arguments, serialized)
             if fresh_json is not None:
-                value = ujson.dumps(fresh_json)
-                create(key, value)
-                fresh_json['meta']['cache'] = 'MISS'
+                fresh_json['meta']['cache'] = status
                 return fresh_json
             else:
                 return None
+        elif cached_json is None:
+            # known to be missing
+            _tier_hits[tier] += 1
+            cache_stats.record_hit(key)
+            return None
         else:
-            cached_json['meta']['cache'] = 'HIT'
+            _tier_hits[tier] += 1
+            cache_stats.record_hit(key)
+            stale, rebuild = _needs_rebuild(key, cached_json)
+            if rebuild:
+                _schedule_rebuild(key, function, function_arguments)
+            cached_json['meta']['cache'] = 'STALE' if stale else 'HIT'
+            cached_json['meta']['cache_tier'] = tier
             return cached_json
     else:
         json_object = _fresh_retrieve(function, function_arguments)
         if json_object is not None:
             json_object['meta']['cache'] = 'MISS'
+            if serialized:
+                _serialize(json_object)
         return json_object
 
 
@@ -114,6 +557,7 @@ def safe_redis(function):
             try:
                 global redis_client
                 redis_client = connect()
+                async_redis_client.disconnect()
                 response = function(*params)
             except exceptions:
                 log.logger.error(_(u"CacheError: Second try returned {0}").format(traceback.format_exc()))
@@ -123,13 +567,194 @@ def safe_redis(function):
     return wrapper
 
 
+def _tags_of(key):
+    """
+    Return the tags of a cache key, by which it is purged (see purge_tag), according to its kind:
+     - instance keys are tagged with their kind (type:instance) and the instance URI
+     - root keys are tagged with their kind (type:root)
+     - class (and class existence) and collection keys are tagged with their graph and class
+     - graph existence keys are tagged with their graph
+    Other keys aren't tagged.
+    """
+    content, _sep, kind = key.rpartition("##")
+    tags = []
+    if kind == "instance":
+        tags.append(u"type:instance")
+        if content.startswith("_@@_@@"):
+            instance_uri = content[len("_@@_@@"):].rsplit("@@", 1)[0]
+            tags.append(u"instance:{0}".format(instance_uri))
+    elif kind == "root":
+        tags.append(u"type:root")
+    elif kind in ("class", "class_existence", "collection"):
+        graph_uri, _sep, rest = content.partition("@@")
+        tags.append(u"graph:{0}".format(graph_uri))
+        tags.append(u"class:{0}@@{1}".format(graph_uri, rest.split("@@", 1)[0]))
+    elif kind == "graph":
+        tags.append(u"graph:{0}".format(content))
+    return tags
+
+
+def _store(key, value, time_to_live=TIME_TO_LIVE_IN_SECS):
+    "Set the key and add it to the sets of its tags, in a single round trip"
+    pipeline = client().pipeline(transaction=False)
+    pipeline.setex(namespaced(key), time_to_live, value)
+    bucket = _tag_bucket()
+    for tag in _tags_of(key):
+        tag_key = namespaced(build_key_for_tag(tag, bucket))
+        pipeline.sadd(tag_key, namespaced(key))
+        # the set lives as long as its most recent member
+        pipeline.expire(tag_key, TIME_TO_LIVE_IN_SECS)
+    return pipeline.execute()[0]
+
+
+def _tag_bucket():
+    "Return the bucket of the tag sets keys stored now are added to"
+    return int(time.time() // TAG_BUCKET_IN_SECS)
+
+
+def _tag_keys(tag):
+    "Return the (namespaced) sets of tag which may have keys that didn't expire: the current and the previous bucket"
+    bucket = _tag_bucket()
+    return [namespaced(build_key_for_tag(tag, bucket)), namespaced(build_key_for_tag(tag, bucket - 1))]
+
+
+@safe_redis
+def _scan_shard(shard, pattern):
+    found = set()
+    cursor = "0"
+    while True:
+        cursor, batch = shard.execute_command("SCAN", cursor, "MATCH", pattern, "COUNT", SCAN_BATCH_SIZE)
+        found.update(batch)
+        if int(cursor) == 0:
+            return found
+
+
+def _scan(pattern):
+    "Return the keys matching the glob pattern at every Redis node (but the ones which failed)"
+    found = set()
+    for shard_keys in _on_every_shard(_scan_shard, pattern):
+        found.update(shard_keys or [])
+    return list(found)
+
+
+def _scan_keys(pattern):
+    """
+    Return the (namespaced) keys matching the glob pattern, like keys(), but using SCAN,
+    which doesn't block Redis while the whole keyspace is inspected.
+    """
+    return _scan(u"{0}{1}*".format(NAMESPACE, pattern))
+
+
+@safe_redis
+def _tagged_keys(tag):
+    "Return the (namespaced) keys with the given tag"
+    keys_with_tag = set()
+    for tag_key in _tag_keys(tag):
+        keys_with_tag.update(client().smembers(tag_key))
+    return list(keys_with_tag)
+
+
+@safe_redis
+def _delete_many(keys_to_delete):
+    "Delete the keys in batches, sent to Redis in a single round trip. Return the number of keys deleted"
+    if not keys_to_delete:
+        return 0
+    pipeline = client().pipeline(transaction=False)
+    for start in range(0, len(keys_to_delete), DELETE_BATCH_SIZE):
+        pipeline.delete(*keys_to_delete[start:start + DELETE_BATCH_SIZE])
+    return sum(pipeline.execute())
+
+
+def _purge_local(pattern):
+    # Same semantics as the glob pattern used by keys()
+    pattern = u"{0}*".format(pattern)
+    local_cache.delete_matching(lambda key: fnmatch.fnmatchcase(key, pattern))
+
+
+def _clear_local():
+    "Forget everything kept by this process about the cached resources"
+    local_cache.clear()
+    sparql.clear_lookup_caches()
+    try:
+        sparql.load_label_properties()
+    except Exception:
+        # the subscription to invalidations must survive the triplestore being down
+        log.logger.error(_(u"Cache: failed reloading label properties: {0}").format(traceback.format_exc()))
+
+
+# Invalidations which can be published to the other processes, by name
+_invalidations = {
+    "purge_local": _purge_local,
+    "delete_local": lambda key: local_cache.delete(key),
+    "forget_instance": lambda instance_uri: sparql.forget_instance(instance_uri),
+    "forget_class": lambda class_uri: sparql.forget_class(class_uri),
+    "clear_local": _clear_local
+}
+
+
+@safe_redis
+def _publish_invalidation(message):
+    return client().publish(INVALIDATIONS_CHANNEL, message)
+
+
+def _invalidate(action, *arguments):
+    "Apply the invalidation to this process and publish it to the others"
+    _invalidations[action](*arguments)
+    if settings.ENABLE_CACHE:
+        _publish_invalidation(ujson.dumps([PROCESS_ID, action, arguments]))
+
+
+def apply_invalidation(message):
+    "Apply an invalidation published by another process (see _invalidate)"
+    try:
+        process_id, action, arguments = ujson.loads(message)
+        if process_id != PROCESS_ID:
+            _invalidations[action](*arguments)
+    except Exception:
+        log.logger.error(_(u"Cache: failed to apply invalidation {0}: {1}").format(message, traceback.format_exc()))
+
+
+def listen_invalidations():
+    """
+    Apply the invalidations published by the other processes, as long as the server runs.
+    Must run in a greenlet started by the IOLoop (see server.main). Invalidations published while
+    this process was disconnected from Redis are lost, so everything kept locally is dropped on reconnection.
+    """
+    state = {"subscribed": False}
+
+    def on_subscribed():
+        if state["subscribed"]:
+            _clear_local()
+        state["subscribed"] = True
+
+    while True:
+        try:
+            async_redis_client.subscribe(INVALIDATIONS_CHANNEL, apply_invalidation, on_subscribed)
+        except Exception:
+            log.logger.error(_(u"Cache: lost subscription to invalidations: {0}").format(traceback.format_exc()))
+        greenlet_sleep(INVALIDATIONS_RECONNECT_INTERVAL_IN_SECS)
+
+
+def purge_tag(tag, pattern):
+    """
+    Delete the keys with the given tag.
+    pattern must match the same keys: it is used to purge the in-process tiers of every process.
+    """
+    _invalidate("purge_local", pattern)
+    keys_with_tag = _tagged_keys(tag) or []
+    log.logger.debug(_(u"Cache: key(s) to be deleted: {0}").format(keys_with_tag))
+    _delete_many(keys_with_tag + _tag_keys(tag))
+    cache_stats.record_purges(keys_with_tag)
+    log.logger.info(_(u"Cache: purged {0} key(s), tagged as {1}").format(len(keys_with_tag), tag))
+
+
 def purge(pattern):
-    keys_with_pattern = keys(pattern) or []
+    _invalidate("purge_local", pattern)
+    keys_with_pattern = _scan_keys(pattern) or []
     log.logger.debug(_(u"Cache: key(s) to be deleted: {0}").format(keys_with_pattern))
     log_details = _(u"{0} key(s), matching the pattern: {1}").format(len(keys_with_pattern), pattern)
-    response = 1
-    for key in keys_with_pattern:
-        response *= delete(key)
+    response = _delete_many(keys_with_pattern)
+    cache_stats.record_purges(keys_with_pattern)
 
     if response and keys_with_pattern:
         log.logger.info(_(u"Cache: purged with success {0}").format(log_details))
@@ -141,11 +766,13 @@ def purge(pattern):
 
 @safe_redis
 def update_if_present(key, value):
-    response = redis_client.get(key)
+    _invalidate("delete_local", key)
+    response = client().get(namespaced(key))
     if response:
-        value = ujson.dumps(_fresh_retrieve(lambda: value, None))
-        if value is not None:
-            result = redis_client.setex(key, TIME_TO_LIVE_IN_SECS, value)
+        fresh_json = _fresh_retrieve(lambda: value, None)
+        if fresh_json is not None:
+            fresh_json['meta']['fresh_until'] = time.time() + SOFT_TIME_TO_LIVE_IN_SECS
+            result = _store(key, encode_response(fresh_json))
         else:
             result = None
     else:
@@ -153,52 +780,210 @@ def update_if_present(key, value):
     return result
 
 
+@safe_redis
+def acquire_lease(key, time_to_live=BUILD_LEASE_TIME_IN_SECS):
+    """
+    Try to get the build lease of key, for time_to_live seconds.
+    Return the token needed to release it, False if another process holds it,
+    or None if Redis couldn't be reached (see safe_redis).
+    """
+    token = uuid.uuid4().hex
+    if client().set(namespaced(build_key_for_lease(key)), token, ex=time_to_live, nx=True):
+        return token
+    return False
+
+
+@safe_redis
+def renew_lease(key, token, time_to_live):
+    "Make the lease of key, if still held with token, expire time_to_live seconds from now. Return whether it was held"
+    return bool(client().eval(RENEW_LEASE_SCRIPT, 1, namespaced(build_key_for_lease(key)), token, time_to_live))
+
+
+@safe_redis
+def is_lease_held(key):
+    return bool(client().get(namespaced(build_key_for_lease(key))))
+
+
+@safe_redis
+def release_lease(key, token):
+    return client().eval(RELEASE_LEASE_SCRIPT, 1, namespaced(build_key_for_lease(key)), token)
+
+
+@safe_redis
+def get_collection_generation(graph_uri, class_uri):
+    return int(client().get(namespaced(build_key_for_generation(graph_uri, class_uri))) or 0)
+
+
+@safe_redis
+def bump_collection_generation(graph_uri, class_uri):
+    "Invalidate the cached collections of a class (see build_key_for_generation)"
+    return client().incr(namespaced(build_key_for_generation(graph_uri, class_uri)))
+
+
 @safe_redis
 def create(key, value):
     if value is not None:
-        return redis_client.setex(key, TIME_TO_LIVE_IN_SECS, value)
+        return _store(key, value)
+
+
+@safe_redis
+def create_missing(key):
+    "Remember, for settings.CACHE_NEGATIVE_TTL_IN_SECS, that the resource cached under key doesn't exist"
+    return _store(key, MISSING_VALUE, settings.CACHE_NEGATIVE_TTL_IN_SECS)
+
+
+def memoize_existence(key, function, function_arguments):
+    """
+    Return function(function_arguments), which tells if a resource exists.
+    If it doesn't, this is cached under key (see create_missing), and function isn't called again meanwhile.
+    """
+    if not settings.ENABLE_CACHE:
+        return function(function_arguments)
+    if retrieve_value(key) == MISSING_VALUE:
+        return False
+    exists = function(function_arguments)
+    if not exists:
+        create_missing(key)
+    return exists
 
 
 @safe_redis
+def retrieve_value(key):
+    "Return the value cached for key, as it is stored (see encode_response)"
+    return client().get(namespaced(key))
+
+
 def retrieve(key):
-    response = redis_client.get(key)
+    response = retrieve_value(key)
     if response:
-        response = ujson.loads(response)
+        response = decode_response(response)
     return response
 
 
 @safe_redis
 def delete(keys):
-    return redis_client.delete(keys)
+    _invalidate("delete_local", keys)
+    cache_stats.record_purges([keys])
+    return client().delete(namespaced(keys))
 
 
 @safe_redis
+def _flush_shard(shard):
+    return shard.flushall()
+
+
 def flushall():
-    return redis_client.flushall()
+    "Flush every Redis node. Return whether all of them were flushed"
+    local_cache.clear()
+    return all(_on_every_shard(_flush_shard))
 
 
 @safe_redis
+def _keys_of_shard(shard, pattern):
+    return shard.keys(pattern)
+
+
 def keys(pattern):
-    pattern = u"{0}*".format(pattern)
-    return redis_client.keys(pattern)
+    "Return the cached keys (without namespace) starting with the glob pattern, at every Redis node"
+    pattern = u"{0}{1}*".format(NAMESPACE, pattern)
+    namespace_length = len(NAMESPACE.encode("utf-8"))
+    return [key[namespace_length:] for shard_keys in _on_every_shard(_keys_of_shard, pattern)
+            for key in shard_keys or []]
+
+
+@safe_redis
+def beat_namespace():
+    "Record that NAMESPACE is used by a running process, for the next NAMESPACE_IDLE_GRACE_IN_SECS"
+    return client().setex(namespaced(NAMESPACE_HEARTBEAT), NAMESPACE_IDLE_GRACE_IN_SECS, int(time.time()))
+
+
+def keep_namespace_alive():
+    "Refresh the heartbeat of NAMESPACE for as long as this process runs, so that other releases don't delete it"
+    while True:
+        beat_namespace()
+        greenlet_sleep(NAMESPACE_HEARTBEAT_INTERVAL_IN_SECS)
+
+
+@safe_redis
+def _is_namespace_alive(namespace):
+    return bool(client().get(namespace + NAMESPACE_HEARTBEAT.encode("utf-8")))
+
+
+def _namespace_of(key):
+    "Return the namespace of a (namespaced) key, e.g. brainiak:2.7.3:1: for brainiak:2.7.3:1:_##json_schema"
+    return ":".join(key.split(":", 3)[:3]) + ":"
+
+
+def delete_old_namespaces():
+    """
+    Delete the keys cached by other releases (or cache format versions), instead of waiting for them to expire.
+    Namespaces whose heartbeat didn't expire are kept, since they are still used (e.g. during a rolling
+    deploy, or by canaries of another release): they are deleted by a later call, or expire.
+    Only the process holding the lease NAMESPACES_GC_LEASE does it.
+    """
+    token = acquire_lease(NAMESPACES_GC_LEASE)
+    if not token:
+        return
+    try:
+        current_namespace = NAMESPACE.encode("utf-8")
+        keys_by_namespace = {}
+        for key in _scan(u"{0}*".format(NAMESPACES_PREFIX)) or []:
+            if not key.startswith(current_namespace):
+                keys_by_namespace.setdefault(_namespace_of(key), []).append(key)
+        old_keys = []
+        for namespace, keys in keys_by_namespace.items():
+            # if the heartbeat can't be read (None), the namespace is kept as well
+            if _is_namespace_alive(namespace) is False:
+                old_keys.extend(keys)
+            else:
+                log.logger.info(_(u"Cache: namespace {0} is still used, it won't be deleted").format(namespace))
+        _delete_many(old_keys)
+        log.logger.info(_(u"Cache: deleted {0} key(s) of old namespaces").format(len(old_keys)))
+    finally:
+        release_lease(NAMESPACES_GC_LEASE, token)
 
 
 @safe_redis
+def _ping_shard(shard):
+    return shard.ping()
+
+
 def ping():
-    return redis_client.ping()
+    "Return whether every Redis node answered"
+    return all(_on_every_shard(_ping_shard))
 
 
 @safe_redis
+def _info_of_shard(shard):
+    return shard.info()
+
+
 def info():
-    return redis_client.info()
+    "Return the INFO of every Redis node (None for the ones which failed)"
+    return _on_every_shard(_info_of_shard)
 
 
 def get_usage_message():
+    "Describe the usage of the Redis node, or of each one, when the cache is sharded (see settings.REDIS_NODES)"
+    current = client()
+    if not isinstance(current, ShardedRedis):
+        return _get_shard_usage_message(current)
+    messages = []
+    for name, shard in zip(current.names, current.shards):
+        try:
+            message = _get_shard_usage_message(shard)
+        except exceptions:
+            message = u"FAILED | {0}".format(traceback.format_exc())
+        messages.append(u"Node: {0}<br>{1}".format(name, message))
+    return u"<br><br>".join(messages)
+
+
+def _get_shard_usage_message(shard):
     msg_template = "Version: %(redis_version)s | PID: %(process_id)s | Role: %(role)s<br>" + \
         "Memory used: %(used_memory_human)s | Peak: %(used_memory_peak_human)s<br>" + \
         "Number of keys: %(number_of_keys)s | Hit ratio: %(hit_ratio)s"
 
-    redis_info = redis_client.info()
+    redis_info = shard.info()
 
     if int(redis_info["keyspace_hits"]) == 0 and int(redis_info["keyspace_misses"]) == 0:
         redis_info["hit_ratio"] = "No hits"
@@ -206,17 +991,49 @@ def get_usage_message():
         redis_info["hit_ratio"] = float(redis_info["keyspace_hits"]) / \
             (float(redis_info["keyspace_misses"]) + float(redis_info["keyspace_hits"]))
 
-    keyspace = redis_client.info("keyspace")
+    keyspace = shard.info("keyspace")
     redis_info["number_of_keys"] = keyspace["db0"]["keys"] if keyspace and "db0" in keyspace else 0
 
     return msg_template % redis_info
 
 
+def tiers_status_message():
+    "Describe how many memoized responses were found at each tier"
+    return TIERS_STATUS_MESSAGE % dict(_tier_hits, items=len(local_cache), max_items=local_cache.max_size)
+
+
+def stats_status():
+    """
+    Return a dict with the hits, misses, stores, purges, stored bytes and build times of each
+    key family (see cache_stats), and the estimated hot keys.
+    """
+    return cache_stats.report()
+
+
+def stats_status_message():
+    "Describe the statistics of each key family, and the estimated hot keys (see stats_status)"
+    report = stats_status()
+    lines = []
+    for family, stats in sorted(report["families"].items()):
+        params = dict(stats, family=family, hit_ratio=100 * stats["hit_ratio"], stored_bytes=stats["stored_bytes"]["total"])
+        params.update(stats["build_time_in_secs"])
+        lines.append(FAMILY_STATUS_MESSAGE % params)
+    lines.extend(HOT_KEY_STATUS_MESSAGE % hot_key for hot_key in report["hot_keys"])
+    return u"<br>".join(lines) if lines else u"There are no cache statistics"
+
+
+def keys_status_message():
+    "Describe how many distinct request URIs were mapped to the same keys"
+    variants = _key_variants_count["variants"]
+    duplicates = 100 * (variants - _key_variants_count["keys"]) / variants if variants else 0
+    return KEYS_STATUS_MESSAGE % dict(_key_variants_count, duplicates=duplicates)
+
+
 def status_message():
     params = {
         #"password": md5.new(str(settings.REDIS_PASSWORD)).digest(),  # do not cast to unicode
         "password": settings.REDIS_PASSWORD,
-        "endpoint": "{0}:{1}".format(settings.REDIS_ENDPOINT, settings.REDIS_PORT),
+        "endpoint": ",".join("{0}:{1}".format(host, port) for host, port in redis_nodes()),
     }
     failure_msg = "Redis connection authenticated [:%(password)s] | FAILED | %(endpoint)s | %(error)s"
     success_msg = "Redis connection authenticated [:%(password)s] | SUCCEED | %(endpoint)s <br><br>Usage <br>%(usage)s<br>"
@@ -240,31 +1057,63 @@ def status_message():
 def purge_an_instance(instance_uri):
     pattern = u"_@@_@@{0}@@*##instance".format(instance_uri)
     log.logger.debug(_(u"CacheDebug: Delete cache keys related to pattern {0}".format(pattern)))
-    purge(pattern)
+    purge_tag(u"instance:{0}".format(instance_uri), pattern)
+    _invalidate("forget_instance", instance_uri)
+
+
+def purge_written_instance(query_params, superclasses=()):
+    """
+    Purge what is invalidated by creating, editing or deleting an instance: the instance itself
+    (even if it was cached as missing), the collections of its class and of its superclasses
+    (which list it too, unless direct_instances_only=1), and its graph if it was missing.
+    """
+    purge_an_instance(query_params["instance_uri"])
+    graph_uri = query_params["graph_uri"]
+    class_uri = query_params["class_uri"]
+    bump_collection_generation(graph_uri, class_uri)
+    for superclass_uri in superclasses:
+        if superclass_uri != class_uri:
+            bump_collection_generation(graph_uri, superclass_uri)
+    delete(build_key_for_graph_existence(graph_uri))
 
 
 def purge_all_instances():
-    purge("*##instance")
+    purge_tag(u"type:instance", "*##instance")
 
 
 def purge_root(recursive=False):
     if recursive:
         flushall()
+        _invalidate("clear_local")
     else:
-        purge("*##root")
+        purge_tag(u"type:root", "*##root")
 
 
 def purge_by_path(path, recursive):
     purge_all = recursive and ('##root' in path)
     if purge_all:
         flushall()
+        _invalidate("clear_local")
     elif recursive:
         relative_path = path.rsplit("##")[0]
-        purge(relative_path)
+        graph_uri, _sep, class_uri = relative_path.partition("@@")
+        if class_uri:
+            purge_tag(u"class:{0}".format(relative_path), u"{0}*".format(relative_path))
+            # collections are built according to the schema of their class
+            bump_collection_generation(graph_uri, class_uri)
+            _invalidate("forget_class", class_uri)
+        else:
+            purge_tag(u"graph:{0}".format(graph_uri), u"{0}*".format(graph_uri))
+            delete(path)
         purge_all_instances()
     else:
         delete(path)
+        content, _sep, kind = path.rpartition("##")
+        if kind == "class":
+            # the class may have been moved to another graph
+            _invalidate("forget_class", content.partition("@@")[2])
 
 
-# Singleton
+# Singletons
 redis_client = connect()
+async_redis_client = connect_async()
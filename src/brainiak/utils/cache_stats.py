@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import random
+
+from brainiak.utils.metrics import LatencyHistogram, PERCENTILES
+
+
+__doc__ = """
+In-process statistics of the cache, aggregated by key family: the kind of response cached
+under a key, given by its suffix (e.g. "class", "instance", "root" and "collection", see cache.build_key_for_*).
+
+Hot keys are estimated with the Space-Saving algorithm (Metwally et al.), which keeps at most
+HOT_KEYS_CAPACITY counters, whatever the number of distinct keys. To keep its cost low,
+only a sample (HOT_KEYS_SAMPLE_RATE) of the lookups are counted.
+"""
+
+HOT_KEYS_CAPACITY = 100
+HOT_KEYS_REPORTED = 20
+HOT_KEYS_SAMPLE_RATE = 0.1
+
+_families = {}
+
+
+def family_of(key):
+    "Return the family of a (possibly namespaced) key: its suffix, after the last ##"
+    return key.rsplit("##", 1)[-1] if "##" in key else u"other"
+
+
+class KeyFamilyStats(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.purges = 0
+        self.stored_bytes = 0
+        self.max_stored_bytes = 0
+        self.build_time = LatencyHistogram()
+
+    def report(self):
+        lookups = self.hits + self.misses
+        build_time = {"mean": self.build_time.mean, "max": self.build_time.max}
+        for percentile in PERCENTILES:
+            build_time["p{0}".format(percentile)] = self.build_time.percentile(percentile)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": float(self.hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "purges": self.purges,
+            "stored_bytes": {
+                "total": self.stored_bytes,
+                "mean": self.stored_bytes / self.stores if self.stores else 0,
+                "max": self.max_stored_bytes
+            },
+            "builds": self.build_time.count,
+            "build_time_in_secs": build_time
+        }
+
+
+class SpaceSaving(object):
+    """
+    Approximate counts of the most frequent items of a stream. Counts are overestimated by
+    at most their error, and any item more frequent than 1/capacity of the stream is kept.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # item => [count, error]
+        self.counters = {}
+
+    def add(self, item):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += 1
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [1, 0]
+        else:
+            # the least frequent item is replaced, and its count inherited as the error of the new one
+            least_frequent = min(self.counters, key=lambda other: self.counters[other][0])
+            count = self.counters.pop(least_frequent)[0]
+            self.counters[item] = [count + 1, count]
+
+    def top(self, limit):
+        "Return the list of (item, count, error) of the limit most frequent items"
+        items = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)[:limit]
+        return [(item, count, error) for item, (count, error) in items]
+
+
+_hot_keys = SpaceSaving(HOT_KEYS_CAPACITY)
+
+
+def get_family(key):
+    name = family_of(key)
+    family = _families.get(name)
+    if family is None:
+        family = KeyFamilyStats(name)
+        _families[name] = family
+    return family
+
+
+def _sample_lookup(key):
+    if random.random() < HOT_KEYS_SAMPLE_RATE:
+        _hot_keys.add(key)
+
+
+def record_hit(key):
+    get_family(key).hits += 1
+    _sample_lookup(key)
+
+
+def record_miss(key):
+    get_family(key).misses += 1
+    _sample_lookup(key)
+
+
+def record_store(key, stored_bytes):
+    family = get_family(key)
+    family.stores += 1
+    family.stored_bytes += stored_bytes
+    family.max_stored_bytes = max(family.max_stored_bytes, stored_bytes)
+
+
+def record_build(key, seconds):
+    get_family(key).build_time.record(seconds)
+
+
+def record_purges(keys):
+    for key in keys:
+        get_family(key).purges += 1
+
+
+def report():
+    "Return a dict with the statistics of each key family, and the estimated hot keys"
+    return {
+        "families": dict((name, family.report()) for name, family in _families.items()),
+        "hot_keys": [{"key": key, "lookups": int(count / HOT_KEYS_SAMPLE_RATE), "error": int(error / HOT_KEYS_SAMPLE_RATE)}
+                     for key, count, error in _hot_keys.top(HOT_KEYS_REPORTED)],
+        "hot_keys_sample_rate": HOT_KEYS_SAMPLE_RATE
+    }
+
+
+def reset():
+    _families.clear()
+    _hot_keys.counters.clear()
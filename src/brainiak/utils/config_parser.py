@@ -1,16 +1,63 @@
+import os
+from ConfigParser import ConfigParser
+
 from brainiak import settings
-from ConfigParser import ConfigParser, NoSectionError
+
+
+__doc__ = """
+Access to the sections of triplestore.ini (one per client id).
+
+Each file is parsed once and kept in memory. It is parsed again only when its
+modification time changes, or when reload() is called (the server calls it on SIGHUP).
+"""
 
 
 class ConfigParserNoSectionError(Exception):
     pass
 
 
-def parse_section(filename=settings.TRIPLESTORE_CONFIG_FILEPATH, section="default"):
+# filename => (modification time, {section name => section dict})
+_registries = {}
+
+
+def _modification_time(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+def _read_sections(filename):
     parser = ConfigParser()
     parser.read(filename)
+    return dict((section, dict(parser.items(section))) for section in parser.sections())
+
+
+def _load(filename):
+    # The registry entry is replaced at once, so readers never see a partially parsed file
+    registry = (_modification_time(filename), _read_sections(filename))
+    _registries[filename] = registry
+    return registry
+
+
+def get_sections(filename=settings.TRIPLESTORE_CONFIG_FILEPATH):
+    "Return a dict mapping section names to their configuration, parsing the file only if it changed"
+    registry = _registries.get(filename)
+    if registry is None or registry[0] != _modification_time(filename):
+        registry = _load(filename)
+    return registry[1]
+
+
+def reload():
+    "Parse again all configuration files read so far"
+    for filename in list(_registries):
+        _load(filename)
+
+
+def parse_section(filename=settings.TRIPLESTORE_CONFIG_FILEPATH, section="default"):
     try:
-        config_dict = dict(parser.items(section))
-    except NoSectionError:
+        config_dict = get_sections(filename)[section]
+    except KeyError:
         raise ConfigParserNoSectionError(u"There is no {0} section in the file {1}".format(section, filename))
-    return config_dict
+    # callers add and remove keys from the section they get (e.g. to build requests)
+    return dict(config_dict)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pycurl
+from tornado.httpclient import AsyncHTTPClient
+from tornado.web import HTTPError
+
+from brainiak import settings
+from brainiak.greenlet_tornado import greenlet_get_ioloop
+from brainiak.utils.i18n import _
+
+
+__doc__ = """
+Keep-alive connection pools to the triplestore, one per triplestore.ini section.
+
+Each pool owns a dedicated AsyncHTTPClient (cURL), so authenticated connections
+are reused across requests instead of being shared by every backend Brainiak talks to.
+
+The following (optional) keys of a triplestore.ini section configure its pool:
+- pool_size: maximum number of simultaneous connections (settings.TRIPLESTORE_POOL_SIZE)
+- pool_idle_timeout: seconds an idle pool keeps its connections (settings.TRIPLESTORE_POOL_IDLE_TIMEOUT_IN_SECS)
+- pool_max_queued: requests waiting for a connection before new ones are refused (settings.TRIPLESTORE_POOL_MAX_QUEUED)
+- connect_timeout: seconds to establish a new connection (settings.TRIPLESTORE_CONNECT_TIMEOUT_IN_SECS)
+"""
+
+POOL_CONFIG_KEYS = ("pool_size", "pool_idle_timeout", "pool_max_queued", "connect_timeout")
+
+POOL_SATURATED_MESSAGE = u"Connection pool to triplestore ({0}) is saturated: {1} requests waiting for a connection."
+
+POOL_STATUS_MESSAGE = u"Connection pool %(name)s | size: %(size)d | active: %(active)d | queued: %(queued)d | " + \
+    u"max queued: %(max_queued)d | saturation: %(saturation)d%% | rejected: %(rejected)d | served: %(served)d"
+
+_pools = {}
+
+
+def _prepare_curl(curl, is_cancelled=None):
+    # Older versions of libcurl don't support TCP keep-alive probes
+    if hasattr(pycurl, "TCP_KEEPALIVE"):
+        curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+
+    # cURL handles are reused, so the progress function must be disabled explicitly
+    if is_cancelled is None:
+        curl.setopt(pycurl.NOPROGRESS, 1)
+    else:
+        # libcurl aborts the transfer when the progress function returns a non-zero value
+        curl.setopt(pycurl.NOPROGRESS, 0)
+        curl.setopt(pycurl.PROGRESSFUNCTION, lambda *args: 1 if is_cancelled() else 0)
+
+
+class ConnectionPool(object):
+
+    def __init__(self, name, size, idle_timeout, max_queued, connect_timeout):
+        self.name = name
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_queued = max_queued
+        self.connect_timeout = connect_timeout
+
+        self.active = 0
+        self.rejected = 0
+        self.served = 0
+        self.last_used = time.time()
+
+        # HTTP clients by IOLoop: a client can't be closed while it has requests in flight
+        self._clients = {}
+
+    @property
+    def queued(self):
+        return max(0, self.active - self.size)
+
+    @property
+    def saturation(self):
+        return int(100 * min(self.active, self.size) / self.size)
+
+    def _get_client(self):
+        io_loop = greenlet_get_ioloop()
+        if not self.active:
+            # No request is in flight, so clients can be closed safely: those of other IOLoops
+            # are no longer used, and connections idle for too long were probably closed by the triplestore
+            expired = time.time() - self.last_used > self.idle_timeout
+            for client_io_loop, client in self._clients.items():
+                if expired or client_io_loop is not io_loop:
+                    client.close()
+                    del self._clients[client_io_loop]
+
+        client = self._clients.get(io_loop)
+        if client is None:
+            client = AsyncHTTPClient(io_loop=io_loop, force_instance=True, max_clients=self.size)
+            self._clients[io_loop] = client
+        return client
+
+    def acquire(self):
+        """
+        Return the HTTP client of this pool, refusing the request if too many are already queued.
+        Every call to acquire() must be followed by a call to release().
+        """
+        if self.active >= self.size + self.max_queued:
+            self.rejected += 1
+            raise HTTPError(503, log_message=_(POOL_SATURATED_MESSAGE).format(self.name, self.queued))
+        client = self._get_client()
+        self.active += 1
+        return client
+
+    def release(self):
+        self.active -= 1
+        self.served += 1
+        self.last_used = time.time()
+
+    def prepare_request(self, request, is_cancelled=None):
+        """
+        Configure request to use the connections of this pool.
+        If is_cancelled is given, the request is aborted as soon as is_cancelled() returns True.
+        """
+        request.connect_timeout = self.connect_timeout
+        request.prepare_curl_callback = lambda curl: _prepare_curl(curl, is_cancelled)
+        return request
+
+    def status(self):
+        return POOL_STATUS_MESSAGE % {
+            "name": self.name,
+            "size": self.size,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "saturation": self.saturation,
+            "rejected": self.rejected,
+            "served": self.served
+        }
+
+
+def _pool_params(triplestore_config):
+    return (
+        int(triplestore_config.get("pool_size", settings.TRIPLESTORE_POOL_SIZE)),
+        float(triplestore_config.get("pool_idle_timeout", settings.TRIPLESTORE_POOL_IDLE_TIMEOUT_IN_SECS)),
+        int(triplestore_config.get("pool_max_queued", settings.TRIPLESTORE_POOL_MAX_QUEUED)),
+        float(triplestore_config.get("connect_timeout", settings.TRIPLESTORE_CONNECT_TIMEOUT_IN_SECS))
+    )
+
+
+def get_pool(triplestore_config):
+    """
+    Return the connection pool of the triplestore.ini section described by triplestore_config.
+    Sections are identified by their app_name (or url, if app_name is not defined).
+    """
+    name = triplestore_config.get("app_name") or triplestore_config["url"]
+    params = _pool_params(triplestore_config)
+    pool = _pools.get(name)
+    if pool is None or (pool.size, pool.idle_timeout, pool.max_queued, pool.connect_timeout) != params:
+        pool = ConnectionPool(name, *params)
+        _pools[name] = pool
+    return pool
+
+
+def remove_pool_params(request_params):
+    "Remove pool configuration keys, which can't be passed forward to HTTP clients"
+    for key in POOL_CONFIG_KEYS:
+        request_params.pop(key, None)
+    return request_params
+
+
+def status():
+    return [pool.status() for name, pool in sorted(_pools.items())]
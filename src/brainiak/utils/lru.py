@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Bounded in-process cache. When it is full, the least recently used entry is discarded.
+    Entries older than ttl seconds are considered expired.
+
+    Usage:
+
+    >>> cache = LRUCache(max_size=2, ttl=60)
+    >>> cache.set("a", 1)
+    >>> cache.get("a")
+    1
+    >>> cache.get("b", "default")
+    'default'
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        try:
+            expires_at, value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if expires_at < time.time():
+            self.misses += 1
+            return default
+
+        # re-insert to mark it as the most recently used
+        self._entries[key] = (expires_at, value)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if self.max_size <= 0:
+            return
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def delete_matching(self, match_function):
+        "Delete all entries whose keys match_function returns True for"
+        for key in [key for key in self._entries if match_function(key)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import math
+
+
+__doc__ = """
+In-process metrics of the queries sent to the triplestore, aggregated by query family
+(a name given by the caller of triplestore.query_sparql, e.g. "schema.cardinalities").
+
+Latencies are kept in log-linear histograms (in the spirit of HdrHistogram): each power of two
+range of microseconds is split into SUB_BUCKETS linear buckets, so percentiles have a bounded
+relative error while memory doesn't depend on the number of queries.
+"""
+
+# Number of linear buckets in each power of two range. The relative error of percentiles is 1/SUB_BUCKETS.
+SUB_BUCKETS_BITS = 4
+SUB_BUCKETS = 2 ** SUB_BUCKETS_BITS
+
+PERCENTILES = (50, 90, 99)
+
+_families = {}
+
+
+class LatencyHistogram(object):
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _bucket_of(microseconds):
+        # latencies in [2 ** n, 2 ** (n + 1)) share the same exponent, and are split in SUB_BUCKETS buckets
+        exponent = max(0, microseconds.bit_length() - SUB_BUCKETS_BITS - 1)
+        return (exponent, microseconds >> exponent)
+
+    @staticmethod
+    def _upper_bound_of(bucket):
+        "Highest latency (in seconds) of the bucket"
+        exponent, sub_bucket = bucket
+        return (((sub_bucket + 1) << exponent) - 1) / 1000000.0
+
+    def record(self, seconds):
+        bucket = self._bucket_of(max(0, int(seconds * 1000000)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percentile):
+        "Return the (upper bound of the) latency, in seconds, below which percentile% of the latencies are"
+        if not self.count:
+            return 0.0
+        threshold = math.ceil(percentile / 100.0 * self.count)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return min(self._upper_bound_of(bucket), self.max)
+        return self.max
+
+
+class QueryFamilyMetrics(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.slow = 0
+        self.response_bytes = 0
+        self.max_response_bytes = 0
+
+    def record(self, seconds, response_bytes, slow=False):
+        self.latency.record(seconds)
+        self.response_bytes += response_bytes
+        self.max_response_bytes = max(self.max_response_bytes, response_bytes)
+        if slow:
+            self.slow += 1
+
+    def record_error(self):
+        self.errors += 1
+
+    def report(self):
+        count = self.latency.count
+        latency = {"mean": self.latency.mean, "max": self.latency.max}
+        for percentile in PERCENTILES:
+            latency["p{0}".format(percentile)] = self.latency.percentile(percentile)
+        return {
+            "count": count,
+            "errors": self.errors,
+            "slow": self.slow,
+            "latency_in_secs": latency,
+            "response_bytes": {
+                "total": self.response_bytes,
+                "mean": self.response_bytes / count if count else 0,
+                "max": self.max_response_bytes
+            }
+        }
+
+
+def get_family(name):
+    family = _families.get(name)
+    if family is None:
+        family = QueryFamilyMetrics(name)
+        _families[name] = family
+    return family
+
+
+def report():
+    "Return a dict with the metrics of each query family"
+    return dict((name, family.report()) for name, family in _families.items())
+
+
+def reset():
+    _families.clear()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+
+from brainiak import settings
+
+
+__doc__ = """
+Routing of SPARQL queries among the endpoints of a triplestore.ini section.
+
+The url of a section is its write endpoint. Optionally, a section may list
+read replicas, separated by commas:
+
+    read_urls = http://replica1:8890/sparql-auth, http://replica2:8890/sparql-auth
+
+Read queries are sent to the least loaded healthy replica, according to the number
+of outstanding requests and the moving average (EWMA) of its latency.
+Other queries (INSERT, MODIFY, DELETE) are always sent to the write endpoint.
+
+Endpoints that fail settings.TRIPLESTORE_EJECTION_FAILURES times in a row are not used
+by read queries for settings.TRIPLESTORE_EJECTION_TIME_IN_SECS seconds.
+
+Read queries may also be hedged: if the chosen replica takes longer than the given
+percentile of its recent latencies to answer, the query is also sent to another replica,
+and the first response is used. To enable it (settings.TRIPLESTORE_HEDGE_PERCENTILE):
+
+    hedge_percentile = 95
+"""
+
+READ_URLS_KEY = "read_urls"
+HEDGE_PERCENTILE_KEY = "hedge_percentile"
+REPLICAS_CONFIG_KEYS = (READ_URLS_KEY, HEDGE_PERCENTILE_KEY)
+
+# Weight of the latest latency in the moving average of an endpoint
+EWMA_WEIGHT = 0.3
+
+# Number of recent latencies of each endpoint used to compute percentiles
+LATENCY_SAMPLES = 200
+
+# Queries aren't hedged until the endpoint has this many latency samples
+HEDGE_MIN_SAMPLES = 20
+
+HEDGING_STATUS_MESSAGE = u"Hedged reads | queries: %(queries)d | hedged: %(hedged)d (%(rate)d%%) | " + \
+    u"won by hedge: %(wins)d"
+
+ENDPOINT_STATUS_MESSAGE = u"Endpoint %(url)s | %(state)s | outstanding: %(outstanding)d | " + \
+    u"latency (EWMA): %(latency).3fs | requests: %(requests)d | failures: %(failures)d"
+
+_endpoints = {}
+
+_hedging = {"queries": 0, "hedged": 0, "wins": 0}
+
+
+class Endpoint(object):
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latency = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    @property
+    def healthy(self):
+        return self.ejected_until <= time.time()
+
+    @property
+    def load(self):
+        # Endpoints without latency measures yet are preferred, so that they start being measured
+        return (self.outstanding + 1) * self.latency
+
+    def start(self):
+        self.outstanding += 1
+        self.requests += 1
+
+    def finish(self, latency=None):
+        "The endpoint answered, in latency seconds (if given)"
+        self.outstanding -= 1
+        self.consecutive_failures = 0
+        if latency is None:
+            return
+        self.latencies.append(latency)
+        if self.latency:
+            self.latency = EWMA_WEIGHT * latency + (1 - EWMA_WEIGHT) * self.latency
+        else:
+            self.latency = latency
+
+    def fail(self):
+        "The endpoint could not be reached or had an internal error"
+        self.outstanding -= 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.TRIPLESTORE_EJECTION_FAILURES:
+            self.ejected_until = time.time() + settings.TRIPLESTORE_EJECTION_TIME_IN_SECS
+
+    def latency_percentile(self, percentile):
+        "Return the given percentile of the recent latencies of this endpoint, or None if there are none"
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        index = int(round(percentile / 100.0 * (len(latencies) - 1)))
+        return latencies[index]
+
+    def status(self):
+        return ENDPOINT_STATUS_MESSAGE % {
+            "url": self.url,
+            "state": u"healthy" if self.healthy else u"ejected",
+            "outstanding": self.outstanding,
+            "latency": self.latency,
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+def get_endpoint(url):
+    endpoint = _endpoints.get(url)
+    if endpoint is None:
+        endpoint = Endpoint(url)
+        _endpoints[url] = endpoint
+    return endpoint
+
+
+def read_urls(triplestore_config):
+    "Return the list of read replicas of a section, or its write endpoint if none was defined"
+    urls = [url.strip() for url in triplestore_config.get(READ_URLS_KEY, "").split(",") if url.strip()]
+    return urls or [triplestore_config["url"]]
+
+
+def choose_endpoint(triplestore_config, read_only):
+    """
+    Return the Endpoint that should receive a query, given the triplestore.ini section it is sent to.
+    If every replica was ejected, the one which will be back soonest is used.
+    """
+    if not read_only:
+        return get_endpoint(triplestore_config["url"])
+
+    endpoints = [get_endpoint(url) for url in read_urls(triplestore_config)]
+    healthy_endpoints = [endpoint for endpoint in endpoints if endpoint.healthy]
+    if not healthy_endpoints:
+        return min(endpoints, key=lambda endpoint: endpoint.ejected_until)
+    return min(healthy_endpoints, key=lambda endpoint: (endpoint.load, endpoint.outstanding))
+
+
+def choose_hedge(triplestore_config, endpoint):
+    """
+    Return a tuple with the Endpoint to which a read query sent to endpoint should be hedged,
+    and the delay (in seconds) after which it should be hedged.
+    Returns (None, None) if the query should not be hedged.
+    """
+    percentile = triplestore_config.get(HEDGE_PERCENTILE_KEY, settings.TRIPLESTORE_HEDGE_PERCENTILE)
+    if not percentile:
+        return None, None
+    _hedging["queries"] += 1
+
+    if len(endpoint.latencies) < HEDGE_MIN_SAMPLES:
+        return None, None
+    others = [get_endpoint(url) for url in read_urls(triplestore_config) if url != endpoint.url]
+    others = [other for other in others if other.healthy]
+    if not others:
+        return None, None
+
+    hedge_endpoint = min(others, key=lambda other: (other.load, other.outstanding))
+    delay = max(endpoint.latency_percentile(float(percentile)), settings.TRIPLESTORE_HEDGE_MIN_DELAY_IN_SECS)
+    return hedge_endpoint, delay
+
+
+def count_hedge(won):
+    "Count a query that was hedged, and whether the hedge answered first"
+    _hedging["hedged"] += 1
+    if won:
+        _hedging["wins"] += 1
+
+
+def remove_replicas_params(request_params):
+    "Remove replicas configuration keys, which can't be passed forward to HTTP clients"
+    for key in REPLICAS_CONFIG_KEYS:
+        request_params.pop(key, None)
+    return request_params
+
+
+def hedging_status():
+    queries = _hedging["queries"]
+    return HEDGING_STATUS_MESSAGE % dict(_hedging, rate=100 * _hedging["hedged"] / queries if queries else 0)
+
+
+def status():
+    return [endpoint.status() for url, endpoint in sorted(_endpoints.items())]
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import bisect
+import hashlib
+
+from brainiak.greenlet_tornado import greenlet_run_many
+
+
+__doc__ = """
+Sharding of the cache across several Redis nodes (settings.REDIS_NODES).
+
+Keys are assigned to nodes by consistent hashing: each node owns VIRTUAL_NODES points of a ring
+of hashes, and a key belongs to the node owning the first point after the hash of the key.
+Adding or removing a node only moves the keys of the ring segments it owns.
+
+ShardedRedis routes the commands given to it (which must take a single key, as the first argument,
+except DELETE) to the client of the node of their key. Pipelines are split by node, and sent to
+every node at once. Commands on the whole keyspace (SCAN, KEYS, FLUSHALL, INFO...) must be sent
+to each client of ShardedRedis.shards.
+"""
+
+# Points of each node in the ring: the more points, the more even the distribution of keys
+VIRTUAL_NODES = 160
+
+
+def _hash(value):
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return int(hashlib.md5(value).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        points = sorted((_hash(u"{0}#{1}".format(node, index)), node)
+                        for node in nodes for index in range(virtual_nodes))
+        self._hashes = [point_hash for point_hash, node in points]
+        self._nodes = [node for point_hash, node in points]
+
+    def node_for(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def _call_each(functions):
+    """
+    Call all functions (concurrently, inside request handlers), even if some of them fail.
+    Return the list of their results, raising the first exception raised by them (if any) afterwards.
+    """
+    def guarded(function):
+        try:
+            return (True, function())
+        except Exception as e:
+            return (False, e)
+
+    outcomes = greenlet_run_many([lambda function=function: guarded(function) for function in functions])
+    for succeeded, result in outcomes:
+        if not succeeded:
+            raise result
+    return [result for succeeded, result in outcomes]
+
+
+class ShardedRedis(object):
+    """
+    Client of several Redis nodes, given as a list of (name, client), where name identifies the node
+    in the ring (e.g. "host:port") and client is a redis.StrictRedis or an AsyncRedis.
+    """
+
+    def __init__(self, nodes):
+        self.clients = dict(nodes)
+        self.names = [name for name, client in nodes]
+        self.ring = HashRing(self.names)
+
+    def __repr__(self):
+        return "ShardedRedis<nodes={0}>".format(",".join(self.names))
+
+    @property
+    def shards(self):
+        return [self.clients[name] for name in self.names]
+
+    def shard_for(self, key):
+        return self.clients[self.ring.node_for(key)]
+
+    def get(self, key):
+        return self.shard_for(key).get(key)
+
+    def set(self, key, value, **options):
+        return self.shard_for(key).set(key, value, **options)
+
+    def setex(self, key, time_to_live, value):
+        return self.shard_for(key).setex(key, time_to_live, value)
+
+    def incr(self, key, amount=1):
+        return self.shard_for(key).incr(key, amount)
+
+    def smembers(self, key):
+        return self.shard_for(key).smembers(key)
+
+    def sadd(self, key, *values):
+        return self.shard_for(key).sadd(key, *values)
+
+    def expire(self, key, time_to_live):
+        return self.shard_for(key).expire(key, time_to_live)
+
+    def eval(self, script, number_of_keys, key, *arguments):
+        "Scripts are run by the node of their (single) key"
+        return self.shard_for(key).eval(script, number_of_keys, key, *arguments)
+
+    def publish(self, channel, message):
+        "Channels belong to nodes as keys do, so that publishers and subscribers meet at the same node"
+        return self.shard_for(channel).publish(channel, message)
+
+    def subscribe(self, channel, callback, on_subscribed=None):
+        return self.shard_for(channel).subscribe(channel, callback, on_subscribed)
+
+    def delete(self, *keys):
+        pipeline = self.pipeline()
+        pipeline.delete(*keys)
+        return pipeline.execute()[0]
+
+    def pipeline(self, transaction=False, shard_hint=None):
+        "Return a ShardedPipeline. MULTI/EXEC transactions are not supported"
+        return ShardedPipeline(self)
+
+    def disconnect(self):
+        for client in self.shards:
+            if hasattr(client, "disconnect"):
+                client.disconnect()
+
+
+class ShardedPipeline(object):
+    """
+    Buffer commands in a pipeline per node, which are all executed by execute().
+    If a node fails, the commands of the other nodes are executed anyway.
+    """
+
+    def __init__(self, sharded):
+        self.sharded = sharded
+        self._pipelines = {}
+        # for each command, the list of (node name, index of the command in the pipeline of the node)
+        self._commands = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    def _add(self, name, method, *args, **options):
+        pipeline = self._pipelines.get(name)
+        if pipeline is None:
+            pipeline = self._pipelines[name] = self.sharded.clients[name].pipeline(transaction=False)
+        getattr(pipeline, method)(*args, **options)
+        return (name, len(pipeline) - 1)
+
+    def _routed(method):
+        def command(self, key, *args, **options):
+            self._commands.append([self._add(self.sharded.ring.node_for(key), method, key, *args, **options)])
+            return self
+        command.__name__ = method
+        return command
+
+    get = _routed("get")
+    set = _routed("set")
+    setex = _routed("setex")
+    incr = _routed("incr")
+    sadd = _routed("sadd")
+    smembers = _routed("smembers")
+    expire = _routed("expire")
+
+    def delete(self, *keys):
+        "Keys are deleted by the pipelines of their nodes: the result is the total number of keys deleted"
+        keys_by_node = {}
+        for key in keys:
+            keys_by_node.setdefault(self.sharded.ring.node_for(key), []).append(key)
+        self._commands.append([self._add(name, "delete", *node_keys) for name, node_keys in keys_by_node.items()])
+        return self
+
+    def execute(self):
+        pipelines, self._pipelines = self._pipelines, {}
+        commands, self._commands = self._commands, []
+        names = list(pipelines)
+        replies = dict(zip(names, _call_each([pipelines[name].execute for name in names])))
+        results = []
+        for parts in commands:
+            part_results = [replies[name][index] for name, index in parts]
+            results.append(sum(part_results) if len(part_results) > 1 else part_results[0] if part_results else 0)
+        return results
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import greenlet
+
+from brainiak.greenlet_tornado import greenlet_get_ioloop
+
+
+__doc__ = """
+Single-flight execution of identical concurrent calls.
+
+While a call identified by some key is running, other greenlets calling with the same
+key don't repeat it: they are paused until the first call (the leader) finishes,
+and then receive its result (or exception).
+"""
+
+SINGLE_FLIGHT_STATUS_MESSAGE = u"Coalesced %(name)s | in flight: %(in_flight)d | leaders: %(leaders)d | " + \
+    u"coalesced: %(coalesced)d"
+
+
+class SingleFlight(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.leaders = 0
+        self.coalesced = 0
+        # key => list of greenlets waiting for the result of the call being executed
+        self._calls = {}
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
+
+    def run(self, key, function):
+        """
+        Return function(), unless another greenlet is already running it with the same key,
+        in which case wait for it and return the same result.
+        Must be called (possibly indirectly) from a method wrapped by greenlet_asynchronous.
+        """
+        waiting = self._calls.get(key)
+        if waiting is not None:
+            self.coalesced += 1
+            gr = greenlet.getcurrent()
+            waiting.append(gr)
+            failed, result = gr.parent.switch()
+            if failed:
+                exception_type, exception, traceback = result
+                raise exception_type, exception, traceback
+            return result
+
+        self.leaders += 1
+        self._calls[key] = waiting = []
+        try:
+            result = function()
+            outcome = (False, result)
+            return result
+        except:
+            outcome = (True, sys.exc_info())
+            raise
+        finally:
+            del self._calls[key]
+            io_loop = greenlet_get_ioloop()
+            for gr in waiting:
+                io_loop.add_callback(gr.switch, outcome)
+
+    def status(self):
+        return SINGLE_FLIGHT_STATUS_MESSAGE % {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
@@ -5,7 +5,8 @@ import uuid
 import dateutil.parser
 import ujson as json
 
-from brainiak import triplestore
+from brainiak import settings, triplestore
+from brainiak.greenlet_tornado import greenlet_available
 from brainiak.log import get_logger
 from brainiak.prefixes import expand_uri, is_compressed_uri, is_uri, normalize_all_uris_recursively
 from brainiak.triplestore import query_sparql
@@ -13,6 +14,7 @@ from brainiak.type_mapper import MAP_RDF_EXPANDED_TYPE_TO_PYTHON
 from brainiak.utils.resources import LazyObject
 from brainiak.utils import config_parser
 from brainiak.utils.i18n import _
+from brainiak.utils.lru import LRUCache
 
 logger = LazyObject(get_logger)
 
@@ -169,6 +171,7 @@ def bindings_to_dict(key_name, bindings):
 def compress_keys_and_values(result_dict, keymap={}, ignore_keys=[], context=None, do_expand_uri=False):
     """
     Return a list of compressed items of the 'bindings' list of a Virtuoso response dict.
+    The 'bindings' may also be an iterator, such as the ones returned by query_sparql(..., stream=True).
 
     Usage:
 
@@ -623,7 +626,7 @@ def is_value_already_used(instance_uri, object_value, predicate_uri, class_objec
         "predicate_uri": predicate_uri,
         "object_value": object_value
     }
-    query_result = triplestore.query_sparql(query, query_params.triplestore_config)
+    query_result = triplestore.query_sparql(query, query_params.triplestore_config, family="instance.value_already_used")
     return is_result_true(query_result)
 
 
@@ -718,24 +721,60 @@ SELECT DISTINCT ?property WHERE {
 
 LABEL_PROPERTIES = [RDFS_LABEL]
 
+# In-process caches of lookups that don't depend on the request parameters
+_subproperties_cache = LRUCache(settings.LOOKUP_CACHE_MAX_ITEMS, settings.LOOKUP_CACHE_TTL_IN_SECS)
+_graph_from_class_cache = LRUCache(settings.LOOKUP_CACHE_MAX_ITEMS, settings.LOOKUP_CACHE_TTL_IN_SECS)
+_graph_and_class_from_instance_cache = LRUCache(settings.LOOKUP_CACHE_MAX_ITEMS, settings.LOOKUP_CACHE_TTL_IN_SECS)
+
+_NOT_CACHED = object()
+
+
+def _query_sparql_from_anywhere(query, family):
+    """
+    Run the query without blocking the IOLoop when called while handling a request.
+    The blocking client is only used outside requests (e.g. while the server starts up).
+    """
+    return query_sparql(query,
+                        config_parser.parse_section(),
+                        async=greenlet_available(),
+                        family=family)
+
+
+def forget_instance(instance_uri):
+    "Remove the instance from the in-process lookup caches"
+    _graph_and_class_from_instance_cache.delete(instance_uri)
+
+
+def forget_class(class_uri):
+    "Remove the class from the in-process lookup caches (e.g. when it may have been moved to another graph)"
+    _graph_from_class_cache.delete(class_uri)
+
+
+def clear_lookup_caches():
+    _subproperties_cache.clear()
+    _graph_from_class_cache.clear()
+    _graph_and_class_from_instance_cache.clear()
+
 
 def get_subproperties(super_property):
+    subproperties = _subproperties_cache.get(super_property, _NOT_CACHED)
+    if subproperties is not _NOT_CACHED:
+        return list(subproperties)
+
     params = {
         "ruleset": "http://semantica.globo.com/ruleset",
         "property": super_property
     }
     query = QUERY_SUBPROPERTIES % params
-    result_dict = query_sparql(query,
-                               config_parser.parse_section(),
-                               async=False)
+    result_dict = _query_sparql_from_anywhere(query, "lookup.subproperties")
     subproperties = filter_values(result_dict, "property")
+    _subproperties_cache.set(super_property, tuple(subproperties))
     return subproperties
 
 
 def load_label_properties():
-    global LABEL_PROPERTIES
-    LABEL_PROPERTIES += get_subproperties(RDFS_LABEL)
-    normalize_all_uris_recursively(LABEL_PROPERTIES)
+    # Updated in place, as the list is imported by other modules. May be called again to reload it
+    LABEL_PROPERTIES[:] = normalize_all_uris_recursively([RDFS_LABEL] + get_subproperties(RDFS_LABEL))
 
 
 def are_there_label_properties_in(instance_data):
@@ -757,15 +796,21 @@ WHERE {GRAPH ?graph { <%(class_uri)s> a owl:Class }}
 
 
 def find_graph_from_class(class_uri):
+    graph_uri = _graph_from_class_cache.get(class_uri, _NOT_CACHED)
+    if graph_uri is not _NOT_CACHED:
+        return graph_uri
+
     query = QUERY_FIND_GRAPH_FROM_CLASS % {'class_uri': class_uri}
-    result_dict = query_sparql(query,
-                               config_parser.parse_section(),
-                               async=False)
+    result_dict = _query_sparql_from_anywhere(query, "lookup.graph_from_class")
     graphs = filter_values(result_dict, 'graph')
     try:
-        return graphs[0] if (len(graphs) == 1) else None
+        graph_uri = graphs[0] if (len(graphs) == 1) else None
     except IndexError:
-        return None
+        graph_uri = None
+
+    if graph_uri:
+        _graph_from_class_cache.set(class_uri, graph_uri)
+    return graph_uri
 
 
 QUERY_FIND_GRAPH_AND_CLASS_FROM_INSTANCE = u"""
@@ -775,10 +820,12 @@ WHERE {GRAPH ?graph { ?class a owl:Class. <%(instance_uri)s> a ?class . }}
 
 
 def find_graph_and_class_from_instance(instance_uri):
+    cached_value = _graph_and_class_from_instance_cache.get(instance_uri, _NOT_CACHED)
+    if cached_value is not _NOT_CACHED:
+        return cached_value
+
     query = QUERY_FIND_GRAPH_AND_CLASS_FROM_INSTANCE % {'instance_uri': instance_uri}
-    result_dict = query_sparql(query,
-                               config_parser.parse_section(),
-                               async=False)
+    result_dict = _query_sparql_from_anywhere(query, "lookup.graph_and_class_from_instance")
     graphs = filter_values(result_dict, 'graph')
     classes = filter_values(result_dict, 'class')
     try:
@@ -791,6 +838,9 @@ def find_graph_and_class_from_instance(instance_uri):
     except IndexError:
         class_uri = None
 
+    # Instances that don't exist (yet) are not cached, as they may be created by the next request
+    if graph_uri and class_uri:
+        _graph_and_class_from_instance_cache.set(instance_uri, (graph_uri, class_uri))
     return graph_uri, class_uri
 
 
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import traceback
+import urllib
+from collections import deque
+
+import greenlet
+import ujson
+from tornado.ioloop import IOLoop
+from tornado.options import define, options, parse_command_line
+
+from brainiak import log, settings
+from brainiak.greenlet_tornado import greenlet_fetch, greenlet_run_many, greenlet_set_ioloop
+from brainiak.utils import cache
+from brainiak.utils.i18n import _
+
+
+__doc__ = """
+Warm-up of the cached class schemas, so that the first requests after a deploy don't pay
+for the queries needed to build them.
+
+The graphs (list_all_contexts) and their classes (list_classes) are listed through the API
+of a Brainiak server, and the schema of each class is requested at most concurrency at a time
+(settings.WARMUP_CONCURRENCY), so that the triplestore isn't overloaded.
+Requesting schemas through the API caches them under the same keys as the requests of clients.
+
+Run it against a server:
+
+    PYTHONPATH=src python -m brainiak.warmup --url=http://localhost:5100 --concurrency=4
+
+or after the server starts, setting settings.WARMUP_ON_STARTUP (only one process at a time does it).
+"""
+
+# Items listed per request when looking for graphs and classes
+WARMUP_PAGE_SIZE = 100
+
+# Progress is logged after each of these many schemas
+WARMUP_PROGRESS_INTERVAL = 50
+
+WARMUP_LEASE = u"##warmup"
+# The warm-up lease expires in case its holder crashes, but it is renewed as schemas are requested,
+# so it is held for as long as the warm-up makes progress (each request takes WARMUP_REQUEST_TIMEOUT_IN_SECS at most)
+WARMUP_LEASE_TIME_IN_SECS = 5 * 60
+
+WARMUP_SUMMARY_MESSAGE = u"Warm-up: %(done)d/%(classes)d schemas (%(failed)d failed) of %(graphs)d graphs " + \
+    u"in %(seconds).1fs"
+
+
+def _get_json(url, **arguments):
+    if arguments:
+        url = u"{0}?{1}".format(url, urllib.urlencode(sorted(arguments.items())))
+    response = greenlet_fetch(url, request_timeout=settings.WARMUP_REQUEST_TIMEOUT_IN_SECS)
+    return ujson.loads(response.body)
+
+
+def _list_all(url):
+    """
+    Return the items of every page of the listing at url.
+    Pages are requested until one is empty: listings page rows (e.g. a class and one of its labels),
+    which are merged into items by @id, so a page may have fewer items than asked for and still be followed by others.
+    Items merged from rows of two pages are listed once.
+    """
+    items = []
+    seen = set()
+    page = 1
+    while True:
+        page_items = _get_json(url, page=page, per_page=WARMUP_PAGE_SIZE).get("items", [])
+        if not page_items:
+            return items
+        for item in page_items:
+            if item["resource_id"] not in seen:
+                seen.add(item["resource_id"])
+                items.append(item)
+        page += 1
+
+
+def list_schema_urls(base_url):
+    "Return the number of graphs and the URLs of the schemas of their classes"
+    base_url = base_url.rstrip("/")
+    graphs = _list_all(u"{0}/".format(base_url))
+    schema_urls = []
+    for graph in graphs:
+        graph_url = u"{0}/{1}/".format(base_url, graph["resource_id"])
+        for klass in _list_all(graph_url):
+            schema_urls.append(u"{0}{1}/_schema?{2}".format(
+                graph_url, klass["resource_id"], urllib.urlencode({"class_prefix": klass["class_prefix"]})))
+    return len(graphs), schema_urls
+
+
+def warm_up(base_url, concurrency=None, on_progress=None):
+    """
+    Request the schema of every class of every graph of the Brainiak server at base_url,
+    at most concurrency at a time, so that they are cached. Return the progress counters.
+    on_progress, if given, is called after each schema is requested.
+    Must run in a greenlet started by the IOLoop.
+    """
+    concurrency = concurrency or settings.WARMUP_CONCURRENCY
+    start = time.time()
+    progress = {"graphs": 0, "classes": 0, "done": 0, "failed": 0, "seconds": 0.0}
+
+    def report(log_function):
+        progress["seconds"] = time.time() - start
+        log_function(WARMUP_SUMMARY_MESSAGE % progress)
+
+    progress["graphs"], schema_urls = list_schema_urls(base_url)
+    progress["classes"] = len(schema_urls)
+    pending = deque(schema_urls)
+
+    def worker():
+        while pending:
+            url = pending.popleft()
+            try:
+                greenlet_fetch(url, request_timeout=settings.WARMUP_REQUEST_TIMEOUT_IN_SECS)
+            except Exception:
+                progress["failed"] += 1
+                log.logger.error(_(u"Warm-up: failed to request {0}: {1}").format(url, traceback.format_exc()))
+            progress["done"] += 1
+            if on_progress is not None:
+                on_progress()
+            if not progress["done"] % WARMUP_PROGRESS_INTERVAL:
+                report(log.logger.info)
+
+    greenlet_run_many([worker] * min(concurrency, len(schema_urls)))
+    report(log.logger.info)
+    return progress
+
+
+def warm_up_once(base_url, concurrency=None):
+    "Warm up, unless another process is already doing it"
+    token = cache.acquire_lease(WARMUP_LEASE, WARMUP_LEASE_TIME_IN_SECS)
+    if not token:
+        return
+    try:
+        warm_up(base_url, concurrency, lambda: cache.renew_lease(WARMUP_LEASE, token, WARMUP_LEASE_TIME_IN_SECS))
+    except Exception:
+        log.logger.error(_(u"Warm-up: failed: {0}").format(traceback.format_exc()))
+    finally:
+        cache.release_lease(WARMUP_LEASE, token)
+
+
+def main():  # pragma: no cover
+    define("url", default="http://localhost:{0}".format(settings.SERVER_PORT), help="Brainiak server to warm up")
+    define("concurrency", default=settings.WARMUP_CONCURRENCY, help="Schemas requested at a time", type=int)
+    parse_command_line()
+    log.initialize()
+    io_loop = IOLoop.instance()
+    greenlet_set_ioloop(io_loop)
+    outcome = {}
+
+    def run():
+        try:
+            outcome.update(warm_up(options.url, options.concurrency))
+        finally:
+            io_loop.stop()
+
+    io_loop.add_callback(greenlet.greenlet(run).switch)
+    io_loop.start()
+    if not outcome:
+        sys.exit(1)
+    sys.stdout.write((WARMUP_SUMMARY_MESSAGE % outcome) + "\n")
+    sys.exit(1 if outcome["failed"] else 0)
+
+
+if __name__ == '__main__':
+    main()
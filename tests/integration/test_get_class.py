@@ -15,7 +15,7 @@ from brainiak.schema.get_class import build_class_schema_query, \
     QUERY_CARDINALITIES, QUERY_PREDICATE_WITHOUT_LANG, \
     QUERY_PREDICATE_WITH_LANG, QUERY_SUPERCLASS, SchemaNotFound
 from brainiak.utils.params import ParamDict
-from brainiak.utils.cache import delete, retrieve
+from brainiak.utils.cache import delete, encode_response, retrieve
 from tests.mocks import MockHandler, MockRequest
 from tests.sparql import QueryTestCase
 from tests.tornado_cases import TornadoAsyncTestCase, TornadoAsyncHTTPTestCase
@@ -420,7 +420,8 @@ class GetSchemaTestCase(TornadoAsyncTestCase):
     @patch("brainiak.schema.get_class.query_class_schema", return_value={"results": {"bindings": [{"dummy_key": "dummy_value"}]}})
     @patch("brainiak.schema.get_class.query_superclasses", return_value=["classeA", "classeB"])
     @patch("brainiak.schema.get_class.get_predicates_and_cardinalities", return_value="property_dict")
-    def test_query_get_schema(self, mocked_get_preds_and_cards, mocked_query_superclasses, mocked_query_class_schema):
+    @patch("brainiak.schema.get_class.query_cardinalities", return_value={"results": {"bindings": []}})
+    def test_query_get_schema(self, mocked_query_cardinalities, mocked_get_preds_and_cards, mocked_query_superclasses, mocked_query_class_schema):
 
         params = {
             "context_name": "ctx",
@@ -448,7 +449,8 @@ class GetSchemaTestCase(TornadoAsyncTestCase):
     @patch("brainiak.schema.get_class.query_class_schema", return_value={"results": {"bindings": []}})
     @patch("brainiak.schema.get_class.query_superclasses", return_value=["classeA", "classeB"])
     @patch("brainiak.schema.get_class.get_predicates_and_cardinalities", return_value="property_dict")
-    def test_query_get_schema_empty_response(self, mocked_get_preds_and_cards, mocked_query_superclasses, mocked_query_class_schema):
+    @patch("brainiak.schema.get_class.query_cardinalities", return_value={"results": {"bindings": []}})
+    def test_query_get_schema_empty_response(self, mocked_query_cardinalities, mocked_get_preds_and_cards, mocked_query_superclasses, mocked_query_class_schema):
 
         params = {
             "context_name": "ctx",
@@ -674,7 +676,8 @@ class TestClassResource(TornadoAsyncHTTPTestCase):
         delete('http://example.onto/@@http://example.onto/Place##class')
         delete('http://semantica.globo.com/person/@@http://semantica.globo.com/person/Gender##class')
 
-    @patch("brainiak.utils.cache.retrieve", return_value={"body": {"i am": "cached"}, "meta": {"cache": "HIT", "last_modified": "123"}})
+    @patch("brainiak.utils.cache.retrieve_value",
+           return_value=encode_response({"body": {"i am": "cached"}, "meta": {"cache": "HIT", "last_modified": "123"}}))
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_200_with_cache(self, enable_cache, retrieve):
         response = self.fetch("/person/Gender/_schema", method='GET')
@@ -684,6 +687,36 @@ class TestClassResource(TornadoAsyncHTTPTestCase):
         self.assertTrue(response.headers.get('Last-Modified'))
         self.assertTrue(response.headers['X-Cache'].startswith('HIT from localhost'))
 
+    CACHED_SCHEMA = encode_response({"body": {"i am": "cached"},
+                                     "meta": {"cache": "HIT", "last_modified": "Fri, 11 May 1984 20:00:00 -0300"}})
+
+    @patch("brainiak.utils.cache.retrieve_value", return_value=CACHED_SCHEMA)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    def test_304_if_none_match(self, enable_cache, retrieve):
+        etag = self.fetch("/person/Gender/_schema", method='GET').headers['Etag']
+        response = self.fetch("/person/Gender/_schema", method='GET', headers={"If-None-Match": etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, "")
+        self.assertEqual(response.headers['Etag'], etag)
+
+    @patch("brainiak.utils.cache.retrieve_value", return_value=CACHED_SCHEMA)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    def test_200_if_none_match_of_shortened_schema(self, enable_cache, retrieve):
+        etag = self.fetch("/person/Gender/_schema", method='GET').headers['Etag']
+        response = self.fetch("/person/Gender/_schema?expand_uri=0", method='GET', headers={"If-None-Match": etag})
+        self.assertEqual(response.code, 200)
+        self.assertNotEqual(response.headers['Etag'], etag)
+
+    @patch("brainiak.utils.cache.retrieve_value", return_value=CACHED_SCHEMA)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    def test_304_if_modified_since(self, enable_cache, retrieve):
+        response = self.fetch("/person/Gender/_schema", method='GET',
+                              headers={"If-Modified-Since": "Fri, 11 May 1984 23:00:00 GMT"})
+        self.assertEqual(response.code, 304)
+        response = self.fetch("/person/Gender/_schema", method='GET',
+                              headers={"If-Modified-Since": "Fri, 11 May 1984 22:59:59 GMT"})
+        self.assertEqual(response.code, 200)
+
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_200_with_miss(self, enable_cache):
         cached_value = retrieve("http://semantica.globo.com/person/@@http://semantica.globo.com/person/Gender##class")
@@ -776,7 +809,7 @@ class TestClassResource(TornadoAsyncHTTPTestCase):
         response = self.fetch('/animals/Ornithorhynchus/_schema')
         self.assertEqual(response.code, 404)
 
-    @patch("brainiak.utils.cache.retrieve", return_value=None)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
     @patch("brainiak.schema.get_class.get_schema", return_value={"cached": "false"})
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_get_cached_schema_miss(self, settings_mock, get_schema_mock, retrieve_mock):
@@ -792,7 +825,7 @@ class TestClassResource(TornadoAsyncHTTPTestCase):
         schema = get_cached_schema(query_params)
         self.assertEqual(schema, {"cached": "false"})
 
-    @patch("brainiak.utils.cache.retrieve", return_value={"body": {"cached": "true"}, "meta": {"cache": "HIT"}})
+    @patch("brainiak.utils.cache.retrieve_value", return_value=encode_response({"body": {"cached": "true"}, "meta": {"cache": "HIT"}}))
     @patch("brainiak.schema.get_class.get_schema", return_value={"cached": "false"})
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_get_cached_schema_hit(self, settings_mock, get_schema_mock, retrieve_mock):
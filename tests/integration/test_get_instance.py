@@ -5,7 +5,7 @@ from brainiak import settings, server
 
 from brainiak.instance import get_instance
 from brainiak.settings import URI_PREFIX
-from brainiak.utils.cache import connect
+from brainiak.utils.cache import delete, retrieve
 from tests.tornado_cases import TornadoAsyncHTTPTestCase
 from tests.sparql import QueryTestCase
 
@@ -251,27 +251,24 @@ class InstanceCauseSchemaToBeCachedTestCase(TornadoAsyncHTTPTestCase, QueryTestC
 
     fixtures_by_graph = {"http://brmedia.com/": ["tests/sample/sports.n3"]}
     maxDiff = None
-    redis_test_client = connect()
 
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_get_instance_generate_schema_cache_entry(self, mock_settings):
         expected_redis_key = "http://brmedia.com/@@http://dbpedia.org/ontology/News##class"
         # Clean cache
-        self.redis_test_client.delete([expected_redis_key])
+        delete(expected_redis_key)
 
         class_response = self.fetch('/dbpedia/News/_schema?class_prefix=http://dbpedia.org/ontology/&graph_uri=http://brmedia.com/&expand_uri=0', method='GET')
         self.assertEqual(class_response.code, 200)
-        cached_schema_by_direct_access_str = self.redis_test_client.get(expected_redis_key)
-        cached_schema_by_direct_access = ujson.loads(cached_schema_by_direct_access_str)
+        cached_schema_by_direct_access = retrieve(expected_redis_key)
         last_modified = cached_schema_by_direct_access['meta']['last_modified']
 
         # Clean cache
-        self.redis_test_client.delete([expected_redis_key])
+        delete(expected_redis_key)
 
         instance_response = self.fetch('/dbpedia/News/news_cricket?instance_prefix=http://brmedia.com/&graph_uri=http://brmedia.com/&expand_uri=0', method='GET')
         self.assertEqual(instance_response.code, 200)
-        cached_schema_caused_by_get_instance_str = self.redis_test_client.get(expected_redis_key)
-        cached_schema_caused_by_get_instance = ujson.loads(cached_schema_caused_by_get_instance_str)
+        cached_schema_caused_by_get_instance = retrieve(expected_redis_key)
 
         self.assertEqual(cached_schema_caused_by_get_instance['body'], cached_schema_by_direct_access['body'])
         self.assertEqual(last_modified, cached_schema_by_direct_access['meta']['last_modified'])
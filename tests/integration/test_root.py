@@ -3,6 +3,7 @@ from mock import patch
 
 from brainiak.root.get_root import QUERY_LIST_CONTEXT
 from brainiak.utils import sparql
+from brainiak.utils.cache import encode_response
 from brainiak.handlers import RootHandler
 from tests.tornado_cases import TornadoAsyncHTTPTestCase
 from tests.sparql import QueryTestCase
@@ -77,7 +78,8 @@ class ListAllContextsTestCase(TornadoAsyncHTTPTestCase):
         body = json.loads(response.body)
         self.assertIn("items", body.keys())
 
-    @patch("brainiak.utils.cache.retrieve", return_value={"body": {"status": "cached"}, "meta": {"last_modified": "Fri, 11 May 1984 20:00:00 -0300"}})
+    @patch("brainiak.utils.cache.retrieve_value",
+           return_value=encode_response({"body": {"status": "cached"}, "meta": {"last_modified": "Fri, 11 May 1984 20:00:00 -0300"}}))
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_200_with_cache(self, enable_cache, retrieve):
         response = self.fetch("/", method='GET')
@@ -86,7 +88,7 @@ class ListAllContextsTestCase(TornadoAsyncHTTPTestCase):
         self.assertEqual(body, {'status': "cached"})
         self.assertTrue(response.headers['X-Cache'].startswith('HIT from localhost'))
 
-    @patch("brainiak.utils.cache.retrieve", return_value={"cache": False})
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=False)
     def test_200_without_cache(self, enable_cache, retrieve):
         response = self.fetch("/", method='GET')
@@ -96,7 +98,7 @@ class ListAllContextsTestCase(TornadoAsyncHTTPTestCase):
         self.assertTrue(response.headers.get('Last-Modified'))
         self.assertTrue(response.headers['X-Cache'].startswith('MISS from localhost'))
 
-    @patch("brainiak.utils.cache.retrieve", return_value={"cache": "dismissed"})
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_200_with_cache_but_with_purge(self, enable_cache, retrieve):
         response = self.fetch("/?purge=1", method='GET')
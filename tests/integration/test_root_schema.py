@@ -2,6 +2,7 @@ import json
 from mock import patch
 
 from brainiak.handlers import RootJsonSchemaHandler
+from brainiak.utils.cache import encode_response
 from tests.tornado_cases import TornadoAsyncHTTPTestCase
 
 
@@ -44,7 +45,8 @@ class ListAllContextsTestCase(TornadoAsyncHTTPTestCase):
         self.assertEqual(body["$schema"], u'http://json-schema.org/draft-04/schema#')
         self.assertEqual(body["title"], u'Contexts')
 
-    @patch("brainiak.utils.cache.retrieve", return_value={"body": {"status": "cached"}, "meta": {"last_modified": "Fri, 11 May 1984 20:00:00 -0300"}})
+    @patch("brainiak.utils.cache.retrieve_value",
+           return_value=encode_response({"body": {"status": "cached"}, "meta": {"last_modified": "Fri, 11 May 1984 20:00:00 -0300"}}))
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     def test_200_with_cache(self, enable_cache, retrieve):
         response = self.fetch("/_schema_list/", method='GET')
@@ -5,7 +5,7 @@ import json
 from mock import patch, Mock
 
 from brainiak import server
-from brainiak.utils.cache import create, delete, keys, memoize, ping, purge, purge_all_instances, \
+from brainiak.utils.cache import create, delete, keys, memoize, namespaced, ping, purge, purge_all_instances, \
     purge_an_instance, retrieve, redis_client, update_if_present
 
 from tests.mocks import MockRequest
@@ -31,7 +31,7 @@ class CacheTestCase(unittest.TestCase):
     def test_create(self):
         response = create("new_key", "some value")
         self.assertTrue(response)
-        ttl = redis_client.ttl("new_key")
+        ttl = redis_client.ttl(namespaced("new_key"))
         self.assertGreater(ttl, 80000)
 
     def test_retrieve_inexistent(self):
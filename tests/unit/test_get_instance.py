@@ -66,7 +66,7 @@ class TestCaseInstanceResource(unittest.TestCase):
         self.assertTrue(query_all_properties_and_objects.called)
 
     def test_query_all_properties_and_objects_with_expand_object_properties(self):
-        triplestore.query_sparql = lambda query, query_params: query
+        triplestore.query_sparql = lambda query, query_params, **kwargs: query
 
         class Params(dict):
             triplestore_config = {}
@@ -95,7 +95,7 @@ class TestCaseInstanceResource(unittest.TestCase):
         self.assertEqual(strip(computed), strip(expected))
 
     def test_query_all_properties_and_objects_without_expand_object_properties(self):
-        triplestore.query_sparql = lambda query, query_params: query
+        triplestore.query_sparql = lambda query, query_params, **kwargs: query
 
         class Params(dict):
             triplestore_config = {}
@@ -0,0 +1,186 @@
+import time
+
+import greenlet
+from mock import Mock
+from tornado.testing import AsyncTestCase
+
+from brainiak.greenlet_tornado import greenlet_fetch_many, greenlet_hedge, greenlet_run_many, greenlet_set_ioloop, \
+    greenlet_sleep
+
+
+class GreenletRunManyTestCase(AsyncTestCase):
+
+    def setUp(self):
+        super(GreenletRunManyTestCase, self).setUp()
+        greenlet_set_ioloop(self.io_loop)
+        self.started = []
+
+    def _wait_for(self, name, value):
+        # Pause as if a request was being made, resuming when the IOLoop calls back
+        def function():
+            self.started.append(name)
+            gr = greenlet.getcurrent()
+            self.io_loop.add_callback(gr.switch)
+            gr.parent.switch()
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return function
+
+    def _run_in_greenlet(self, function):
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = function()
+            except Exception as e:
+                outcome["error"] = e
+            self.stop()
+        greenlet.greenlet(run).switch()
+        self.wait()
+        return outcome
+
+    def test_results_are_returned_in_order(self):
+        functions = [self._wait_for("a", 1), self._wait_for("b", 2), self._wait_for("c", 3)]
+        outcome = self._run_in_greenlet(lambda: greenlet_run_many(functions))
+        self.assertEqual(outcome, {"result": [1, 2, 3]})
+        self.assertEqual(self.started, ["a", "b", "c"])
+
+    def test_functions_run_concurrently(self):
+        def first():
+            result = self._wait_for("a", 1)()
+            # the second function must have started before the first one has finished
+            self.assertEqual(self.started, ["a", "b"])
+            return result
+        outcome = self._run_in_greenlet(lambda: greenlet_run_many([first, self._wait_for("b", 2)]))
+        self.assertEqual(outcome, {"result": [1, 2]})
+
+    def test_first_exception_is_raised(self):
+        functions = [self._wait_for("a", 1), self._wait_for("b", ValueError("failure"))]
+        outcome = self._run_in_greenlet(lambda: greenlet_run_many(functions))
+        self.assertIsInstance(outcome["error"], ValueError)
+
+    def test_no_functions(self):
+        outcome = self._run_in_greenlet(lambda: greenlet_run_many([]))
+        self.assertEqual(outcome, {"result": []})
+
+    def test_outside_greenlet_functions_are_called_sequentially(self):
+        self.assertEqual(greenlet_run_many([lambda: 1, lambda: 2]), [1, 2])
+
+    def test_fetch_many(self):
+        responses = {"http://a": Mock(), "http://b": Mock()}
+
+        def fetch(request, callback, **kwargs):
+            self.io_loop.add_callback(callback, responses[request])
+        http_client = Mock(fetch=fetch)
+
+        outcome = self._run_in_greenlet(lambda: greenlet_fetch_many(["http://a", "http://b"], http_client=http_client))
+        self.assertEqual(outcome, {"result": [responses["http://a"], responses["http://b"]]})
+
+
+class GreenletHedgeTestCase(AsyncTestCase):
+
+    def setUp(self):
+        super(GreenletHedgeTestCase, self).setUp()
+        greenlet_set_ioloop(self.io_loop)
+        self.calls = []
+        self.cancelled = {}
+
+    def _respond_after(self, name, delay, value):
+        # Return value (or raise it, if it is an exception) after delay seconds
+        def function(is_cancelled):
+            self.calls.append(name)
+            gr = greenlet.getcurrent()
+            self.io_loop.add_timeout(time.time() + delay, gr.switch)
+            gr.parent.switch()
+            self.cancelled[name] = is_cancelled()
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return function
+
+    def _run_in_greenlet(self, function):
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = function()
+            except Exception as e:
+                outcome["error"] = e
+            self.stop()
+        greenlet.greenlet(run).switch()
+        self.wait()
+        return outcome
+
+    def test_fast_function_is_not_hedged(self):
+        outcome = self._run_in_greenlet(lambda: greenlet_hedge(self._respond_after("primary", 0, "a"),
+                                                               self._respond_after("hedge", 0, "b"),
+                                                               delay=0.05))
+        self.assertEqual(outcome, {"result": (0, "a")})
+        self.assertEqual(self.calls, ["primary"])
+
+    def test_slow_function_is_hedged(self):
+        outcome = self._run_in_greenlet(lambda: greenlet_hedge(self._respond_after("primary", 0.1, "a"),
+                                                               self._respond_after("hedge", 0, "b"),
+                                                               delay=0.01))
+        self.assertEqual(outcome, {"result": (1, "b")})
+        self.assertEqual(self.calls, ["primary", "hedge"])
+
+        # wait for the loser to be notified that it was cancelled
+        self.io_loop.add_timeout(time.time() + 0.15, self.stop)
+        self.wait()
+        self.assertEqual(self.cancelled, {"primary": True, "hedge": False})
+
+    def test_failed_function_is_hedged_immediately(self):
+        outcome = self._run_in_greenlet(lambda: greenlet_hedge(self._respond_after("primary", 0, ValueError()),
+                                                               self._respond_after("hedge", 0, "b"),
+                                                               delay=10))
+        self.assertEqual(outcome, {"result": (1, "b")})
+
+    def test_failure_which_should_not_be_hedged_is_raised(self):
+        outcome = self._run_in_greenlet(lambda: greenlet_hedge(self._respond_after("primary", 0, ValueError()),
+                                                               self._respond_after("hedge", 0, "b"),
+                                                               delay=0.05,
+                                                               should_hedge=lambda e: not isinstance(e, ValueError)))
+        self.assertIsInstance(outcome["error"], ValueError)
+        # wait for the hedge, if it had been started
+        self.io_loop.add_timeout(time.time() + 0.1, self.stop)
+        self.wait()
+        self.assertEqual(self.calls, ["primary"])
+
+    def test_failure_which_should_be_hedged_is_hedged(self):
+        outcome = self._run_in_greenlet(lambda: greenlet_hedge(self._respond_after("primary", 0, KeyError()),
+                                                               self._respond_after("hedge", 0, "b"),
+                                                               delay=10,
+                                                               should_hedge=lambda e: not isinstance(e, ValueError)))
+        self.assertEqual(outcome, {"result": (1, "b")})
+
+    def test_exception_of_function_is_raised_if_both_fail(self):
+        outcome = self._run_in_greenlet(lambda: greenlet_hedge(self._respond_after("primary", 0, ValueError()),
+                                                               self._respond_after("hedge", 0, KeyError()),
+                                                               delay=0))
+        self.assertIsInstance(outcome["error"], ValueError)
+
+    def test_outside_greenlet_only_function_is_called(self):
+        result = greenlet_hedge(lambda is_cancelled: "a", lambda is_cancelled: "b", delay=0)
+        self.assertEqual(result, (0, "a"))
+
+
+class GreenletSleepTestCase(AsyncTestCase):
+
+    def setUp(self):
+        super(GreenletSleepTestCase, self).setUp()
+        greenlet_set_ioloop(self.io_loop)
+
+    def test_ioloop_keeps_running_while_greenlet_sleeps(self):
+        events = []
+
+        def sleeper():
+            greenlet_sleep(0.02)
+            events.append("slept")
+            self.stop()
+
+        greenlet.greenlet(sleeper).switch()
+        self.io_loop.add_callback(lambda: events.append("other callback"))
+        self.wait()
+        self.assertEqual(events, ["other callback", "slept"])
@@ -0,0 +1,50 @@
+import json
+import unittest
+
+from mock import patch
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from brainiak import handlers
+
+
+class PurgeWrittenInstanceTestCase(unittest.TestCase):
+
+    query_params = {"graph_uri": "graph", "class_uri": "Author", "instance_uri": "instance"}
+
+    @patch("brainiak.handlers.settings", ENABLE_CACHE=True)
+    @patch("brainiak.handlers.cache.purge_written_instance")
+    @patch("brainiak.handlers.schema_resource.query_superclasses", return_value=["Author", "Person"])
+    def test_collections_of_superclasses_are_purged(self, query_superclasses, purge_written_instance, settings):
+        handlers.purge_written_instance(self.query_params)
+        purge_written_instance.assert_called_once_with(self.query_params, ["Author", "Person"])
+
+    @patch("brainiak.handlers.logger")
+    @patch("brainiak.handlers.settings", ENABLE_CACHE=True)
+    @patch("brainiak.handlers.cache.purge_written_instance")
+    @patch("brainiak.handlers.schema_resource.query_superclasses", side_effect=Exception("triplestore is down"))
+    def test_instance_is_purged_even_if_superclasses_are_unknown(self, query_superclasses, purge_written_instance,
+                                                                 settings, logger):
+        handlers.purge_written_instance(self.query_params)
+        purge_written_instance.assert_called_once_with(self.query_params, [])
+        self.assertTrue(logger.error.called)
+
+    @patch("brainiak.handlers.settings", ENABLE_CACHE=False)
+    @patch("brainiak.handlers.cache.purge_written_instance")
+    @patch("brainiak.handlers.schema_resource.query_superclasses")
+    def test_superclasses_are_not_queried_without_cache(self, query_superclasses, purge_written_instance, settings):
+        handlers.purge_written_instance(self.query_params)
+        self.assertFalse(query_superclasses.called)
+
+
+class CacheStatusHandlerTestCase(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/_status/cache/?", handlers.CacheStatusHandler)])
+
+    @patch("brainiak.handlers.cache.stats_status", return_value={"families": {}, "hot_keys": [], "hot_keys_sample_rate": 0.1})
+    def test_stats_are_given_as_json(self, stats_status):
+        response = self.fetch("/_status/cache", headers={"Accept": "application/json"})
+        self.assertEqual(response.code, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("application/json"))
+        self.assertEqual(json.loads(response.body), {"families": {}, "hot_keys": [], "hot_keys_sample_rate": 0.1})
@@ -45,7 +45,7 @@ class GetContextTestCase(unittest.TestCase):
     @patch("brainiak.context.get_context.graph_exists", return_value=True)
     def test_list_classes_return_result(self, mocked_graph_exists):
         get_context.get_one_value = lambda x, y: "1"
-        get_context.assemble_list_json = lambda x, y: "expected result"
+        get_context.assemble_list_json = lambda x, y, z: "expected result"
         get_context.query_classes_list = lambda x: {'results': {'bindings': 'do not remove this'}}
         handler = MockHandler(page="1")
         params = ParamDict(handler, context_name="context_name", class_name="class_name", **LIST_PARAMS)
@@ -49,7 +49,7 @@ class GetContextTestCase(unittest.TestCase):
                     {"graph": {"value": "http://dbpedia.org/ontology/"}}
                 ]}
         }
-        triplestore.query_sparql = lambda query, params: response
+        triplestore.query_sparql = lambda query, params, **kwargs: response
 
     def tearDown(self):
         triplestore.query_sparql = self.original_query_sparql
@@ -1,7 +1,7 @@
 from unittest import TestCase
 
 from brainiak.handlers import ClassHandler, VersionHandler, \
-    HealthcheckHandler, VirtuosoStatusHandler, InstanceHandler, SuggestHandler, \
+    HealthcheckHandler, VirtuosoStatusHandler, QueryMetricsStatusHandler, InstanceHandler, SuggestHandler, \
     StoredQueryCollectionHandler, StoredQueryCRUDHandler, StoredQueryCRUDHandler, \
     StoredQueryExecutionHandler
 from brainiak.routes import ROUTES
@@ -24,6 +24,12 @@ class RouteTestCase(TestCase):
         VIRTUOSO_STATUS = '/_status/virtuoso'
         self.assertTrue(regex.match(VIRTUOSO_STATUS))
 
+    def test_status_virtuoso_queries(self):
+        regex = self._regex_for(QueryMetricsStatusHandler)
+        self.assertTrue(regex.match('/_status/virtuoso/queries'))
+        self.assertTrue(regex.match('/_status/virtuoso/queries/'))
+        self.assertFalse(self._regex_for(VirtuosoStatusHandler).match('/_status/virtuoso/queries'))
+
     def test_range_search(self):
         regex = self._regex_for(SuggestHandler)
         VIRTUOSO_STATUS = '/_suggest'
@@ -17,6 +17,7 @@ class MockResponse(object):
     def __init__(self, status_code=200, body="{}"):
         self.status_code = status_code
         self.body = body
+        self.content = body
         self.text = body
 
     def json(self):
@@ -180,3 +181,303 @@ class TriplestoreTestCase(unittest.TestCase):
         response = triplestore.query_sparql("", triplestore_config)
         self.assertEqual(greenlet_fetch.call_count, 1)
         self.assertEqual(response, {})
+
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_uses_connection_pool_of_section(self, mocked_log, greenlet_fetch):
+        config = dict(triplestore_config, pool_size="3", connect_timeout="2")
+        triplestore.query_sparql("", config)
+        request = greenlet_fetch.call_args[0][0]
+        http_client = greenlet_fetch.call_args[1]["http_client"]
+        pool = triplestore.connection_pool.get_pool(config)
+        self.assertIn(http_client, pool._clients.values())
+        self.assertEqual(request.connect_timeout, 2.0)
+        self.assertEqual(pool.active, 0)
+        self.assertEqual(pool.served, 1)
+
+    @patch('brainiak.triplestore._in_flight_queries.run', side_effect=lambda key, function: function())
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_coalesces_read_queries(self, mocked_log, greenlet_fetch, run):
+        triplestore.query_sparql(self.EXAMPLE_QUERY, triplestore_config)
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(greenlet_fetch.call_count, 1)
+        key = run.call_args[0][0]
+        self.assertEqual(key[0], triplestore_config["url"])
+
+    @patch('brainiak.triplestore._in_flight_queries.run')
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_does_not_coalesce_modify_queries(self, mocked_log, greenlet_fetch, run):
+        triplestore.query_sparql("INSERT DATA INTO <http://graph> {<http://s> <http://p> <http://o>}", triplestore_config)
+        self.assertFalse(run.called)
+        self.assertEqual(greenlet_fetch.call_count, 1)
+
+    def test_read_query_pattern(self):
+        self.assertTrue(triplestore.READ_QUERY_PATTERN.match(u"SELECT ?s {?s ?p ?o}"))
+        self.assertTrue(triplestore.READ_QUERY_PATTERN.match(u"""
+            DEFINE input:inference <http://semantica.globo.com/ruleset>
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            ask {?s ?p ?o}"""))
+        self.assertFalse(triplestore.READ_QUERY_PATTERN.match(u"DELETE DATA FROM <http://graph> {?s ?p ?o}"))
+        self.assertFalse(triplestore.READ_QUERY_PATTERN.match(u"""
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            INSERT DATA INTO <http://graph> {<http://s> <http://p> <http://o>}"""))
+
+    def test_process_triplestore_response_stream(self):
+        class TornadoHTTPResponse:
+            body = '{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://a"}}]}}'
+
+        response = triplestore._process_json_triplestore_response(TornadoHTTPResponse(), stream=True)
+        self.assertEqual(list(response["results"]["bindings"]), [{"s": {"type": "uri", "value": "http://a"}}])
+
+    def test_process_triplestore_response_stream_async_false(self):
+        class RequestsHTTPResponse:
+            content = '{"results": {"bindings": []}}'
+
+        response = triplestore._process_json_triplestore_response(RequestsHTTPResponse(), async=False, stream=True)
+        self.assertEqual(list(response["results"]["bindings"]), [])
+
+
+class IterBindingsTestCase(unittest.TestCase):
+
+    def test_iter_bindings_is_lazy(self):
+        body = '{"results": {"bindings": [{"s": {"type": "uri", "value": "http://a"}}, invalid]}}'
+        rows = triplestore.iter_bindings(body)
+        self.assertEqual(next(rows), {"s": {"type": "uri", "value": "http://a"}})
+        self.assertRaises(simplejson.JSONDecodeError, next, rows)
+
+    def test_iter_bindings_skips_other_members(self):
+        body = """{
+            "head": {"link": [], "vars": ["bindings", "label"]},
+            "results": {"distinct": false, "ordered": true, "bindings": [
+                {"bindings": {"type": "literal", "value": "}]"}},
+                {"label": {"type": "literal", "xml:lang": "pt", "value": "Caf\xc3\xa9"}}
+            ]},
+            "other": [1, 2]
+        }"""
+        expected = [
+            {"bindings": {"type": "literal", "value": "}]"}},
+            {"label": {"type": "literal", "xml:lang": "pt", "value": u"Caf\xe9"}}
+        ]
+        self.assertEqual(list(triplestore.iter_bindings(body)), expected)
+
+    def test_iter_bindings_of_empty_results(self):
+        self.assertEqual(list(triplestore.iter_bindings('{"head": {}, "results": {"bindings": []}}')), [])
+        self.assertEqual(list(triplestore.iter_bindings('{"head": {}, "boolean": true}')), [])
+        self.assertEqual(list(triplestore.iter_bindings('{}')), [])
+
+    def test_iter_bindings_of_invalid_body(self):
+        rows = triplestore.iter_bindings('<html>Error</html>')
+        self.assertRaises(simplejson.JSONDecodeError, list, rows)
+
+
+class IterTSVBindingsTestCase(unittest.TestCase):
+
+    def test_iter_tsv_bindings(self):
+        body = '?subject\t?label\t?total\n' + \
+               '<http://a>\t"Caf\xc3\xa9 \\"A\\"\\tB"@pt\t12\n' + \
+               '_:b1\t"x"^^<http://www.w3.org/2001/XMLSchema#date>\t\n'
+        expected = [
+            {
+                "subject": {"type": "uri", "value": "http://a"},
+                "label": {"type": "literal", "xml:lang": "pt", "value": u'Caf\xe9 "A"\tB'},
+                "total": {"type": "typed-literal", "datatype": triplestore.XSD_INTEGER, "value": "12"}
+            },
+            {
+                "subject": {"type": "bnode", "value": "b1"},
+                "label": {"type": "typed-literal", "datatype": "http://www.w3.org/2001/XMLSchema#date", "value": "x"}
+            }
+        ]
+        self.assertEqual(list(triplestore.iter_tsv_bindings(body)), expected)
+
+    def test_iter_tsv_bindings_with_quoted_values(self):
+        body = '"graph"\t"total"\r\n"http://a"\t1.5\r\n"http://b"\t1e3\r\n'
+        expected = [
+            {
+                "graph": {"type": "literal", "value": "http://a"},
+                "total": {"type": "typed-literal", "datatype": triplestore.XSD_DECIMAL, "value": "1.5"}
+            },
+            {
+                "graph": {"type": "literal", "value": "http://b"},
+                "total": {"type": "typed-literal", "datatype": triplestore.XSD_DOUBLE, "value": "1e3"}
+            }
+        ]
+        self.assertEqual(list(triplestore.iter_tsv_bindings(body)), expected)
+
+    def test_iter_tsv_bindings_with_multi_line_literals(self):
+        body = '?s\t?comment\t?n\n' + \
+               '<http://a>\t"first line\nsecond\tline"@en\t1\n' + \
+               '<http://b>\t"escaped\\nline"\t2\r\n'
+        expected = [
+            {
+                "s": {"type": "uri", "value": "http://a"},
+                "comment": {"type": "literal", "xml:lang": "en", "value": u"first line\nsecond\tline"},
+                "n": {"type": "typed-literal", "datatype": triplestore.XSD_INTEGER, "value": "1"}
+            },
+            {
+                "s": {"type": "uri", "value": "http://b"},
+                "comment": {"type": "literal", "value": u"escaped\nline"},
+                "n": {"type": "typed-literal", "datatype": triplestore.XSD_INTEGER, "value": "2"}
+            }
+        ]
+        self.assertEqual(list(triplestore.iter_tsv_bindings(body)), expected)
+
+    def test_iter_tsv_bindings_rejects_misaligned_rows(self):
+        # an unquoted line break can't be told from the end of a row
+        body = '?s\t?comment\n<http://a>\tfirst line\nsecond line\n'
+        rows = triplestore.iter_tsv_bindings(body)
+        self.assertEqual(next(rows)["comment"]["value"], u"first line")
+        with self.assertRaises(triplestore.TSVDecodeError) as context:
+            next(rows)
+        self.assertIn(u"Row 2 of the TSV results has 1 columns, but the header has 2", unicode(context.exception))
+
+    def test_iter_tsv_bindings_of_empty_results(self):
+        self.assertEqual(list(triplestore.iter_tsv_bindings('?s\t?o\n')), [])
+        self.assertEqual(list(triplestore.iter_tsv_bindings('')), [])
+
+    @patch('brainiak.triplestore.greenlet_fetch')
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_with_tsv_result_format(self, mocked_log, greenlet_fetch):
+        class TornadoHTTPResponse:
+            body = '?class\t?label\n<http://a>\t"A"\n'
+        greenlet_fetch.return_value = TornadoHTTPResponse()
+
+        response = triplestore.query_sparql("SELECT ?class ?label {?class rdfs:label ?label}", triplestore_config,
+                                            result_format=triplestore.TSV_RESPONSE_FORMAT)
+        expected_bindings = [{"class": {"type": "uri", "value": "http://a"},
+                              "label": {"type": "literal", "value": "A"}}]
+        self.assertEqual(response, {"results": {"bindings": expected_bindings}})
+        request = greenlet_fetch.call_args[0][0]
+        self.assertIn("format=text%2Ftab-separated-values", request.body)
+
+
+class ReplicasTestCase(unittest.TestCase):
+
+    CONFIG = dict(triplestore_config, read_urls="http://replica1:8890/sparql-auth")
+
+    def setUp(self):
+        self.original_endpoints = triplestore.replicas._endpoints
+        triplestore.replicas._endpoints = {}
+
+    def tearDown(self):
+        triplestore.replicas._endpoints = self.original_endpoints
+
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_read_query_is_sent_to_replica(self, mocked_log, greenlet_fetch):
+        triplestore.query_sparql("SELECT * {?s ?p ?o}", dict(self.CONFIG))
+        request = greenlet_fetch.call_args[0][0]
+        self.assertEqual(request.url, "http://replica1:8890/sparql-auth")
+        endpoint = triplestore.replicas.get_endpoint("http://replica1:8890/sparql-auth")
+        self.assertEqual(endpoint.requests, 1)
+        self.assertEqual(endpoint.outstanding, 0)
+
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_write_query_is_sent_to_writer(self, mocked_log, greenlet_fetch):
+        triplestore.query_sparql("INSERT DATA INTO <http://g> {<http://s> <http://p> <http://o>}", dict(self.CONFIG))
+        request = greenlet_fetch.call_args[0][0]
+        self.assertEqual(request.url, triplestore_config["url"])
+
+    @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(599))
+    @patch('brainiak.triplestore.log')
+    def test_unreachable_replica_is_counted_as_failure(self, mocked_log, greenlet_fetch):
+        self.assertRaises(ClientHTTPError, triplestore.query_sparql, "SELECT * {?s ?p ?o}", dict(self.CONFIG))
+        endpoint = triplestore.replicas.get_endpoint("http://replica1:8890/sparql-auth")
+        self.assertEqual(endpoint.failures, 1)
+        self.assertEqual(endpoint.outstanding, 0)
+
+    @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(400))
+    @patch('brainiak.triplestore.log')
+    def test_invalid_query_is_not_counted_as_failure(self, mocked_log, greenlet_fetch):
+        self.assertRaises(ClientHTTPError, triplestore.query_sparql, "SELECT * {?s ?p ?o}", dict(self.CONFIG))
+        endpoint = triplestore.replicas.get_endpoint("http://replica1:8890/sparql-auth")
+        self.assertEqual(endpoint.failures, 0)
+        self.assertEqual(endpoint.outstanding, 0)
+
+    @patch('brainiak.triplestore.greenlet_hedge', side_effect=lambda function, hedge_function, delay, should_hedge: (1, hedge_function(lambda: False)))
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_slow_read_query_is_hedged_to_another_replica(self, mocked_log, greenlet_fetch, greenlet_hedge):
+        original_hedging = triplestore.replicas._hedging
+        triplestore.replicas._hedging = {"queries": 0, "hedged": 0, "wins": 0}
+        try:
+            replica1 = triplestore.replicas.get_endpoint("http://replica1:8890/sparql-auth")
+            replica1.latencies.extend([0.1] * triplestore.replicas.HEDGE_MIN_SAMPLES)
+            config = dict(self.CONFIG, read_urls="http://replica1:8890/sparql-auth, http://replica2:8890/sparql-auth",
+                          hedge_percentile="95")
+            triplestore.query_sparql("SELECT * {?s ?p ?o}", config)
+
+            self.assertEqual(greenlet_hedge.call_args[0][2], 0.1)
+            request = greenlet_fetch.call_args[0][0]
+            self.assertEqual(request.url, "http://replica2:8890/sparql-auth")
+            self.assertEqual(triplestore.replicas._hedging, {"queries": 1, "hedged": 1, "wins": 1})
+        finally:
+            triplestore.replicas._hedging = original_hedging
+
+    @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(400))
+    @patch('brainiak.triplestore.log')
+    def test_invalid_read_query_is_not_hedged(self, mocked_log, greenlet_fetch):
+        def fake_hedge(function, hedge_function, delay, should_hedge=None):
+            # as if the query failed before the hedge delay
+            try:
+                return 0, function(lambda: False)
+            except Exception as e:
+                if should_hedge is not None and not should_hedge(e):
+                    raise
+                return 1, hedge_function(lambda: False)
+
+        original_hedging = triplestore.replicas._hedging
+        triplestore.replicas._hedging = {"queries": 0, "hedged": 0, "wins": 0}
+        try:
+            replica1 = triplestore.replicas.get_endpoint("http://replica1:8890/sparql-auth")
+            replica1.latencies.extend([0.1] * triplestore.replicas.HEDGE_MIN_SAMPLES)
+            config = dict(self.CONFIG, read_urls="http://replica1:8890/sparql-auth, http://replica2:8890/sparql-auth",
+                          hedge_percentile="95")
+            with patch('brainiak.triplestore.greenlet_hedge', side_effect=fake_hedge) as greenlet_hedge:
+                self.assertRaises(ClientHTTPError, triplestore.query_sparql, "SELECT * {?s ?p ?o}", config)
+
+            self.assertTrue(greenlet_hedge.called)
+            self.assertEqual(greenlet_fetch.call_count, 1)
+            self.assertEqual(triplestore.replicas._hedging["hedged"], 0)
+        finally:
+            triplestore.replicas._hedging = original_hedging
+
+
+class QueryMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        triplestore.metrics.reset()
+
+    def tearDown(self):
+        triplestore.metrics.reset()
+
+    @patch('brainiak.triplestore.settings.SLOW_QUERY_THRESHOLD_IN_SECS', 10)
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse(body='{"results": {"bindings": []}}'))
+    @patch('brainiak.triplestore.log')
+    def test_fast_query_is_measured_but_not_logged(self, mocked_log, greenlet_fetch):
+        triplestore.query_sparql("SELECT * {?s ?p ?o}", dict(triplestore_config), family="schema.class")
+        report = triplestore.queries_status()
+        self.assertEqual(report["schema.class"]["count"], 1)
+        self.assertEqual(report["schema.class"]["slow"], 0)
+        self.assertEqual(report["schema.class"]["response_bytes"]["total"], 29)
+        self.assertFalse(mocked_log.logger.info.called)
+
+    @patch('brainiak.triplestore.settings.SLOW_QUERY_THRESHOLD_IN_SECS', 0)
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_slow_query_is_logged(self, mocked_log, greenlet_fetch):
+        triplestore.query_sparql("SELECT * {?s ?p ?o}", dict(triplestore_config))
+        report = triplestore.queries_status()
+        self.assertEqual(report[triplestore.UNKNOWN_QUERY_FAMILY]["slow"], 1)
+        self.assertTrue(mocked_log.logger.info.called)
+
+    @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(400))
+    @patch('brainiak.triplestore.log')
+    def test_failed_query_is_counted_as_error(self, mocked_log, greenlet_fetch):
+        self.assertRaises(ClientHTTPError, triplestore.query_sparql, "SELECT * {?s ?p ?o}", dict(triplestore_config),
+                          family="collection.page")
+        report = triplestore.queries_status()
+        self.assertEqual(report["collection.page"]["errors"], 1)
+        self.assertEqual(report["collection.page"]["count"], 0)
@@ -0,0 +1,267 @@
+import time
+
+import greenlet
+from redis.exceptions import ConnectionError, ResponseError
+from tornado.iostream import IOStream
+from tornado.tcpserver import TCPServer
+from tornado.testing import AsyncTestCase, bind_unused_port
+
+from brainiak.greenlet_tornado import greenlet_set_ioloop
+from brainiak.utils.async_redis import AsyncRedis, encode_command
+
+
+class FakeRedisServer(TCPServer):
+    """
+    Understands just enough of the Redis protocol for the tests: commands are read as
+    multi bulk requests, and answered by the replies given in the constructor.
+    """
+
+    def __init__(self, replies, io_loop):
+        super(FakeRedisServer, self).__init__(io_loop=io_loop)
+        self.replies = replies
+        self.commands = []
+        self.connections = 0
+        self.closed = 0
+        self.on_close = None
+
+    def handle_stream(self, stream, address):
+        self.connections += 1
+        stream.set_close_callback(self._closed)
+        self._read_command(stream)
+
+    def _closed(self):
+        self.closed += 1
+        if self.on_close is not None:
+            self.on_close()
+
+    def _read_command(self, stream):
+        def on_count(line):
+            arguments = []
+            count = int(line[1:-2])
+
+            def on_length(line):
+                stream.read_bytes(int(line[1:-2]) + 2, on_argument)
+
+            def on_argument(data):
+                arguments.append(data[:-2])
+                if len(arguments) < count:
+                    stream.read_until("\r\n", on_length)
+                else:
+                    self.commands.append(arguments)
+                    reply = self.replies.get(arguments[0])
+                    if isinstance(reply, list):
+                        self._write_chunks(stream, list(reply))
+                    elif reply is not None:
+                        stream.write(reply)
+                    self._read_command(stream)
+
+            stream.read_until("\r\n", on_length)
+
+        if not stream.closed():
+            stream.read_until("\r\n", on_count)
+
+    def _write_chunks(self, stream, chunks):
+        "Write each chunk in its own IOLoop iteration, so that the client reads them separately. None closes the stream"
+        chunk = chunks.pop(0)
+        if chunk is None:
+            stream.close()
+            return
+        stream.write(chunk)
+        if chunks:
+            self.io_loop.add_timeout(time.time() + 0.005, lambda: self._write_chunks(stream, chunks))
+
+
+class AsyncRedisTestCase(AsyncTestCase):
+
+    REPLIES = {
+        "GET": "$5\r\nvalue\r\n",
+        "SETEX": "+OK\r\n",
+        "SMEMBERS": "*2\r\n$1\r\na\r\n$1\r\nb\r\n",
+        "DEL": ":2\r\n",
+        "INCRBY": ":3\r\n",
+        "KEYS": "*0\r\n",
+        "EVAL": "$-1\r\n",
+        "SADD": "-WRONGTYPE Operation against a key holding the wrong kind of value\r\n"
+    }
+
+    def setUp(self):
+        super(AsyncRedisTestCase, self).setUp()
+        greenlet_set_ioloop(self.io_loop)
+        sock, self.port = bind_unused_port()
+        self.server = FakeRedisServer(dict(self.REPLIES), io_loop=self.io_loop)
+        self.server.add_socket(sock)
+        self.client = AsyncRedis(port=self.port, timeout=1)
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.server.stop()
+        super(AsyncRedisTestCase, self).tearDown()
+
+    def _run(self, function):
+        "Run function in a greenlet (as request handlers do), and return what it returns or raises"
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(function())
+            except Exception as e:
+                outcome.append(e)
+            self.stop()
+
+        self.io_loop.add_callback(greenlet.greenlet(run).switch)
+        self.wait()
+        return outcome[0]
+
+    def test_encode_command(self):
+        self.assertEqual(encode_command(("SETEX", u"chave\xe7", 10, 0.5)),
+                         "*4\r\n$5\r\nSETEX\r\n$7\r\nchave\xc3\xa7\r\n$2\r\n10\r\n$3\r\n0.5\r\n")
+
+    def test_commands_and_response_callbacks(self):
+        self.assertEqual(self._run(lambda: self.client.get("key")), "value")
+        self.assertEqual(self._run(lambda: self.client.setex("key", 10, "value")), True)
+        self.assertEqual(self._run(lambda: self.client.smembers("tag")), set(["a", "b"]))
+        self.assertEqual(self._run(lambda: self.client.incr("key")), 3)
+        self.assertEqual(self._run(lambda: self.client.keys("k*")), [])
+        self.assertEqual(self._run(lambda: self.client.eval("return nil", 1, "key")), None)
+        self.assertEqual(self.server.commands[1], ["SETEX", "key", "10", "value"])
+        # the connection is reused
+        self.assertEqual(self.server.connections, 1)
+
+    def test_error_reply_is_raised(self):
+        error = self._run(lambda: self.client.sadd("key", "value"))
+        self.assertIsInstance(error, ResponseError)
+        self.assertEqual(str(error), "WRONGTYPE Operation against a key holding the wrong kind of value")
+        # the connection is still usable
+        self.assertEqual(self._run(lambda: self.client.get("key")), "value")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_error_reply_inside_multi_bulk_reply_is_returned(self):
+        self.server.replies["EVAL"] = "*2\r\n:1\r\n-ERR nested\r\n"
+        reply = self._run(lambda: self.client.eval("return {1, redis.error_reply('nested')}", 0))
+        self.assertEqual(reply[0], 1)
+        self.assertIsInstance(reply[1], ResponseError)
+
+    def test_nested_multi_bulk_reply(self):
+        self.server.replies["SCAN"] = "*2\r\n$1\r\n0\r\n*3\r\n$1\r\na\r\n$-1\r\n*1\r\n:7\r\n"
+        self.assertEqual(self._run(lambda: self.client.execute_command("SCAN", "0")), ["0", ["a", None, [7]]])
+
+    def test_empty_and_null_multi_bulk_replies(self):
+        self.server.replies["SCAN"] = "*2\r\n$0\r\n\r\n*-1\r\n"
+        self.assertEqual(self._run(lambda: self.client.execute_command("SCAN", "0")), ["", None])
+
+    def test_bulk_reply_is_binary_safe(self):
+        self.server.replies["GET"] = "$6\r\na\r\n\x00b\n\r\n"
+        self.assertEqual(self._run(lambda: self.client.get("key")), "a\r\n\x00b\n")
+
+    def test_reply_split_across_reads(self):
+        reply = "*2\r\n$5\r\nvalue\r\n*2\r\n:12\r\n$4\r\nb\r\nc\r\n"
+        # split everywhere: inside lengths, contents and line terminators
+        self.server.replies["SCAN"] = [reply[i:i + 3] for i in range(0, len(reply), 3)]
+        self.assertEqual(self._run(lambda: self.client.execute_command("SCAN", "0")), ["value", [12, "b\r\nc"]])
+
+    def test_pipeline_replies_split_across_reads(self):
+        # both replies are written once the last command is read
+        self.server.replies["GET"] = None
+        self.server.replies["DEL"] = ["$5\r\nva", "lue\r", "\n:", "2\r\n"]
+
+        def run_pipeline():
+            pipeline = self.client.pipeline()
+            pipeline.get("key")
+            pipeline.delete("a", "b")
+            return pipeline.execute()
+
+        self.assertEqual(self._run(run_pipeline), ["value", 2])
+
+    def test_connection_closed_in_the_middle_of_a_reply(self):
+        self.server.replies["GET"] = ["$5\r\nva", None]
+        self.assertIsInstance(self._run(lambda: self.client.get("key")), ConnectionError)
+        self.assertEqual(self.client.in_use, 0)
+        # a new connection is made for the next command
+        self.server.replies["GET"] = "$5\r\nvalue\r\n"
+        self.assertEqual(self._run(lambda: self.client.get("key")), "value")
+        self.assertEqual(self.server.connections, 2)
+
+    def test_invalid_reply(self):
+        self.server.replies["GET"] = "?what\r\n"
+        self.assertIsInstance(self._run(lambda: self.client.get("key")), ConnectionError)
+
+    def test_only_supported_commands_are_available(self):
+        self.assertFalse(hasattr(self.client, "lpush"))
+        self.assertFalse(hasattr(self.client.pipeline(), "hget"))
+        self.assertFalse(hasattr(self.client, "connection_pool"))
+
+    def test_pipeline_is_sent_in_one_round_trip(self):
+        def run_pipeline():
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.setex("key", 10, "value")
+            pipeline.delete("a", "b")
+            return pipeline.execute()
+
+        self.assertEqual(self._run(run_pipeline), [True, 2])
+        self.assertEqual(self.server.commands, [["SETEX", "key", "10", "value"], ["DEL", "a", "b"]])
+
+    def test_timeout(self):
+        self.client.timeout = 0.05
+        # the fake server doesn't answer PING
+        self.assertIsInstance(self._run(lambda: self.client.ping()), ConnectionError)
+        self.assertEqual(self.client.in_use, 0)
+        self.assertEqual(self._run(lambda: self.client.get("key")), "value")
+
+    def test_unreachable_server(self):
+        self.server.stop()
+        client = AsyncRedis(port=self.port, timeout=1)
+        self.assertIsInstance(self._run(lambda: client.get("key")), ConnectionError)
+        self.assertEqual(client.in_use, 0)
+
+    def test_greenlets_wait_for_a_free_connection(self):
+        self.client.max_connections = 1
+        results = []
+
+        def get():
+            results.append(self.client.get("key"))
+            if len(results) == 3:
+                self.stop()
+
+        for i in range(3):
+            self.io_loop.add_callback(greenlet.greenlet(get).switch)
+        self.wait()
+        self.assertEqual(results, ["value"] * 3)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.client.in_use, 0)
+
+    def test_subscribe(self):
+        # the confirmation of the subscription is followed by a message published to the channel
+        self.server.replies["SUBSCRIBE"] = "*3\r\n$9\r\nsubscribe\r\n$2\r\nch\r\n:1\r\n" + \
+            "*3\r\n$7\r\nmessage\r\n$2\r\nch\r\n$5\r\nhello\r\n"
+        events = []
+
+        def on_message(message):
+            events.append(message)
+            self.stop()
+
+        subscribe = lambda: self.client.subscribe("ch", on_message, on_subscribed=lambda: events.append("subscribed"))
+        self.io_loop.add_callback(greenlet.greenlet(subscribe).switch)
+        self.wait()
+        self.assertEqual(events, ["subscribed", "hello"])
+        self.assertEqual(self.server.commands, [["SUBSCRIBE", "ch"]])
+        # subscriptions don't use the connections of the pool
+        self.assertEqual(self.client.in_use, 0)
+
+    def test_subscription_is_closed_when_on_subscribed_fails(self):
+        self.server.replies["SUBSCRIBE"] = "*3\r\n$9\r\nsubscribe\r\n$2\r\nch\r\n:1\r\n"
+        self.server.on_close = self.stop
+        errors = []
+
+        def on_subscribed():
+            raise RuntimeError("reload failed")
+
+        def subscribe():
+            try:
+                self.client.subscribe("ch", lambda message: None, on_subscribed=on_subscribed)
+            except RuntimeError as e:
+                errors.append(e)
+
+        self.io_loop.add_callback(greenlet.greenlet(subscribe).switch)
+        self.wait()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.server.closed, 1)
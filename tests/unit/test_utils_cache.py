@@ -1,12 +1,17 @@
+import hashlib
 import logging
 import unittest
 
+import greenlet
 import redis
-from mock import patch, Mock
+import ujson
+from mock import ANY, patch, Mock
+from tornado.web import HTTPError
 
-from brainiak.utils.cache import build_key_for_class, CacheError, connect, memoize, ping, \
+from brainiak.utils import cache, cache_stats
+from brainiak.utils.cache import build_key_for_class, build_key_for_collection, CacheError, connect, memoize, ping, \
     purge_by_path, safe_redis, status_message, build_instance_key, get_usage_message
-from brainiak.utils.params import ParamDict
+from brainiak.utils.params import LIST_PARAMS, ParamDict
 from tests.mocks import MockRequest, MockHandler
 
 
@@ -26,9 +31,21 @@ class StrictRedisMock(object):
 
 class MemoizeTestCase(unittest.TestCase):
 
+    def setUp(self):
+        cache.local_cache.clear()
+        cache._key_hits.clear()
+        # as if Redis couldn't be reached
+        self.lease_patcher = patch("brainiak.utils.cache.acquire_lease", return_value=None)
+        self.lease_patcher.start()
+
+    def tearDown(self):
+        self.lease_patcher.stop()
+        cache.local_cache.clear()
+        cache._key_hits.clear()
+
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=False)
     @patch("brainiak.utils.cache.create")
-    @patch("brainiak.utils.cache.retrieve")
+    @patch("brainiak.utils.cache.retrieve_value")
     @patch("brainiak.utils.cache.redis", StrictRedis=StrictRedisMock)
     def test_memoize_cache_disabled(self, strict_redis, redis_get, redis_set, settings):
 
@@ -45,7 +62,7 @@ class MemoizeTestCase(unittest.TestCase):
 
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=False)
     @patch("brainiak.utils.cache.create")
-    @patch("brainiak.utils.cache.retrieve")
+    @patch("brainiak.utils.cache.retrieve_value")
     @patch("brainiak.utils.cache.redis", StrictRedis=StrictRedisMock)
     def test_memoize_cache_disabled_delegatee_receive_params(self, strict_redis, redis_get, redis_set, settings):
 
@@ -61,12 +78,13 @@ class MemoizeTestCase(unittest.TestCase):
         self.assertEqual(redis_get.call_count, 0)
         self.assertEqual(redis_set.call_count, 0)
 
+    @patch("brainiak.utils.cache.time.time", return_value=1000)
     @patch("brainiak.utils.cache.current_time", return_value='Fri, 11 May 1984 20:00:00 -0300')
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     @patch("brainiak.utils.cache.create", return_value=True)
-    @patch("brainiak.utils.cache.retrieve", return_value=None)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
     @patch("brainiak.utils.cache.redis", StrictRedis=StrictRedisMock)
-    def test_memoize_cache_enabled_but_without_cache(self, strict_redis, redis_get, redis_set, settings, isoformat):
+    def test_memoize_cache_enabled_but_without_cache(self, strict_redis, redis_get, redis_set, settings, isoformat, mock_time):
 
         def clean_up():
             return {"status": "Laundry done"}
@@ -78,7 +96,9 @@ class MemoizeTestCase(unittest.TestCase):
             'body': {"status": "Laundry done"},
             'meta': {
                 'cache': 'MISS',
-                'last_modified': 'Fri, 11 May 1984 20:00:00 -0300'
+                'last_modified': 'Fri, 11 May 1984 20:00:00 -0300',
+                'fresh_until': 1000 + cache.SOFT_TIME_TO_LIVE_IN_SECS,
+                'etag': cache.compute_etag('{"status": "Laundry done"}')
             }
         }
         self.assertEqual(answer, expected)
@@ -87,7 +107,8 @@ class MemoizeTestCase(unittest.TestCase):
 
     @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
     @patch("brainiak.utils.cache.create", return_value=True)
-    @patch("brainiak.utils.cache.retrieve", return_value={"status": "Dishes cleaned up", "meta": {}})
+    @patch("brainiak.utils.cache.retrieve_value",
+           return_value=cache.encode_response({"body": {"status": "Dishes cleaned up"}, "meta": {}}))
     @patch("brainiak.utils.cache.redis", StrictRedis=StrictRedisMock)
     def test_memoize_cache_enabled_and_hit(self, strict_redis, redis_get, redis_set, settings):
 
@@ -96,9 +117,398 @@ class MemoizeTestCase(unittest.TestCase):
 
         params = Mock(request=MockRequest(uri="/home"))
         answer = memoize(params, clean_up)
-        self.assertEqual(answer['status'], "Dishes cleaned up")
+        self.assertEqual(answer['body']['status'], "Dishes cleaned up")
+        self.assertEqual(answer['meta']['cache_tier'], "redis")
         self.assertEqual(redis_get.call_count, 1)
 
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_memoize_second_call_hits_local_tier(self, redis_get, redis_set, settings):
+        params = Mock(request=MockRequest(uri="/home"))
+        first_answer = memoize(params, lambda: {"status": "Laundry done"})
+        first_answer["body"]["status"] = "changed by the caller"
+        answer = memoize(params, lambda: {"status": "Not called"})
+
+        self.assertEqual(answer["body"], {"status": "Laundry done"})
+        self.assertEqual(answer["meta"]["cache"], "HIT")
+        self.assertEqual(answer["meta"]["cache_tier"], "local")
+        self.assertEqual(redis_get.call_count, 1)
+        self.assertIn("hits (local): ", cache.tiers_status_message())
+
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.redis_client")
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_purge_removes_local_entries(self, redis_get, redis_set, redis_client, settings):
+        redis_client.smembers.return_value = set()
+        redis_client.get.return_value = "0"
+        redis_client.pipeline.return_value.execute.return_value = [0]
+        memoize(None, lambda: {}, key=u"_@@_@@http://a@@lang=pt##instance")
+        memoize(None, lambda: {}, key=u"_@@_@@http://b@@lang=pt##instance")
+        cache.purge_an_instance(u"http://a")
+        self.assertEqual(cache.local_cache.get(u"_@@_@@http://a@@lang=pt##instance"), None)
+        self.assertNotEqual(cache.local_cache.get(u"_@@_@@http://b@@lang=pt##instance"), None)
+
+
+class StaleWhileRevalidateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cache.local_cache.clear()
+        cache._key_hits.clear()
+        # as if Redis couldn't be reached
+        self.lease_patcher = patch("brainiak.utils.cache.acquire_lease", return_value=None)
+        self.lease_patcher.start()
+
+    def tearDown(self):
+        self.lease_patcher.stop()
+        cache.local_cache.clear()
+        cache._key_hits.clear()
+
+    def _cached(self, fresh_until):
+        return cache.encode_response({"body": {"status": "cached"}, "meta": {"last_modified": "yesterday", "fresh_until": fresh_until}})
+
+    @patch("brainiak.utils.cache.time.time", return_value=1000)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    def test_stale_response_is_served_and_rebuilt(self, create, settings, mock_time):
+        with patch("brainiak.utils.cache.retrieve_value", return_value=self._cached(fresh_until=999)):
+            answer = memoize(None, lambda: {"status": "rebuilt"}, key="key")
+
+        self.assertEqual(answer["body"], {"status": "cached"})
+        self.assertEqual(answer["meta"]["cache"], "STALE")
+        self.assertEqual(create.call_count, 1)
+        self.assertIn('"rebuilt"', create.call_args[0][1])
+        self.assertEqual(cache._refreshing, set())
+
+    @patch("brainiak.utils.cache.time.time", return_value=1000)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value")
+    def test_fresh_response_is_not_rebuilt(self, retrieve, create, settings, mock_time):
+        retrieve.return_value = self._cached(fresh_until=1000 + cache.REFRESH_AHEAD_IN_SECS / 2)
+        answer = memoize(None, lambda: {"status": "rebuilt"}, key="key")
+        self.assertEqual(answer["meta"]["cache"], "HIT")
+        self.assertFalse(create.called)
+
+    @patch("brainiak.utils.cache.time.time", return_value=1000)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value")
+    def test_hot_response_is_rebuilt_before_becoming_stale(self, retrieve, create, settings, mock_time):
+        retrieve.return_value = self._cached(fresh_until=1000 + cache.REFRESH_AHEAD_IN_SECS / 2)
+        for i in range(cache.HOT_KEY_MIN_HITS):
+            cache.local_cache.clear()
+            answer = memoize(None, lambda: {"status": "rebuilt"}, key="key")
+            self.assertEqual(answer["meta"]["cache"], "HIT")
+        self.assertEqual(create.call_count, 1)
+
+    @patch("brainiak.utils.cache.log")
+    @patch("brainiak.utils.cache.time.time", return_value=1000)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    def test_failed_rebuild_keeps_serving_stale_response(self, create, settings, mock_time, log):
+        def fail():
+            raise Exception("triplestore is down")
+
+        with patch("brainiak.utils.cache.retrieve_value", return_value=self._cached(fresh_until=999)):
+            answer = memoize(None, fail, key="key")
+
+        self.assertEqual(answer["meta"]["cache"], "STALE")
+        self.assertFalse(create.called)
+        self.assertTrue(log.logger.error.called)
+        self.assertEqual(cache._refreshing, set())
+
+    @patch("brainiak.utils.cache._rebuild")
+    def test_rebuild_is_scheduled_on_the_ioloop_by_request_handlers(self, rebuild):
+        io_loop = Mock()
+        with patch("brainiak.utils.cache.greenlet_get_ioloop", return_value=io_loop):
+            greenlet.greenlet(lambda: cache._schedule_rebuild("key", None, None)).switch()
+            # a rebuild of the same key is already scheduled
+            greenlet.greenlet(lambda: cache._schedule_rebuild("key", None, None)).switch()
+        self.assertEqual(io_loop.add_callback.call_count, 1)
+        self.assertFalse(rebuild.called)
+        io_loop.add_callback.call_args[0][0]()
+        rebuild.assert_called_once_with("key", None, None)
+        cache._refreshing.clear()
+
+
+class BuildLeaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cache.local_cache.clear()
+
+    def tearDown(self):
+        cache.local_cache.clear()
+
+    @patch("brainiak.utils.cache.release_lease")
+    @patch("brainiak.utils.cache.acquire_lease", return_value="token")
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_lease_holder_builds_and_releases(self, retrieve, create, settings, acquire_lease, release_lease):
+        answer = memoize(None, lambda: {"status": "built"}, key="key")
+        self.assertEqual(answer["meta"]["cache"], "MISS")
+        self.assertTrue(create.called)
+        release_lease.assert_called_once_with("key", "token")
+
+    @patch("brainiak.utils.cache.greenlet_sleep")
+    @patch("brainiak.utils.cache.is_lease_held", return_value=True)
+    @patch("brainiak.utils.cache.release_lease")
+    @patch("brainiak.utils.cache.acquire_lease", return_value=False)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value")
+    def test_other_processes_wait_for_the_lease_holder(self, retrieve, create, settings, acquire_lease, release_lease,
+                                                       is_lease_held, sleep):
+        built_by_other = cache.encode_response({"body": {"status": "built by other"}, "meta": {"last_modified": "now"}})
+        retrieve.side_effect = [None, None, built_by_other]
+        answer = memoize(None, lambda: {"status": "Not called"}, key="key")
+        self.assertEqual(answer["body"], {"status": "built by other"})
+        self.assertEqual(answer["meta"]["cache"], "HIT")
+        self.assertEqual(sleep.call_count, 2)
+        self.assertFalse(create.called)
+        self.assertFalse(release_lease.called)
+
+    @patch("brainiak.utils.cache.release_lease")
+    @patch("brainiak.utils.cache.acquire_lease", return_value="token")
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_lease_is_released_when_the_build_fails(self, retrieve, create, settings, acquire_lease, release_lease):
+        def fail():
+            raise HTTPError(404)
+        self.assertRaises(HTTPError, memoize, None, fail, key="key")
+        self.assertFalse(create.called)
+        release_lease.assert_called_once_with("key", "token")
+
+    @patch("brainiak.utils.cache.greenlet_sleep")
+    @patch("brainiak.utils.cache.is_lease_held", return_value=False)
+    @patch("brainiak.utils.cache.release_lease")
+    @patch("brainiak.utils.cache.acquire_lease", return_value=False)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_waiters_stop_polling_when_the_build_of_the_lease_holder_fails(self, retrieve, create, settings, acquire_lease,
+                                                                          release_lease, is_lease_held, sleep):
+        # the lease holder released its lease without caching the response
+        answer = memoize(None, lambda: {"status": "built"}, key="key")
+        self.assertEqual(answer["body"], {"status": "built"})
+        self.assertEqual(answer["meta"]["cache"], "MISS")
+        self.assertEqual(sleep.call_count, 1)
+        is_lease_held.assert_called_once_with("key")
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_is_lease_held(self, redis_client):
+        redis_client.get.return_value = None
+        self.assertFalse(cache.is_lease_held("key"))
+        redis_client.get.assert_called_once_with(cache.NAMESPACE + u"##lease##key")
+
+    @patch("brainiak.utils.cache.BUILD_WAIT_IN_SECS", 0)
+    @patch("brainiak.utils.cache.release_lease")
+    @patch("brainiak.utils.cache.acquire_lease", return_value=False)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_response_is_built_if_lease_holder_takes_too_long(self, retrieve, create, settings, acquire_lease, release_lease):
+        answer = memoize(None, lambda: {"status": "built"}, key="key")
+        self.assertEqual(answer["body"], {"status": "built"})
+        self.assertEqual(answer["meta"]["cache"], "MISS")
+        self.assertFalse(release_lease.called)
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_acquire_lease(self, redis_client):
+        redis_client.set.return_value = True
+        token = cache.acquire_lease("key")
+        self.assertTrue(token)
+        redis_client.set.assert_called_once_with(cache.NAMESPACE + u"##lease##key", token, ex=cache.BUILD_LEASE_TIME_IN_SECS, nx=True)
+        redis_client.set.return_value = None
+        self.assertIs(cache.acquire_lease("key"), False)
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_release_lease_only_deletes_own_lease(self, redis_client):
+        cache.release_lease("key", "token")
+        redis_client.eval.assert_called_once_with(cache.RELEASE_LEASE_SCRIPT, 1, cache.NAMESPACE + u"##lease##key", "token")
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_acquire_lease_for_a_given_time(self, redis_client):
+        token = cache.acquire_lease("key", 300)
+        redis_client.set.assert_called_once_with(cache.NAMESPACE + u"##lease##key", token, ex=300, nx=True)
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_renew_lease_only_extends_own_lease(self, redis_client):
+        redis_client.eval.return_value = 0
+        self.assertFalse(cache.renew_lease("key", "token", 300))
+        redis_client.eval.assert_called_once_with(cache.RENEW_LEASE_SCRIPT, 1, cache.NAMESPACE + u"##lease##key", "token", 300)
+
+
+class PayloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cache.local_cache.clear()
+
+    def tearDown(self):
+        cache.local_cache.clear()
+
+    def test_small_response_is_not_compressed(self):
+        value = cache.encode_response({"body": {"a": u"\xe7"}, "meta": {"last_modified": "now"}})
+        etag = cache.compute_etag('{"a": "\\u00e7"}')
+        self.assertEqual(value, 'j{"last_modified":"now","etag":%s}\n{"a": "\\u00e7"}' % ujson.dumps(etag))
+        self.assertEqual(cache.decode_response(value), {"body": {"a": u"\xe7"}, "meta": {"last_modified": "now", "etag": etag}})
+
+    def test_etag_is_computed_once_when_the_response_is_cached(self):
+        response = {"body": {"a": 1}, "meta": {"last_modified": "now"}}
+        value = cache.encode_response(response)
+        self.assertEqual(response["meta"]["etag"], '"{0}"'.format(hashlib.sha1('{"a": 1}').hexdigest()))
+        self.assertEqual(cache.decode_response(value, serialized=True)["meta"]["etag"], response["meta"]["etag"])
+
+    def test_large_response_is_compressed(self):
+        response = {"body": {"items": ["http://example.onto/Place"] * 100}, "meta": {"last_modified": "now"}}
+        value = cache.encode_response(response)
+        self.assertTrue(value.startswith(cache.COMPRESSED_HEADER))
+        self.assertLess(len(value), cache.COMPRESSION_MIN_BYTES)
+        self.assertEqual(cache.decode_response(value), response)
+
+    def test_serialized_body_is_not_parsed(self):
+        body = {"items": ["http://example.onto/Place"] * 100}
+        value = cache.encode_response({"body": body, "meta": {"last_modified": "now"}})
+        response = cache.decode_response(value, serialized=True)
+        self.assertNotIn("body", response)
+        self.assertEqual(response["serialized_body"], cache.serialize_body(body))
+
+    def test_plain_json_is_decoded(self):
+        self.assertEqual(cache.decode_response('{"a": 1}'), {"a": 1})
+
+    @patch("brainiak.utils.cache.acquire_lease", return_value=None)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_memoize_serialized(self, retrieve_value, create, settings, acquire_lease):
+        miss = memoize(None, lambda: {"status": "built"}, key="key", serialized=True)
+        hit = memoize(None, lambda: {"status": "Not called"}, key="key", serialized=True)
+        self.assertEqual(miss["serialized_body"], '{"status": "built"}')
+        self.assertEqual(hit["serialized_body"], '{"status": "built"}')
+        self.assertEqual(hit["meta"]["cache"], "HIT")
+        self.assertNotIn("body", hit)
+
+    @patch("brainiak.utils.cache.acquire_lease", return_value=None)
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_memoize_records_stats_of_the_key_family(self, retrieve_value, create, settings, acquire_lease):
+        cache_stats.reset()
+        memoize(None, lambda: {"status": "built"}, key="graph@@Class##class", serialized=True)
+        memoize(None, lambda: {"status": "Not called"}, key="graph@@Class##class", serialized=True)
+        stats = cache.stats_status()["families"]["class"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"], stats["builds"]), (1, 1, 1, 1))
+        self.assertTrue(stats["stored_bytes"]["total"] > len('{"status": "built"}'))
+        cache_stats.reset()
+
+    @patch("brainiak.utils.cache.cache_stats.report", return_value={
+        "families": {"class": {"hits": 3, "misses": 1, "hit_ratio": 0.75, "stores": 1, "purges": 0, "builds": 1,
+                               "stored_bytes": {"total": 120, "mean": 120, "max": 120},
+                               "build_time_in_secs": {"mean": 0.2, "max": 0.2, "p50": 0.25, "p90": 0.25, "p99": 0.25}}},
+        "hot_keys": [{"key": "graph@@Class##class", "lookups": 30, "error": 0}],
+        "hot_keys_sample_rate": 0.1})
+    def test_stats_status_message(self, report):
+        message = cache.stats_status_message()
+        self.assertIn(u"Cache family class | hits: 3 | misses: 1 | hit ratio: 75% | stores: 1 | purges: 0 | " +
+                      u"stored bytes: 120 | builds: 1 | build time (p50/p90/p99): 0.250s/0.250s/0.250s", message)
+        self.assertIn(u"<br>Hot key graph@@Class##class | lookups: 30 | error: 0", message)
+
+    @patch("brainiak.utils.cache.cache_stats.report", return_value={"families": {}, "hot_keys": [], "hot_keys_sample_rate": 0.1})
+    def test_stats_status_message_without_stats(self, report):
+        self.assertEqual(cache.stats_status_message(), u"There are no cache statistics")
+
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=False)
+    def test_memoize_serialized_without_cache(self, settings):
+        response = memoize(None, lambda: {"status": "built"}, key="key", serialized=True)
+        self.assertEqual(response["serialized_body"], '{"status": "built"}')
+        self.assertEqual(response["meta"]["cache"], "MISS")
+
+
+class NegativeCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cache.local_cache.clear()
+
+    def tearDown(self):
+        cache.local_cache.clear()
+
+    @patch("brainiak.utils.cache.acquire_lease", return_value=None)
+    @patch("brainiak.utils.cache.create_missing")
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_missing_response_is_cached(self, retrieve_value, settings, create_missing, acquire_lease):
+        self.assertIsNone(memoize(None, lambda: None, key="key"))
+        create_missing.assert_called_once_with("key")
+
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=cache.MISSING_VALUE)
+    def test_missing_response_is_not_rebuilt_nor_kept_locally(self, retrieve_value, settings):
+        def fail():
+            raise AssertionError("should not be called")
+
+        self.assertIsNone(memoize(None, fail, key="key"))
+        self.assertIsNone(memoize(None, fail, key="key"))
+        self.assertEqual(retrieve_value.call_count, 2)
+        self.assertEqual(len(cache.local_cache), 0)
+
+    @patch("brainiak.utils.cache._tag_bucket", return_value=7)
+    @patch("brainiak.utils.cache.settings", CACHE_NEGATIVE_TTL_IN_SECS=30)
+    @patch("brainiak.utils.cache.redis_client")
+    def test_create_missing(self, redis_client, settings, tag_bucket):
+        pipeline = redis_client.pipeline.return_value
+        pipeline.execute.return_value = [True, 1, True]
+        cache.create_missing(u"@@page=1##root")
+        key = cache.NAMESPACE + u"@@page=1##root"
+        pipeline.setex.assert_called_once_with(key, 30, cache.MISSING_VALUE)
+        # the tag set lives as long as the responses it contains
+        pipeline.expire.assert_called_once_with(cache.NAMESPACE + u"##tag##type:root##7", cache.TIME_TO_LIVE_IN_SECS)
+
+    @patch("brainiak.utils.cache.create_missing")
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=None)
+    def test_memoize_existence_caches_missing_resources(self, retrieve_value, settings, create_missing):
+        self.assertTrue(cache.memoize_existence("graph##graph", lambda params: True, {}))
+        self.assertFalse(create_missing.called)
+        self.assertFalse(cache.memoize_existence("graph##graph", lambda params: False, {}))
+        create_missing.assert_called_once_with("graph##graph")
+
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.retrieve_value", return_value=cache.MISSING_VALUE)
+    def test_memoize_existence_of_known_missing_resource(self, retrieve_value, settings):
+        exists = Mock(return_value=True)
+        self.assertFalse(cache.memoize_existence("graph##graph", exists, {}))
+        self.assertFalse(exists.called)
+
+    @patch("brainiak.utils.cache.delete")
+    @patch("brainiak.utils.cache.bump_collection_generation")
+    @patch("brainiak.utils.cache.purge_an_instance")
+    def test_purge_written_instance(self, purge_an_instance, bump_collection_generation, delete):
+        cache.purge_written_instance({"graph_uri": "graph", "class_uri": "Class", "instance_uri": "instance"})
+        purge_an_instance.assert_called_once_with("instance")
+        bump_collection_generation.assert_called_once_with("graph", "Class")
+        delete.assert_called_once_with(u"graph##graph")
+
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.delete")
+    @patch("brainiak.utils.cache.purge_an_instance")
+    @patch("brainiak.utils.cache.redis_client")
+    def test_writing_an_instance_of_a_subclass_invalidates_the_superclass_collections(self, redis_client, purge_an_instance,
+                                                                                       delete, settings):
+        generations = {}
+        redis_client.get.side_effect = generations.get
+        redis_client.incr.side_effect = lambda key: generations.__setitem__(key, generations.get(key, 0) + 1)
+        url_params = dict(graph_uri="graph", class_uri="Person")
+        superclass_listing = ParamDict(MockHandler(**url_params), **url_params)
+        before = build_key_for_collection(superclass_listing)
+
+        cache.purge_written_instance({"graph_uri": "graph", "class_uri": "Author", "instance_uri": "instance"},
+                                     ["Author", "Person"])
+
+        self.assertNotEqual(build_key_for_collection(superclass_listing), before)
+
 
 class GeneralFunctionsTestCase(unittest.TestCase):
 
@@ -189,6 +599,49 @@ class GeneralFunctionsTestCase(unittest.TestCase):
             self.assertIn(expected_in_status_msg, usage_message)
 
 
+class ShardedCacheTestCase(unittest.TestCase):
+
+    @patch("brainiak.utils.cache.settings.REDIS_NODES", ["redis1:6379", "redis2:6380"])
+    def test_connect_to_every_node(self):
+        client = connect()
+        self.assertIsInstance(client, cache.ShardedRedis)
+        self.assertEqual(client.names, [u"redis1:6379", u"redis2:6380"])
+        self.assertEqual([shard.connection_pool.connection_kwargs["port"] for shard in client.shards], [6379, 6380])
+
+    @patch("brainiak.utils.cache.settings.REDIS_NODES", ["redis1:6379", "redis2:6380"])
+    @patch("brainiak.utils.cache.ping", return_value=False)
+    @patch("brainiak.utils.cache.get_usage_message", return_value="")
+    def test_status_lists_every_node(self, get_usage_message, ping):
+        self.assertIn("| FAILED | redis1:6379,redis2:6380 |", status_message())
+
+    @patch("brainiak.utils.cache.log.logger")
+    def test_keyspace_commands_degrade_per_shard(self, logger):
+        working = Mock(**{"keys.return_value": [cache.NAMESPACE + u"a"], "ping.return_value": True,
+                          "execute_command.return_value": ("0", [cache.NAMESPACE + u"a"])})
+        failing = Mock(**{"keys.side_effect": CacheError, "ping.side_effect": CacheError,
+                          "execute_command.side_effect": CacheError})
+        sharded = cache.ShardedRedis([("redis1:6379", working), ("redis2:6379", failing)])
+        # safe_redis reconnects before trying again
+        with patch("brainiak.utils.cache.connect", return_value=sharded):
+            with patch("brainiak.utils.cache.redis_client", sharded):
+                self.assertEqual(cache.keys(u""), [u"a"])
+                self.assertEqual(cache._scan_keys(u""), [cache.NAMESPACE + u"a"])
+                self.assertFalse(cache.ping())
+        # the failing node was tried twice for each command, by safe_redis
+        self.assertEqual(failing.keys.call_count, 2)
+
+    def test_usage_of_each_node(self):
+        info = dict(GeneralFunctionsTestCase.STANDARD_INFO_KEYS, keyspace_hits="1", keyspace_misses="1")
+        working = Mock(**{"info.side_effect": lambda *args: {"db0": {"keys": 3}} if args else info})
+        failing = Mock(**{"info.side_effect": CacheError})
+        sharded = cache.ShardedRedis([("redis1:6379", working), ("redis2:6379", failing)])
+        with patch("brainiak.utils.cache.redis_client", sharded):
+            usage_message = get_usage_message()
+        self.assertIn("Node: redis1:6379<br>Version: xubiru", usage_message)
+        self.assertIn("Number of keys: 3 | Hit ratio: 0.5", usage_message)
+        self.assertIn("Node: redis2:6379<br>FAILED | Traceback", usage_message)
+
+
 class SafeRedisTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -254,9 +707,67 @@ class CacheUtilsTestCase(unittest.TestCase):
         handler = MockHandler(**url_params)
         params = ParamDict(handler, **url_params)
         computed = build_instance_key(params)
-        expected = "_@@_@@instance@@expand_uri=1&instance_uri=instance&lang=pt##instance"
+        expected = u"_@@_@@instance@@{0}##instance".format(cache.params_digest(params, cache.INSTANCE_KEY_PARAMS))
         self.assertEqual(computed, expected)
 
+    def _instance_params(self, querystring):
+        url_params = dict(graph_uri="graph", class_uri="Class", instance_uri="instance")
+        handler = MockHandler(uri="http://mock.test.com/graph/Class/instance", querystring=querystring, **url_params)
+        return ParamDict(handler, **url_params)
+
+    @patch("brainiak.utils.cache._key_variants_count", {"keys": 0, "variants": 0})
+    def test_instance_keys_are_canonical(self):
+        cache._key_variants.clear()
+        key = build_instance_key(self._instance_params("lang=pt&expand_uri=1"))
+        # order of the arguments, and arguments equal to the defaults
+        self.assertEqual(build_instance_key(self._instance_params("expand_uri=1&lang=pt")), key)
+        self.assertEqual(build_instance_key(self._instance_params("")), key)
+        self.assertNotEqual(build_instance_key(self._instance_params("lang=en")), key)
+        self.assertIn(u"keys: 2 | request variants: 4 | duplicates: 50%", cache.keys_status_message())
+        cache._key_variants.clear()
+
+    def test_collection_keys_ignore_parameters_that_dont_change_collections(self):
+        url_params = dict(graph_uri="graph", class_uri="Class")
+        filtered = ParamDict(MockHandler(querystring="p=rdfs:label&page=2", **url_params), **dict(url_params, **LIST_PARAMS))
+        unfiltered = ParamDict(MockHandler(querystring="page=2", **url_params), **dict(url_params, **LIST_PARAMS))
+        digest = cache.params_digest(filtered, cache.COLLECTION_KEY_PARAMS, (cache.PATTERN_P, cache.PATTERN_O))
+        self.assertNotEqual(digest, cache.params_digest(unfiltered, cache.COLLECTION_KEY_PARAMS, (cache.PATTERN_P, cache.PATTERN_O)))
+        # p is ignored if it isn't one of the patterns
+        self.assertEqual(cache.params_digest(filtered, cache.COLLECTION_KEY_PARAMS),
+                         cache.params_digest(unfiltered, cache.COLLECTION_KEY_PARAMS))
+
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=False)
+    def test_collection_keys_depend_on_what_links_and_items_are_built_from(self, settings):
+        url_params = dict(graph_uri="graph", class_uri="Class")
+
+        def key_for(uri="http://mock.test.com/graph/Class", querystring="", headers=None, **params):
+            handler = MockHandler(uri=uri, querystring=querystring, headers=headers, **url_params)
+            return build_key_for_collection(ParamDict(handler, **dict(url_params, **params)))
+
+        key = key_for()
+        self.assertEqual(key_for(), key)
+        self.assertNotEqual(key_for(uri="http://other.host.com/graph/Class"), key)
+        self.assertNotEqual(key_for(headers={"X-Forwarded-Proto": "https"}), key)
+        self.assertNotEqual(key_for(querystring="class_prefix=http://other.prefix/"), key)
+        self.assertNotEqual(key_for(querystring="graph_uri=graph"), key)
+
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.redis_client")
+    def test_build_key_for_collection_uses_class_generation(self, redis_client, settings):
+        url_params = dict(graph_uri="graph", class_uri="Class")
+        params = ParamDict(MockHandler(**url_params), **url_params)
+        redis_client.get.return_value = None
+        self.assertTrue(build_key_for_collection(params).startswith(u"graph@@Class@@0@@"))
+        redis_client.get.return_value = "7"
+        self.assertTrue(build_key_for_collection(params).startswith(u"graph@@Class@@7@@"))
+        redis_client.get.assert_called_with(cache.NAMESPACE + u"graph@@Class##generation")
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_bump_collection_generation(self, redis_client):
+        redis_client.incr.return_value = 8
+        self.assertEqual(cache.bump_collection_generation("graph", "Class"), 8)
+        redis_client.incr.assert_called_once_with(cache.NAMESPACE + u"graph@@Class##generation")
+
     @patch("brainiak.utils.cache.delete")
     @patch("brainiak.utils.cache.purge")
     def test_purge_by_path(self, mock_purge, mock_delete):
@@ -265,23 +776,40 @@ class CacheUtilsTestCase(unittest.TestCase):
         self.assertTrue(mock_delete.called)
         mock_delete.assert_called_with(u"_##json_schema")
 
+    @patch("brainiak.utils.cache._invalidate")
     @patch("brainiak.utils.cache.purge_all_instances")
     @patch("brainiak.utils.cache.delete")
     @patch("brainiak.utils.cache.flushall")
-    def test_purge_by_path_all(self, mock_flushall, mock_delete, mock_purge_all):
+    def test_purge_by_path_all(self, mock_flushall, mock_delete, mock_purge_all, mock_invalidate):
         purge_by_path(u"_##root", True)
         self.assertFalse(mock_delete.called)
         self.assertTrue(mock_flushall.called)
+        mock_invalidate.assert_called_once_with("clear_local")
 
+    @patch("brainiak.utils.cache.bump_collection_generation")
     @patch("brainiak.utils.cache.purge_all_instances")
     @patch("brainiak.utils.cache.delete")
+    @patch("brainiak.utils.cache.purge_tag")
     @patch("brainiak.utils.cache.purge")
-    def test_purge_by_path_recursive(self, mock_purge, mock_delete, mock_purge_all):
-        purge_by_path(u"graph@@class##type", True)
+    def test_purge_by_path_recursive(self, mock_purge, mock_purge_tag, mock_delete, mock_purge_all, mock_bump):
+        purge_by_path(u"graph@@class##class", True)
         self.assertFalse(mock_delete.called)
-        self.assertTrue(mock_purge.called)
+        # the keyspace isn't scanned
+        self.assertFalse(mock_purge.called)
+        mock_purge_tag.assert_called_once_with(u"class:graph@@class", u"graph@@class*")
+        mock_bump.assert_called_once_with(u"graph", u"class")
+        self.assertTrue(mock_purge_all.called)
+
+    @patch("brainiak.utils.cache.purge_all_instances")
+    @patch("brainiak.utils.cache.delete")
+    @patch("brainiak.utils.cache.purge_tag")
+    @patch("brainiak.utils.cache.purge")
+    def test_purge_by_path_recursive_graph(self, mock_purge, mock_purge_tag, mock_delete, mock_purge_all):
+        purge_by_path(u"graph##graph", True)
+        self.assertFalse(mock_purge.called)
+        mock_purge_tag.assert_called_once_with(u"graph:graph", u"graph*")
+        mock_delete.assert_called_once_with(u"graph##graph")
         self.assertTrue(mock_purge_all.called)
-        mock_purge.assert_called_with(u"graph@@class")
 
     @patch("brainiak.utils.cache.delete")
     @patch("brainiak.utils.cache.purge")
@@ -290,3 +818,212 @@ class CacheUtilsTestCase(unittest.TestCase):
         self.assertFalse(mock_purge.called)
         self.assertTrue(mock_delete.called)
         mock_delete.assert_called_with(u"graph@@class##type")
+
+
+class TagsTestCase(unittest.TestCase):
+
+    def test_tags_of_instance_key(self):
+        key = u"_@@_@@http://example.onto/Place@@expand_uri=1&lang=pt##instance"
+        self.assertEqual(cache._tags_of(key), [u"type:instance", u"instance:http://example.onto/Place"])
+
+    def test_tags_of_class_key(self):
+        key = u"http://example.onto/@@http://example.onto/Place##class"
+        self.assertEqual(cache._tags_of(key), [u"graph:http://example.onto/",
+                                               u"class:http://example.onto/@@http://example.onto/Place"])
+
+    def test_tags_of_collection_key(self):
+        key = u"http://example.onto/@@http://example.onto/Place@@3@@page=0##collection"
+        self.assertEqual(cache._tags_of(key), [u"graph:http://example.onto/",
+                                               u"class:http://example.onto/@@http://example.onto/Place"])
+
+    def test_tags_of_graph_existence_key(self):
+        self.assertEqual(cache._tags_of(u"http://example.onto/##graph"), [u"graph:http://example.onto/"])
+
+    def test_tags_of_root_key(self):
+        self.assertEqual(cache._tags_of(u"@@page=1##root"), [u"type:root"])
+
+    def test_keys_which_are_not_purged_by_tag_are_not_tagged(self):
+        self.assertEqual(cache._tags_of(u"http://example.onto/@@http://example.onto/Place##json_schema"), [])
+        self.assertEqual(cache._tags_of(u"http://example.onto/@@http://example.onto/Place##generation"), [])
+
+    @patch("brainiak.utils.cache.time.time", return_value=3 * cache.TAG_BUCKET_IN_SECS + 10)
+    def test_tag_keys_are_the_current_and_the_previous_bucket(self, mock_time):
+        self.assertEqual(cache._tag_keys(u"type:root"), [cache.NAMESPACE + u"##tag##type:root##3",
+                                                         cache.NAMESPACE + u"##tag##type:root##2"])
+
+    @patch("brainiak.utils.cache._tag_bucket", return_value=7)
+    @patch("brainiak.utils.cache.redis_client")
+    def test_create_adds_key_to_tag_sets(self, redis_client, tag_bucket):
+        pipeline = redis_client.pipeline.return_value
+        pipeline.execute.return_value = [True, 1, True, 1, True]
+        self.assertTrue(cache.create(u"_@@_@@http://a@@lang=pt##instance", "{}"))
+        key = cache.NAMESPACE + u"_@@_@@http://a@@lang=pt##instance"
+        pipeline.setex.assert_called_once_with(key, cache.TIME_TO_LIVE_IN_SECS, "{}")
+        tag_sets = [call[0] for call in pipeline.sadd.call_args_list]
+        self.assertEqual(tag_sets, [(cache.NAMESPACE + u"##tag##type:instance##7", key),
+                                    (cache.NAMESPACE + u"##tag##instance:http://a##7", key)])
+        self.assertEqual(pipeline.execute.call_count, 1)
+
+    @patch("brainiak.utils.cache._tag_bucket", return_value=7)
+    @patch("brainiak.utils.cache.redis_client")
+    def test_purge_an_instance_deletes_tagged_keys_in_one_round_trip(self, redis_client, tag_bucket):
+        redis_client.smembers.side_effect = [set([u"ns:_@@_@@http://a@@lang=pt##instance"]),
+                                             set([u"ns:_@@_@@http://a@@lang=en##instance"])]
+        pipeline = redis_client.pipeline.return_value
+        pipeline.execute.return_value = [3]
+
+        cache.purge_an_instance(u"http://a")
+
+        self.assertFalse(redis_client.keys.called)
+        self.assertFalse(redis_client.execute_command.called)
+        self.assertFalse(redis_client.delete.called)
+        deleted = pipeline.delete.call_args[0]
+        self.assertEqual(sorted(deleted), [cache.NAMESPACE + u"##tag##instance:http://a##6",
+                                           cache.NAMESPACE + u"##tag##instance:http://a##7",
+                                           u"ns:_@@_@@http://a@@lang=en##instance",
+                                           u"ns:_@@_@@http://a@@lang=pt##instance"])
+        self.assertEqual(pipeline.execute.call_count, 1)
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_purge_uses_scan_instead_of_keys(self, redis_client):
+        redis_client.execute_command.side_effect = [("12", [u"ns:graph@@class##class"]), ("0", [])]
+        redis_client.pipeline.return_value.execute.return_value = [1]
+        cache.purge(u"graph@@class")
+        self.assertFalse(redis_client.keys.called)
+        self.assertEqual(redis_client.execute_command.call_count, 2)
+        redis_client.execute_command.assert_called_with(
+            "SCAN", "12", "MATCH", cache.NAMESPACE + u"graph@@class*", "COUNT", cache.SCAN_BATCH_SIZE)
+        redis_client.pipeline.return_value.delete.assert_called_once_with(u"ns:graph@@class##class")
+
+
+class NamespaceTestCase(unittest.TestCase):
+
+    def test_namespace_depends_on_release_and_format(self):
+        self.assertEqual(cache.NAMESPACE, u"brainiak:{0}:{1}:".format(cache.version.RELEASE, cache.CACHE_FORMAT_VERSION))
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_retrieve_reads_current_namespace(self, redis_client):
+        redis_client.get.return_value = '{"body": {}}'
+        self.assertEqual(cache.retrieve(u"key"), {"body": {}})
+        redis_client.get.assert_called_once_with(cache.NAMESPACE + u"key")
+
+    @patch("brainiak.utils.cache.release_lease")
+    @patch("brainiak.utils.cache.acquire_lease", return_value="token")
+    @patch("brainiak.utils.cache.redis_client")
+    def test_delete_old_namespaces(self, redis_client, acquire_lease, release_lease):
+        current_key = (cache.NAMESPACE + u"_##json_schema").encode("utf-8")
+        redis_client.execute_command.return_value = ("0", [current_key, "brainiak:2.7.3:1:_##json_schema"])
+        redis_client.get.return_value = None
+        redis_client.pipeline.return_value.execute.return_value = [1]
+        cache.delete_old_namespaces()
+        redis_client.execute_command.assert_called_with("SCAN", "0", "MATCH", u"brainiak:*", "COUNT", cache.SCAN_BATCH_SIZE)
+        redis_client.get.assert_called_once_with("brainiak:2.7.3:1:##heartbeat")
+        redis_client.pipeline.return_value.delete.assert_called_once_with("brainiak:2.7.3:1:_##json_schema")
+        release_lease.assert_called_once_with(cache.NAMESPACES_GC_LEASE, "token")
+
+    @patch("brainiak.utils.cache.release_lease")
+    @patch("brainiak.utils.cache.acquire_lease", return_value="token")
+    @patch("brainiak.utils.cache.redis_client")
+    def test_namespaces_still_used_by_other_releases_are_kept(self, redis_client, acquire_lease, release_lease):
+        redis_client.execute_command.return_value = ("0", ["brainiak:2.7.3:1:_##json_schema",
+                                                           "brainiak:2.7.3:1:##heartbeat",
+                                                           "brainiak:2.7.2:1:_##json_schema"])
+        redis_client.get.side_effect = lambda key: "1400000000" if key == "brainiak:2.7.3:1:##heartbeat" else None
+        redis_client.pipeline.return_value.execute.return_value = [1]
+        cache.delete_old_namespaces()
+        redis_client.pipeline.return_value.delete.assert_called_once_with("brainiak:2.7.2:1:_##json_schema")
+
+    @patch("brainiak.utils.cache.redis_client")
+    def test_beat_namespace(self, redis_client):
+        cache.beat_namespace()
+        redis_client.setex.assert_called_once_with(cache.NAMESPACE + u"##heartbeat", cache.NAMESPACE_IDLE_GRACE_IN_SECS, ANY)
+
+    @patch("brainiak.utils.cache.acquire_lease", return_value=False)
+    @patch("brainiak.utils.cache.redis_client")
+    def test_old_namespaces_are_deleted_by_a_single_process(self, redis_client, acquire_lease):
+        cache.delete_old_namespaces()
+        self.assertFalse(redis_client.execute_command.called)
+
+
+class ClientTestCase(unittest.TestCase):
+
+    def test_blocking_client_is_used_outside_greenlets(self):
+        self.assertIs(cache.client(), cache.redis_client)
+
+    def test_non_blocking_client_is_used_by_request_handlers(self):
+        clients = []
+        greenlet.greenlet(lambda: clients.append(cache.client())).switch()
+        self.assertIs(clients[0], cache.async_redis_client)
+
+
+class InvalidationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cache.local_cache.clear()
+
+    def tearDown(self):
+        cache.local_cache.clear()
+
+    @patch("brainiak.utils.cache._publish_invalidation")
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    def test_invalidation_is_applied_and_published(self, settings, publish):
+        cache.local_cache.set(u"graph@@Class##class", "j{}")
+        cache.local_cache.set(u"graph@@Other##class", "j{}")
+        cache._invalidate("purge_local", u"graph@@Class")
+        self.assertIsNone(cache.local_cache.get(u"graph@@Class##class"))
+        self.assertEqual(cache.local_cache.get(u"graph@@Other##class"), "j{}")
+        publish.assert_called_once_with(ujson.dumps([cache.PROCESS_ID, "purge_local", [u"graph@@Class"]]))
+
+    @patch("brainiak.utils.cache._publish_invalidation")
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=False)
+    def test_invalidation_is_not_published_if_cache_is_disabled(self, settings, publish):
+        cache._invalidate("delete_local", u"graph@@Class##class")
+        self.assertFalse(publish.called)
+
+    def test_invalidation_published_by_another_process_is_applied(self):
+        cache.local_cache.set(u"graph@@Class##class", "j{}")
+        cache.apply_invalidation(ujson.dumps(["another process", "delete_local", [u"graph@@Class##class"]]))
+        self.assertIsNone(cache.local_cache.get(u"graph@@Class##class"))
+
+    @patch("brainiak.utils.sparql.forget_instance")
+    def test_invalidation_published_by_this_process_is_ignored(self, forget_instance):
+        cache.apply_invalidation(ujson.dumps([cache.PROCESS_ID, "forget_instance", [u"http://instance"]]))
+        self.assertFalse(forget_instance.called)
+
+    @patch("brainiak.utils.cache.delete")
+    @patch("brainiak.utils.cache._publish_invalidation")
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.sparql.forget_class")
+    def test_purge_of_a_class_forgets_its_graph(self, forget_class, settings, publish, delete):
+        purge_by_path(u"http://graph/@@http://graph/Class##class", False)
+        delete.assert_called_once_with(u"http://graph/@@http://graph/Class##class")
+        forget_class.assert_called_once_with(u"http://graph/Class")
+        publish.assert_called_once_with(ujson.dumps([cache.PROCESS_ID, "forget_class", [u"http://graph/Class"]]))
+
+    @patch("brainiak.utils.sparql.forget_class")
+    def test_class_forgotten_by_another_process_is_forgotten(self, forget_class):
+        cache.apply_invalidation(ujson.dumps(["another process", "forget_class", [u"http://graph/Class"]]))
+        forget_class.assert_called_once_with(u"http://graph/Class")
+
+    @patch("brainiak.utils.cache.log.logger")
+    def test_invalid_invalidation_is_logged(self, logger):
+        cache.apply_invalidation(ujson.dumps(["another process", "unknown", []]))
+        self.assertTrue(logger.error.called)
+
+    @patch("brainiak.utils.sparql.load_label_properties")
+    @patch("brainiak.utils.sparql.clear_lookup_caches")
+    def test_clear_local(self, clear_lookup_caches, load_label_properties):
+        cache.local_cache.set(u"graph@@Class##class", "j{}")
+        cache.apply_invalidation(ujson.dumps(["another process", "clear_local", []]))
+        self.assertEqual(len(cache.local_cache), 0)
+        self.assertTrue(clear_lookup_caches.called)
+        self.assertTrue(load_label_properties.called)
+
+    @patch("brainiak.utils.cache.log.logger")
+    @patch("brainiak.utils.sparql.load_label_properties", side_effect=Exception("triplestore is down"))
+    @patch("brainiak.utils.sparql.clear_lookup_caches")
+    def test_clear_local_survives_failing_reload(self, clear_lookup_caches, load_label_properties, logger):
+        cache.local_cache.set(u"graph@@Class##class", "j{}")
+        cache.apply_invalidation(ujson.dumps(["another process", "clear_local", []]))
+        self.assertEqual(len(cache.local_cache), 0)
+        self.assertTrue(logger.error.called)
@@ -0,0 +1,79 @@
+import unittest
+
+from mock import patch
+
+from brainiak.utils import cache_stats
+from brainiak.utils.cache_stats import family_of, KeyFamilyStats, SpaceSaving
+
+
+class SpaceSavingTestCase(unittest.TestCase):
+
+    def test_counts_are_exact_while_there_is_room(self):
+        sketch = SpaceSaving(3)
+        for item in "aabacb":
+            sketch.add(item)
+        self.assertEqual(sketch.top(2), [("a", 3, 0), ("b", 2, 0)])
+
+    def test_least_frequent_item_is_replaced(self):
+        sketch = SpaceSaving(2)
+        for item in "aaabc":
+            sketch.add(item)
+        # c replaced b, inheriting its count as error
+        self.assertEqual(sketch.top(2), [("a", 3, 0), ("c", 2, 1)])
+
+    def test_frequent_items_are_kept(self):
+        sketch = SpaceSaving(10)
+        for i in range(1000):
+            sketch.add("hot" if i % 3 == 0 else "cold{0}".format(i))
+        item, count, error = sketch.top(1)[0]
+        self.assertEqual(item, "hot")
+        self.assertTrue(count - error <= 334 <= count)
+
+
+class KeyFamilyStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cache_stats.reset()
+
+    def tearDown(self):
+        cache_stats.reset()
+
+    def test_family_of(self):
+        self.assertEqual(family_of(u"graph@@class##class"), u"class")
+        self.assertEqual(family_of(u"brainiak:1.0:2:_@@_@@http://instance@@abc##instance"), u"instance")
+        self.assertEqual(family_of(u"@@abc##root"), u"root")
+        self.assertEqual(family_of(u"/home"), u"other")
+
+    def test_report(self):
+        family = KeyFamilyStats("class")
+        family.hits = 3
+        family.misses = 1
+        family.stores = 2
+        family.stored_bytes = 300
+        family.max_stored_bytes = 200
+        family.build_time.record(0.5)
+        report = family.report()
+        self.assertEqual(report["hit_ratio"], 0.75)
+        self.assertEqual(report["stored_bytes"], {"total": 300, "mean": 150, "max": 200})
+        self.assertEqual(report["builds"], 1)
+        self.assertEqual(sorted(report["build_time_in_secs"]), ["max", "mean", "p50", "p90", "p99"])
+
+    @patch("brainiak.utils.cache_stats.HOT_KEYS_SAMPLE_RATE", 1)
+    def test_records_are_aggregated_by_family(self):
+        cache_stats.record_miss(u"g@@A##class")
+        cache_stats.record_store(u"g@@A##class", 100)
+        cache_stats.record_hit(u"g@@A##class")
+        cache_stats.record_hit(u"g@@B##class")
+        cache_stats.record_purges([u"g@@A##class", "brainiak:1.0:2:@@abc##root"])
+        report = cache_stats.report()
+        self.assertEqual(sorted(report["families"]), [u"class", u"root"])
+        self.assertEqual((report["families"]["class"]["hits"], report["families"]["class"]["misses"]), (2, 1))
+        self.assertEqual(report["families"]["class"]["stores"], 1)
+        self.assertEqual(report["families"]["root"]["purges"], 1)
+        self.assertEqual(report["hot_keys"][0], {"key": u"g@@A##class", "lookups": 2, "error": 0})
+
+    @patch("brainiak.utils.cache_stats.random.random", return_value=0.5)
+    def test_lookups_are_sampled(self, random):
+        cache_stats.record_hit(u"g@@A##class")
+        self.assertEqual(cache_stats.report()["hot_keys"], [])
+        self.assertEqual(cache_stats.report()["families"]["class"]["hits"], 1)
@@ -1,4 +1,10 @@
+import os
+import tempfile
 from unittest import TestCase
+
+from mock import patch
+
+from brainiak.utils import config_parser
 from brainiak.utils.config_parser import ConfigParserNoSectionError, parse_section
 
 
@@ -29,3 +35,42 @@ class ConfigParserTestCase(TestCase):
 
     def test_parse_inexistent_section(self):
         self.assertRaises(ConfigParserNoSectionError, parse_section, "xubiru")
+
+
+class ConfigRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.filename = tempfile.mktemp(suffix=".ini")
+        self._write("[default]\nurl = http://first\n")
+
+    def tearDown(self):
+        config_parser._registries.pop(self.filename, None)
+        os.remove(self.filename)
+
+    def _write(self, content, mtime=1000):
+        with open(self.filename, "w") as ini_file:
+            ini_file.write(content)
+        os.utime(self.filename, (mtime, mtime))
+
+    def test_file_is_parsed_once(self):
+        with patch("brainiak.utils.config_parser._read_sections", wraps=config_parser._read_sections) as read_sections:
+            parse_section(self.filename)
+            parse_section(self.filename)
+            self.assertRaises(ConfigParserNoSectionError, parse_section, self.filename, "unknown")
+        self.assertEqual(read_sections.call_count, 1)
+
+    def test_file_is_parsed_again_when_modified(self):
+        self.assertEqual(parse_section(self.filename)["url"], "http://first")
+        self._write("[default]\nurl = http://second\n", mtime=2000)
+        self.assertEqual(parse_section(self.filename)["url"], "http://second")
+
+    def test_reload(self):
+        parse_section(self.filename)
+        self._write("[default]\nurl = http://second\n")
+        self.assertEqual(parse_section(self.filename)["url"], "http://first")
+        config_parser.reload()
+        self.assertEqual(parse_section(self.filename)["url"], "http://second")
+
+    def test_returned_section_can_be_changed(self):
+        parse_section(self.filename)["url"] = "changed"
+        self.assertEqual(parse_section(self.filename)["url"], "http://first")
@@ -0,0 +1,155 @@
+import unittest
+
+from mock import patch, Mock
+from tornado.httpclient import HTTPRequest
+from tornado.web import HTTPError
+
+from brainiak.utils import connection_pool
+from brainiak.utils.connection_pool import ConnectionPool, get_pool, remove_pool_params
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool("Brainiak", size=2, idle_timeout=60, max_queued=1, connect_timeout=5)
+
+    @patch("brainiak.utils.connection_pool.AsyncHTTPClient")
+    def test_acquire_reuses_client(self, mock_client_class):
+        first = self.pool.acquire()
+        self.pool.release()
+        second = self.pool.acquire()
+        self.assertIs(first, second)
+        self.assertEqual(mock_client_class.call_count, 1)
+        self.assertEqual(mock_client_class.call_args[1]["max_clients"], 2)
+        self.assertTrue(mock_client_class.call_args[1]["force_instance"])
+
+    @patch("brainiak.utils.connection_pool.AsyncHTTPClient")
+    def test_acquire_counts_active_and_queued(self, mock_client_class):
+        self.pool.acquire()
+        self.pool.acquire()
+        self.pool.acquire()
+        self.assertEqual(self.pool.active, 3)
+        self.assertEqual(self.pool.queued, 1)
+        self.assertEqual(self.pool.saturation, 100)
+
+    @patch("brainiak.utils.connection_pool.AsyncHTTPClient")
+    def test_acquire_refuses_requests_above_max_queued(self, mock_client_class):
+        for i in range(3):
+            self.pool.acquire()
+        with self.assertRaises(HTTPError) as error:
+            self.pool.acquire()
+        self.assertEqual(error.exception.status_code, 503)
+        self.assertEqual(self.pool.rejected, 1)
+        self.assertEqual(self.pool.active, 3)
+
+    @patch("brainiak.utils.connection_pool.time.time", return_value=1000)
+    @patch("brainiak.utils.connection_pool.AsyncHTTPClient")
+    def test_idle_pool_recycles_its_client(self, mock_client_class, mock_time):
+        first = Mock()
+        second = Mock()
+        mock_client_class.side_effect = [first, second]
+        self.pool.acquire()
+        self.pool.release()
+        mock_time.return_value = 1061
+        client = self.pool.acquire()
+        self.assertIs(client, second)
+        self.assertTrue(first.close.called)
+
+    @patch("brainiak.utils.connection_pool.greenlet_get_ioloop")
+    @patch("brainiak.utils.connection_pool.AsyncHTTPClient")
+    def test_ioloop_change_keeps_the_client_of_requests_in_flight(self, mock_client_class, mock_get_ioloop):
+        first = Mock()
+        second = Mock()
+        mock_client_class.side_effect = [first, second]
+        mock_get_ioloop.return_value = "first loop"
+        self.pool.acquire()
+        mock_get_ioloop.return_value = "second loop"
+        client = self.pool.acquire()
+        self.assertIs(client, second)
+        self.assertFalse(first.close.called)
+
+    @patch("brainiak.utils.connection_pool.greenlet_get_ioloop")
+    @patch("brainiak.utils.connection_pool.AsyncHTTPClient")
+    def test_ioloop_change_closes_the_clients_of_other_loops_when_idle(self, mock_client_class, mock_get_ioloop):
+        first = Mock()
+        second = Mock()
+        mock_client_class.side_effect = [first, second]
+        mock_get_ioloop.return_value = "first loop"
+        self.pool.acquire()
+        self.pool.release()
+        mock_get_ioloop.return_value = "second loop"
+        client = self.pool.acquire()
+        self.assertIs(client, second)
+        self.assertTrue(first.close.called)
+
+    def test_prepare_request(self):
+        request = self.pool.prepare_request(HTTPRequest("http://localhost:8890/sparql"))
+        self.assertEqual(request.connect_timeout, 5)
+        self.assertIsNotNone(request.prepare_curl_callback)
+
+    def test_status(self):
+        self.pool.active = 1
+        expected = u"Connection pool Brainiak | size: 2 | active: 1 | queued: 0 | max queued: 1 | " + \
+                   u"saturation: 50% | rejected: 0 | served: 0"
+        self.assertEqual(self.pool.status(), expected)
+
+
+class GetPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original_pools = connection_pool._pools
+        connection_pool._pools = {}
+
+    def tearDown(self):
+        connection_pool._pools = self.original_pools
+
+    def test_get_pool_is_shared_by_section(self):
+        config = {"app_name": "Brainiak", "url": "http://localhost:8890/sparql-auth"}
+        self.assertIs(get_pool(config), get_pool(dict(config)))
+
+    def test_get_pool_uses_section_params(self):
+        config = {"app_name": "Other", "url": "http://localhost:8890/sparql-auth",
+                  "pool_size": "3", "pool_max_queued": "7", "pool_idle_timeout": "30", "connect_timeout": "2"}
+        pool = get_pool(config)
+        self.assertEqual(pool.size, 3)
+        self.assertEqual(pool.max_queued, 7)
+        self.assertEqual(pool.idle_timeout, 30.0)
+        self.assertEqual(pool.connect_timeout, 2.0)
+
+    def test_get_pool_is_recreated_when_params_change(self):
+        config = {"app_name": "Brainiak", "url": "http://localhost:8890/sparql-auth"}
+        pool = get_pool(config)
+        config["pool_size"] = "20"
+        self.assertIsNot(pool, get_pool(config))
+
+    def test_get_pool_without_app_name(self):
+        pool = get_pool({"url": "http://localhost:8890/sparql"})
+        self.assertEqual(pool.name, "http://localhost:8890/sparql")
+
+    def test_remove_pool_params(self):
+        params = {"url": "http://localhost:8890/sparql", "pool_size": "3", "connect_timeout": "2"}
+        self.assertEqual(remove_pool_params(params), {"url": "http://localhost:8890/sparql"})
+
+    def test_status_lists_pools(self):
+        get_pool({"app_name": "Brainiak", "url": "http://localhost:8890/sparql-auth"})
+        status = connection_pool.status()
+        self.assertEqual(len(status), 1)
+        self.assertTrue(status[0].startswith(u"Connection pool Brainiak | size: 10"))
+
+
+class PrepareCurlTestCase(unittest.TestCase):
+
+    def test_progress_function_is_disabled_by_default(self):
+        curl = Mock()
+        connection_pool._prepare_curl(curl)
+        curl.setopt.assert_any_call(connection_pool.pycurl.NOPROGRESS, 1)
+
+    def test_cancelled_request_is_aborted(self):
+        curl = Mock()
+        cancelled = {"value": False}
+        connection_pool._prepare_curl(curl, lambda: cancelled["value"])
+        curl.setopt.assert_any_call(connection_pool.pycurl.NOPROGRESS, 0)
+        progress_function = dict(call[0] for call in curl.setopt.call_args_list)[connection_pool.pycurl.PROGRESSFUNCTION]
+        self.assertEqual(progress_function(0, 0, 0, 0), 0)
+        cancelled["value"] = True
+        self.assertEqual(progress_function(0, 0, 0, 0), 1)
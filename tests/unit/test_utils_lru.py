@@ -0,0 +1,62 @@
+import unittest
+
+from mock import patch
+
+from brainiak.utils.lru import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_get_and_set(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b", "default"), "default")
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_least_recently_used_is_discarded(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("c"), 3)
+
+    @patch("brainiak.utils.lru.time.time", return_value=100)
+    def test_expired_entries_are_not_returned(self, mock_time):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=10)
+        mock_time.return_value = 120
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(len(cache), 1)
+
+    def test_zero_sized_cache_stores_nothing(self):
+        cache = LRUCache(max_size=0, ttl=60)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), None)
+
+    def test_delete_and_clear(self):
+        cache = LRUCache(max_size=3, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+        cache.delete("a")
+        cache.delete("inexistent")
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_delete_matching(self):
+        cache = LRUCache(max_size=3, ttl=60)
+        cache.set("a##instance", 1)
+        cache.set("b##instance", 2)
+        cache.set("c##class", 3)
+        cache.delete_matching(lambda key: key.endswith("##instance"))
+        self.assertEqual(cache.get("c##class"), 3)
+        self.assertEqual(len(cache), 1)
@@ -0,0 +1,64 @@
+import unittest
+
+from brainiak.utils import metrics
+from brainiak.utils.metrics import LatencyHistogram, QueryFamilyMetrics
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+
+    def test_empty_histogram(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.mean, 0.0)
+        self.assertEqual(histogram.percentile(99), 0.0)
+
+    def test_small_latencies_are_exact(self):
+        self.assertEqual(LatencyHistogram._bucket_of(7), (0, 7))
+        self.assertEqual(LatencyHistogram._upper_bound_of((0, 7)), 0.000007)
+
+    def test_bucket_relative_error_is_bounded(self):
+        for microseconds in (100, 1234, 56789, 1000000, 30000000):
+            upper_bound = LatencyHistogram._upper_bound_of(LatencyHistogram._bucket_of(microseconds)) * 1000000
+            self.assertTrue(microseconds <= upper_bound + 0.001)
+            self.assertTrue(upper_bound - microseconds <= microseconds / float(metrics.SUB_BUCKETS))
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 101):
+            histogram.record(i / 100.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.mean, 0.505)
+        self.assertEqual(histogram.max, 1.0)
+        self.assertTrue(0.5 <= histogram.percentile(50) <= 0.5 * (1 + 1.0 / metrics.SUB_BUCKETS))
+        self.assertTrue(0.99 <= histogram.percentile(99) <= 1.0)
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+
+class QueryFamilyMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_report(self):
+        family = QueryFamilyMetrics("schema.class")
+        family.record(0.2, 100)
+        family.record(2.0, 300, slow=True)
+        family.record_error()
+        report = family.report()
+        self.assertEqual(report["count"], 2)
+        self.assertEqual(report["errors"], 1)
+        self.assertEqual(report["slow"], 1)
+        self.assertEqual(report["response_bytes"], {"total": 400, "mean": 200, "max": 300})
+        self.assertEqual(report["latency_in_secs"]["max"], 2.0)
+        self.assertAlmostEqual(report["latency_in_secs"]["mean"], 1.1)
+        self.assertEqual(sorted(report["latency_in_secs"]), ["max", "mean", "p50", "p90", "p99"])
+
+    def test_get_family_is_shared(self):
+        metrics.get_family("a").record(0.1, 10)
+        metrics.get_family("a").record(0.1, 10)
+        metrics.get_family("b").record_error()
+        report = metrics.report()
+        self.assertEqual(report["a"]["count"], 2)
+        self.assertEqual(report["b"]["errors"], 1)
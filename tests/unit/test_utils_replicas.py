@@ -0,0 +1,136 @@
+import unittest
+
+from mock import patch
+
+from brainiak.utils import replicas
+from brainiak.utils.replicas import Endpoint, choose_endpoint, read_urls
+
+
+class EndpointTestCase(unittest.TestCase):
+
+    def test_latency_is_a_moving_average(self):
+        endpoint = Endpoint("http://replica1")
+        endpoint.start()
+        endpoint.finish(1.0)
+        self.assertEqual(endpoint.latency, 1.0)
+        endpoint.start()
+        endpoint.finish(2.0)
+        self.assertAlmostEqual(endpoint.latency, 1.3)
+        self.assertEqual(endpoint.outstanding, 0)
+        self.assertEqual(endpoint.requests, 2)
+
+    @patch("brainiak.utils.replicas.settings.TRIPLESTORE_EJECTION_FAILURES", 2)
+    @patch("brainiak.utils.replicas.settings.TRIPLESTORE_EJECTION_TIME_IN_SECS", 30)
+    @patch("brainiak.utils.replicas.time.time", return_value=1000)
+    def test_endpoint_is_ejected_after_consecutive_failures(self, mock_time):
+        endpoint = Endpoint("http://replica1")
+        endpoint.start()
+        endpoint.fail()
+        endpoint.start()
+        endpoint.finish(0.1)
+        endpoint.start()
+        endpoint.fail()
+        self.assertTrue(endpoint.healthy)
+        endpoint.start()
+        endpoint.fail()
+        self.assertFalse(endpoint.healthy)
+        self.assertEqual(endpoint.failures, 3)
+        mock_time.return_value = 1031
+        self.assertTrue(endpoint.healthy)
+
+    def test_status(self):
+        endpoint = Endpoint("http://replica1")
+        expected = u"Endpoint http://replica1 | healthy | outstanding: 0 | latency (EWMA): 0.000s | " + \
+                   u"requests: 0 | failures: 0"
+        self.assertEqual(endpoint.status(), expected)
+
+
+class ChooseEndpointTestCase(unittest.TestCase):
+
+    CONFIG = {"url": "http://writer", "read_urls": "http://replica1, http://replica2"}
+
+    def setUp(self):
+        self.original_endpoints = replicas._endpoints
+        replicas._endpoints = {}
+
+    def tearDown(self):
+        replicas._endpoints = self.original_endpoints
+
+    def test_read_urls(self):
+        self.assertEqual(read_urls(self.CONFIG), ["http://replica1", "http://replica2"])
+        self.assertEqual(read_urls({"url": "http://writer"}), ["http://writer"])
+
+    def test_write_queries_go_to_writer(self):
+        self.assertEqual(choose_endpoint(self.CONFIG, read_only=False).url, "http://writer")
+
+    def test_read_queries_go_to_least_loaded_replica(self):
+        replica1 = replicas.get_endpoint("http://replica1")
+        replica2 = replicas.get_endpoint("http://replica2")
+        replica1.latency = 0.1
+        replica2.latency = 0.15
+        self.assertEqual(choose_endpoint(self.CONFIG, read_only=True), replica1)
+        replica1.outstanding = 1
+        self.assertEqual(choose_endpoint(self.CONFIG, read_only=True), replica2)
+
+    def test_ejected_replicas_are_not_used(self):
+        replica1 = replicas.get_endpoint("http://replica1")
+        replica1.ejected_until = float("inf")
+        self.assertEqual(choose_endpoint(self.CONFIG, read_only=True).url, "http://replica2")
+
+    def test_replica_back_soonest_is_used_if_all_were_ejected(self):
+        replicas.get_endpoint("http://replica1").ejected_until = float("inf")
+        replicas.get_endpoint("http://replica2").ejected_until = float("1e20")
+        self.assertEqual(choose_endpoint(self.CONFIG, read_only=True).url, "http://replica2")
+
+
+class HedgingTestCase(unittest.TestCase):
+
+    CONFIG = {"url": "http://writer", "read_urls": "http://replica1, http://replica2", "hedge_percentile": "90"}
+
+    def setUp(self):
+        self.original_endpoints = replicas._endpoints
+        self.original_hedging = replicas._hedging
+        replicas._endpoints = {}
+        replicas._hedging = {"queries": 0, "hedged": 0, "wins": 0}
+        self.replica1 = replicas.get_endpoint("http://replica1")
+        for latency in range(1, 101):
+            self.replica1.latencies.append(latency / 100.0)
+
+    def tearDown(self):
+        replicas._endpoints = self.original_endpoints
+        replicas._hedging = self.original_hedging
+
+    def test_latency_percentile(self):
+        self.assertEqual(self.replica1.latency_percentile(90), 0.9)
+        self.assertEqual(self.replica1.latency_percentile(100), 1.0)
+        self.assertEqual(Endpoint("http://replica3").latency_percentile(90), None)
+
+    def test_choose_hedge(self):
+        hedge_endpoint, delay = replicas.choose_hedge(self.CONFIG, self.replica1)
+        self.assertEqual(hedge_endpoint.url, "http://replica2")
+        self.assertEqual(delay, 0.9)
+
+    @patch("brainiak.utils.replicas.settings.TRIPLESTORE_HEDGE_MIN_DELAY_IN_SECS", 2)
+    def test_choose_hedge_minimum_delay(self):
+        hedge_endpoint, delay = replicas.choose_hedge(self.CONFIG, self.replica1)
+        self.assertEqual(delay, 2)
+
+    @patch("brainiak.utils.replicas.settings.TRIPLESTORE_HEDGE_PERCENTILE", None)
+    def test_hedging_is_disabled_by_default(self):
+        config = {"url": "http://writer", "read_urls": "http://replica1, http://replica2"}
+        self.assertEqual(replicas.choose_hedge(config, self.replica1), (None, None))
+
+    def test_no_hedge_without_enough_samples(self):
+        replica3 = replicas.get_endpoint("http://replica3")
+        self.assertEqual(replicas.choose_hedge(self.CONFIG, replica3), (None, None))
+
+    def test_no_hedge_without_other_healthy_replica(self):
+        replicas.get_endpoint("http://replica2").ejected_until = float("inf")
+        self.assertEqual(replicas.choose_hedge(self.CONFIG, self.replica1), (None, None))
+
+    def test_hedging_status(self):
+        replicas.choose_hedge(self.CONFIG, self.replica1)
+        replicas.choose_hedge(self.CONFIG, self.replica1)
+        replicas.count_hedge(won=True)
+        expected = u"Hedged reads | queries: 2 | hedged: 1 (50%) | won by hedge: 1"
+        self.assertEqual(replicas.hedging_status(), expected)
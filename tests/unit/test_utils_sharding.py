@@ -0,0 +1,87 @@
+import unittest
+from collections import Counter
+
+from mock import Mock
+
+from brainiak.utils.sharding import HashRing, ShardedRedis
+
+
+NODES = ["redis1:6379", "redis2:6379", "redis3:6379"]
+KEYS = [u"brainiak:1.0:2:graph@@Class{0}##class".format(i) for i in range(3000)]
+
+
+class HashRingTestCase(unittest.TestCase):
+
+    def test_keys_are_spread_over_every_node(self):
+        ring = HashRing(NODES)
+        counts = Counter(ring.node_for(key) for key in KEYS)
+        self.assertEqual(sorted(counts), NODES)
+        for count in counts.values():
+            self.assertTrue(700 < count < 1300, counts)
+
+    def test_node_of_a_key_is_stable(self):
+        self.assertEqual(HashRing(NODES).node_for(KEYS[0]), HashRing(list(reversed(NODES))).node_for(KEYS[0]))
+
+    def test_only_keys_of_a_removed_node_move(self):
+        before = HashRing(NODES)
+        after = HashRing(NODES[:2])
+        for key in KEYS:
+            if before.node_for(key) != NODES[2]:
+                self.assertEqual(after.node_for(key), before.node_for(key))
+
+
+class ShardedRedisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clients = dict((name, Mock(name=name)) for name in NODES)
+        self.sharded = ShardedRedis([(name, self.clients[name]) for name in NODES])
+
+    def node_of(self, key):
+        return self.clients[self.sharded.ring.node_for(key)]
+
+    def test_commands_are_sent_to_the_node_of_their_key(self):
+        self.sharded.get(KEYS[0])
+        self.node_of(KEYS[0]).get.assert_called_once_with(KEYS[0])
+        self.sharded.set(KEYS[1], "value", ex=10, nx=True)
+        self.node_of(KEYS[1]).set.assert_called_once_with(KEYS[1], "value", ex=10, nx=True)
+        self.sharded.eval("script", 1, KEYS[2], "token")
+        self.node_of(KEYS[2]).eval.assert_called_once_with("script", 1, KEYS[2], "token")
+
+    def test_pipeline_is_split_by_node(self):
+        pipelines = {}
+        for name, client in self.clients.items():
+            pipeline = pipelines[name] = client.pipeline.return_value
+            pipeline.__len__ = Mock(side_effect=lambda pipeline=pipeline: len(pipeline.method_calls))
+            pipeline.execute.side_effect = lambda pipeline=pipeline: [1] * len(pipeline.method_calls)
+
+        pipeline = self.sharded.pipeline(transaction=False)
+        pipeline.setex(KEYS[0], 60, "value")
+        pipeline.sadd(u"tag", KEYS[0])
+        pipeline.delete(*KEYS[:30])
+        results = pipeline.execute()
+
+        self.assertEqual(results, [1, 1, sum(1 for name in NODES if any(self.sharded.ring.node_for(key) == name for key in KEYS[:30]))])
+        self.node_of(KEYS[0]).pipeline.return_value.setex.assert_called_once_with(KEYS[0], 60, "value")
+        self.node_of(u"tag").pipeline.return_value.sadd.assert_called_once_with(u"tag", KEYS[0])
+        for name in NODES:
+            node_keys = [key for key in KEYS[:30] if self.sharded.ring.node_for(key) == name]
+            pipelines[name].delete.assert_called_once_with(*node_keys)
+
+    def test_pipeline_of_every_node_is_executed_even_if_one_fails(self):
+        for client in self.clients.values():
+            client.pipeline.return_value.__len__ = Mock(return_value=1)
+            client.pipeline.return_value.execute.return_value = [1]
+        failing = self.node_of(KEYS[0])
+        failing.pipeline.return_value.execute.side_effect = ValueError
+
+        pipeline = self.sharded.pipeline()
+        pipeline.delete(*KEYS[:30])
+        self.assertRaises(ValueError, pipeline.execute)
+        for client in self.clients.values():
+            self.assertTrue(client.pipeline.return_value.execute.called)
+
+    def test_delete_returns_the_keys_deleted_by_every_node(self):
+        for client in self.clients.values():
+            client.pipeline.return_value.__len__ = Mock(return_value=1)
+            client.pipeline.return_value.execute.return_value = [2]
+        self.assertEqual(self.sharded.delete(*KEYS[:30]), 6)
@@ -0,0 +1,70 @@
+import greenlet
+from tornado.testing import AsyncTestCase
+
+from brainiak.greenlet_tornado import greenlet_set_ioloop
+from brainiak.utils.single_flight import SingleFlight
+
+
+class SingleFlightTestCase(AsyncTestCase):
+
+    def setUp(self):
+        super(SingleFlightTestCase, self).setUp()
+        greenlet_set_ioloop(self.io_loop)
+        self.single_flight = SingleFlight(u"tests")
+        self.results = []
+        self.leader = None
+
+    def _slow_function(self, value):
+        def function():
+            # wait, as if a request was being made, until the test resumes the leader
+            self.leader = greenlet.getcurrent()
+            return self.leader.parent.switch() or value
+        return function
+
+    def _start(self, key, value):
+        def run():
+            try:
+                self.results.append(self.single_flight.run(key, self._slow_function(value)))
+            except Exception as e:
+                self.results.append(e)
+            if len(self.results) == 3:
+                self.stop()
+        greenlet.greenlet(run).switch()
+
+    def test_concurrent_calls_with_same_key_are_coalesced(self):
+        self._start("key", "first")
+        self._start("key", "second")
+        self._start("key", "third")
+        self.assertEqual(self.single_flight.in_flight, 1)
+
+        self.leader.switch()
+        self.wait()
+
+        self.assertEqual(self.results, ["first", "first", "first"])
+        self.assertEqual(self.single_flight.leaders, 1)
+        self.assertEqual(self.single_flight.coalesced, 2)
+        self.assertEqual(self.single_flight.in_flight, 0)
+
+    def test_exception_is_raised_to_every_caller(self):
+        self._start("key", "first")
+        self._start("key", "second")
+        self._start("key", "third")
+
+        self.leader.throw(ValueError("failure"))
+        self.wait()
+
+        self.assertEqual(len(self.results), 3)
+        for result in self.results:
+            self.assertIsInstance(result, ValueError)
+        self.assertEqual(self.single_flight.in_flight, 0)
+
+    def test_calls_with_different_keys_are_not_coalesced(self):
+        single_flight = SingleFlight(u"tests")
+        self.assertEqual(single_flight.run("a", lambda: 1), 1)
+        self.assertEqual(single_flight.run("b", lambda: 2), 2)
+        self.assertEqual(single_flight.leaders, 2)
+        self.assertEqual(single_flight.coalesced, 0)
+
+    def test_status(self):
+        expected = u"Coalesced tests | in flight: 0 | leaders: 0 | coalesced: 0"
+        self.assertEqual(self.single_flight.status(), expected)
@@ -1145,6 +1145,17 @@ class RdfsLabelValidationTestCase(TestCase):
         }
         self.assertFalse(are_there_label_properties_in(instance_data))
 
+    @patch("brainiak.utils.sparql.get_subproperties", return_value=["http://example.onto/title"])
+    def test_load_label_properties_can_be_reloaded(self, mock_get_subproperties):
+        label_properties = LABEL_PROPERTIES
+        try:
+            load_label_properties()
+            load_label_properties()
+            self.assertIs(LABEL_PROPERTIES, label_properties)
+            self.assertEqual(LABEL_PROPERTIES, [RDFS_LABEL, "http://example.onto/title"])
+        finally:
+            LABEL_PROPERTIES[:] = [RDFS_LABEL]
+
 
 class RdfTypeValidationTestCase(TestCase):
 
@@ -1171,3 +1182,75 @@ class RdfTypeValidationTestCase(TestCase):
 
         result = is_rdf_type_invalid(query_params, instance_data)
         self.assertIn("Incompatible values for rdf:type", result)
+
+
+class LookupTestCase(TestCase):
+
+    GRAPH_RESULT = {"results": {"bindings": [{"graph": {"type": "uri", "value": "http://example.onto/"}}]}}
+    GRAPH_AND_CLASS_RESULT = {"results": {"bindings": [{"graph": {"type": "uri", "value": "http://example.onto/"},
+                                                        "class": {"type": "uri", "value": "http://example.onto/City"}}]}}
+    EMPTY_RESULT = {"results": {"bindings": []}}
+
+    def setUp(self):
+        clear_lookup_caches()
+
+    def tearDown(self):
+        clear_lookup_caches()
+
+    @patch("brainiak.utils.sparql.greenlet_available", return_value=True)
+    @patch("brainiak.utils.sparql.query_sparql", return_value=GRAPH_RESULT)
+    def test_find_graph_from_class_inside_request_is_async_and_cached(self, mock_query_sparql, mock_available):
+        self.assertEqual(find_graph_from_class("http://example.onto/City"), "http://example.onto/")
+        self.assertEqual(find_graph_from_class("http://example.onto/City"), "http://example.onto/")
+        self.assertEqual(mock_query_sparql.call_count, 1)
+        self.assertEqual(mock_query_sparql.call_args[1], {"async": True, "family": "lookup.graph_from_class"})
+
+    @patch("brainiak.utils.sparql.greenlet_available", return_value=False)
+    @patch("brainiak.utils.sparql.query_sparql", return_value=GRAPH_RESULT)
+    def test_find_graph_from_class_outside_request_is_sync(self, mock_query_sparql, mock_available):
+        find_graph_from_class("http://example.onto/City")
+        self.assertEqual(mock_query_sparql.call_args[1], {"async": False, "family": "lookup.graph_from_class"})
+
+    @patch("brainiak.utils.sparql.greenlet_available", return_value=True)
+    @patch("brainiak.utils.sparql.query_sparql", return_value=GRAPH_RESULT)
+    def test_find_graph_from_class_is_cached_until_forgotten(self, mock_query_sparql, mock_available):
+        find_graph_from_class("http://example.onto/City")
+        forget_class("http://example.onto/City")
+        find_graph_from_class("http://example.onto/City")
+        self.assertEqual(mock_query_sparql.call_count, 2)
+
+    @patch("brainiak.utils.sparql.greenlet_available", return_value=True)
+    @patch("brainiak.utils.sparql.query_sparql", return_value=EMPTY_RESULT)
+    def test_find_graph_from_class_does_not_cache_unknown_classes(self, mock_query_sparql, mock_available):
+        self.assertEqual(find_graph_from_class("http://example.onto/City"), None)
+        find_graph_from_class("http://example.onto/City")
+        self.assertEqual(mock_query_sparql.call_count, 2)
+
+    @patch("brainiak.utils.sparql.greenlet_available", return_value=True)
+    @patch("brainiak.utils.sparql.query_sparql", return_value=GRAPH_AND_CLASS_RESULT)
+    def test_find_graph_and_class_from_instance_is_cached_until_forgotten(self, mock_query_sparql, mock_available):
+        expected = ("http://example.onto/", "http://example.onto/City")
+        self.assertEqual(find_graph_and_class_from_instance("http://example.onto/City/Rio"), expected)
+        self.assertEqual(find_graph_and_class_from_instance("http://example.onto/City/Rio"), expected)
+        self.assertEqual(mock_query_sparql.call_count, 1)
+
+        forget_instance("http://example.onto/City/Rio")
+        find_graph_and_class_from_instance("http://example.onto/City/Rio")
+        self.assertEqual(mock_query_sparql.call_count, 2)
+
+    @patch("brainiak.utils.sparql.greenlet_available", return_value=True)
+    @patch("brainiak.utils.sparql.query_sparql", return_value=EMPTY_RESULT)
+    def test_find_graph_and_class_from_inexistent_instance(self, mock_query_sparql, mock_available):
+        self.assertEqual(find_graph_and_class_from_instance("http://example.onto/City/Rio"), (None, None))
+        find_graph_and_class_from_instance("http://example.onto/City/Rio")
+        self.assertEqual(mock_query_sparql.call_count, 2)
+
+    @patch("brainiak.utils.sparql.greenlet_available", return_value=True)
+    @patch("brainiak.utils.sparql.query_sparql",
+           return_value={"results": {"bindings": [{"property": {"type": "uri", "value": "http://example.onto/name"}}]}})
+    def test_get_subproperties_is_cached(self, mock_query_sparql, mock_available):
+        self.assertEqual(get_subproperties(RDFS_LABEL), ["http://example.onto/name"])
+        subproperties = get_subproperties(RDFS_LABEL)
+        subproperties.append("http://example.onto/changed")
+        self.assertEqual(get_subproperties(RDFS_LABEL), ["http://example.onto/name"])
+        self.assertEqual(mock_query_sparql.call_count, 1)
@@ -0,0 +1,126 @@
+from urlparse import parse_qs, urlparse
+
+import greenlet
+import ujson
+from mock import patch, Mock
+from tornado.testing import AsyncTestCase
+
+from brainiak import warmup
+from brainiak.greenlet_tornado import greenlet_set_ioloop, greenlet_sleep
+
+
+ROOT = {"items": [{"title": "person", "@id": "http://semantica.globo.com/person/", "resource_id": "person"}]}
+CLASSES = {"items": [{"title": "Person", "@id": "http://semantica.globo.com/person/Person",
+                      "resource_id": "Person", "class_prefix": "http://semantica.globo.com/person/"},
+                     {"title": "Gender", "@id": "http://semantica.globo.com/person/Gender",
+                      "resource_id": "Gender", "class_prefix": "http://semantica.globo.com/person/"}]}
+
+
+class WarmUpTestCase(AsyncTestCase):
+
+    def setUp(self):
+        super(WarmUpTestCase, self).setUp()
+        greenlet_set_ioloop(self.io_loop)
+        self.requested = []
+        self.in_flight = {"now": 0, "max": 0}
+
+    def fake_fetch(self, url, **kwargs):
+        self.requested.append(url)
+        if "/_schema" not in url:
+            arguments = parse_qs(urlparse(url).query)
+            page, per_page = int(arguments["page"][0]), int(arguments["per_page"][0])
+            items = (CLASSES if "/person/" in url else ROOT)["items"][(page - 1) * per_page:page * per_page]
+            return Mock(body=ujson.dumps({"items": items}))
+        self.in_flight["now"] += 1
+        self.in_flight["max"] = max(self.in_flight["max"], self.in_flight["now"])
+        greenlet_sleep(0.01)
+        self.in_flight["now"] -= 1
+        if "Gender" in url:
+            raise Exception("HTTP 500")
+        return Mock(body="{}")
+
+    def _run(self, function):
+        "Run function in a greenlet started by the IOLoop, and return what it returns"
+        outcome = []
+
+        def run():
+            outcome.append(function())
+            self.stop()
+
+        self.io_loop.add_callback(greenlet.greenlet(run).switch)
+        self.wait()
+        return outcome[0]
+
+    def test_list_schema_urls(self):
+        with patch("brainiak.warmup.greenlet_fetch", side_effect=self.fake_fetch):
+            graphs, schema_urls = self._run(lambda: warmup.list_schema_urls("http://localhost:5100/"))
+        self.assertEqual(graphs, 1)
+        self.assertEqual(schema_urls, [
+            "http://localhost:5100/person/Person/_schema?class_prefix=http%3A%2F%2Fsemantica.globo.com%2Fperson%2F",
+            "http://localhost:5100/person/Gender/_schema?class_prefix=http%3A%2F%2Fsemantica.globo.com%2Fperson%2F"])
+        self.assertEqual(self.requested[0], "http://localhost:5100/?page=1&per_page=100")
+
+    @patch("brainiak.warmup.WARMUP_PAGE_SIZE", 1)
+    def test_list_schema_urls_of_every_page(self):
+        with patch("brainiak.warmup.greenlet_fetch", side_effect=self.fake_fetch):
+            graphs, schema_urls = self._run(lambda: warmup.list_schema_urls("http://localhost:5100"))
+        # the root has a single graph, and its graph two classes
+        self.assertEqual(len([url for url in self.requested if "/person/" not in url]), 2)
+        self.assertEqual(len([url for url in self.requested if "/person/" in url]), 3)
+        self.assertEqual(len(schema_urls), 2)
+
+    @patch("brainiak.warmup.WARMUP_PAGE_SIZE", 2)
+    def test_pages_shortened_by_merged_rows_are_followed(self):
+        # the 2 rows of each page are the labels of a single class, which was also listed by the previous page
+        pages = [[CLASSES["items"][0]], [CLASSES["items"][0]], [CLASSES["items"][1]], []]
+
+        def fake_fetch(url, **kwargs):
+            self.requested.append(url)
+            return Mock(body=ujson.dumps({"items": pages[int(parse_qs(urlparse(url).query)["page"][0]) - 1]}))
+
+        with patch("brainiak.warmup.greenlet_fetch", side_effect=fake_fetch):
+            items = self._run(lambda: warmup._list_all("http://localhost:5100/person/"))
+        self.assertEqual([item["resource_id"] for item in items], ["Person", "Gender"])
+        self.assertEqual(len(self.requested), 4)
+
+    @patch("brainiak.warmup.log.logger")
+    def test_warm_up_is_concurrent_but_bounded(self, logger):
+        with patch("brainiak.warmup.list_schema_urls", return_value=(1, ["/c{0}/_schema".format(i) for i in range(5)])):
+            with patch("brainiak.warmup.greenlet_fetch", side_effect=self.fake_fetch):
+                progress = self._run(lambda: warmup.warm_up("http://localhost:5100", concurrency=2))
+        self.assertEqual(len(self.requested), 5)
+        self.assertEqual(self.in_flight["max"], 2)
+        self.assertEqual((progress["graphs"], progress["classes"], progress["done"], progress["failed"]), (1, 5, 5, 0))
+
+    @patch("brainiak.warmup.log.logger")
+    def test_failed_schemas_are_counted(self, logger):
+        with patch("brainiak.warmup.greenlet_fetch", side_effect=self.fake_fetch):
+            progress = self._run(lambda: warmup.warm_up("http://localhost:5100", concurrency=4))
+        self.assertEqual((progress["classes"], progress["done"], progress["failed"]), (2, 2, 1))
+        self.assertTrue(logger.error.called)
+
+    @patch("brainiak.warmup.warm_up")
+    @patch("brainiak.warmup.cache.acquire_lease", return_value=False)
+    def test_warm_up_once_is_skipped_while_another_process_warms_up(self, acquire_lease, warm_up):
+        warmup.warm_up_once("http://localhost:5100")
+        self.assertFalse(warm_up.called)
+
+    @patch("brainiak.warmup.cache.release_lease")
+    @patch("brainiak.warmup.warm_up")
+    @patch("brainiak.warmup.cache.acquire_lease", return_value="token")
+    def test_warm_up_once_releases_the_lease(self, acquire_lease, warm_up, release_lease):
+        warmup.warm_up_once("http://localhost:5100", 2)
+        acquire_lease.assert_called_once_with(warmup.WARMUP_LEASE, warmup.WARMUP_LEASE_TIME_IN_SECS)
+        self.assertEqual(warm_up.call_args[0][:2], ("http://localhost:5100", 2))
+        release_lease.assert_called_once_with(warmup.WARMUP_LEASE, "token")
+
+    @patch("brainiak.warmup.log.logger")
+    @patch("brainiak.warmup.cache.release_lease")
+    @patch("brainiak.warmup.cache.renew_lease")
+    @patch("brainiak.warmup.cache.acquire_lease", return_value="token")
+    def test_lease_is_renewed_as_schemas_are_requested(self, acquire_lease, renew_lease, release_lease, logger):
+        with patch("brainiak.warmup.list_schema_urls", return_value=(1, ["/c{0}/_schema".format(i) for i in range(3)])):
+            with patch("brainiak.warmup.greenlet_fetch", side_effect=self.fake_fetch):
+                self._run(lambda: warmup.warm_up_once("http://localhost:5100", 2))
+        self.assertEqual(renew_lease.call_count, 3)
+        renew_lease.assert_called_with(warmup.WARMUP_LEASE, "token", warmup.WARMUP_LEASE_TIME_IN_SECS)